@@ -29,6 +29,7 @@ OPEN_CONSOLE_WINDOW_ON_RUN = True
 
 DIFFICULTY_OPTIONS = [ "0-1_stars", "1-2_stars", "2-3_stars", "3-4_stars", "4-5_stars", "5_stars_plus" ]
 EXPORT_OPTIONS = [ ".osz", ".qua" ]
+MODEL_FORMAT_OPTIONS = [ "keras", "tflite", "numpy" ]
 
 GUI_VERSION = "1.4"
 TK_THEME = "clam"
@@ -209,12 +210,13 @@ class ConfigEditor:
         self.add_int_entry(self.training_frame, "Max VRAM for GPU Training (MB):", "max_vram_mb")
         self.add_spinbox(self.training_frame, "Training epochs:", "training_epochs", from_=1, to=1000)
         self.add_path_entry(self.training_frame, "Model output directory:", "model_dir")
+        self.add_file_entry(self.training_frame, "Teacher Model for Distillation (optional):", "teacher_model_path")
         # -----------------------------------
         
-        self.add_separator(self.training_frame, 8)
+        self.add_separator(self.training_frame, 9)
         
         # -------- Pipeline settings --------
-        self.add_header(self.training_frame, 9, "Pipeline settings")
+        self.add_header(self.training_frame, 10, "Pipeline settings")
         
         self.add_checkbox(self.training_frame, "Run Feature Normalizer", "run_feature_normalizer", config=self.model_config)
         self.add_checkbox(self.training_frame, "Run Sequence Splitter", "run_sequence_splitter", config=self.model_config)
@@ -227,8 +229,9 @@ class ConfigEditor:
         self.add_header(self.generation_frame, 0, "Audio settings")
         
         self.add_file_entry(self.generation_frame, "Audio File to generate Beatmap for:", "audio_file_path")
-        self.add_float_entry(self.generation_frame, "Audio BPM:", "audio_bpm", config=self.generation_config)
-        self.add_int_entry(self.generation_frame, "Audio Start Time (ms):", "audio_start_ms", config=self.generation_config)
+        # String entries, so "auto" can be entered to estimate the BPM / offset.
+        self.add_str_entry(self.generation_frame, "Audio BPM (or auto):", "audio_bpm", config=self.generation_config)
+        self.add_str_entry(self.generation_frame, "Audio Start Time (ms) (or auto):", "audio_start_ms", config=self.generation_config)
         # --------------------------------
 
         self.add_separator(self.generation_frame, 4)
@@ -239,23 +242,24 @@ class ConfigEditor:
         self.add_path_entry(self.generation_frame, "Generation Output Folder:", "generation_dir")
         self.add_str_entry(self.generation_frame, "Beatmap File Name:", "generation_file_name", config=self.paths_config)
         self.add_file_entry(self.generation_frame, "Model to use for Generation:", "model_for_generation_path")
+        self.add_dropdown(self.generation_frame, "Model Format:", "model_format", MODEL_FORMAT_OPTIONS, config=self.generation_config)
         self.add_float_entry(self.generation_frame, "Model Prediction Threshold:", "prediction_threshold")
         # -------------------------------------
         
-        self.add_separator(self.generation_frame, 10)
+        self.add_separator(self.generation_frame, 11)
         
         # -------- Fallback settings --------
-        self.add_header(self.generation_frame, 11, "Fallback Visualizer settings")
+        self.add_header(self.generation_frame, 12, "Fallback Visualizer settings")
         
 
         self.add_file_entry(self.generation_frame, "Visualizer Beatmap (.osu) File:", "visualizer_beatmap_path")
         self.add_file_entry(self.generation_frame, "Visualizer Audio File:", "visualizer_audio_path")
         # -----------------------------------
         
-        self.add_separator(self.generation_frame, 14)
+        self.add_separator(self.generation_frame, 15)
         
         # -------- Pipeline settings --------
-        self.add_header(self.generation_frame, 15, "Pipeline settings")
+        self.add_header(self.generation_frame, 16, "Pipeline settings")
         
         self.add_checkbox(self.generation_frame, "Run Level Generator", "run_level_generator", config=self.generation_config)
         self.run_visualizer_var = self.add_checkbox(self.generation_frame, "Run Visualizer After Generation", "run_visualizer", config=self.generation_config)
@@ -74,7 +74,7 @@ def main():
 
     # Step 5: Train model
     if run_model_trainer:
-        run_step([
+        trainer_cmd = [
             "python", "-m", "src.model.modelTrainer",
             "--difficulty_range", str(config_model["difficulty_range"]),
             "--max_vram_mb", str(config_model["max_vram_mb"]),
@@ -82,12 +82,54 @@ def main():
             "--sequence_length", str(config_model["sequence_length"]),
             "--output_dir", config_paths["model_dir"],
             "--epochs", str(config_model["training_epochs"])
-        ], "Train Model")
+        ]
+        
+        if config_model.get("unidirectional_model", False):
+            trainer_cmd.append("--unidirectional")
+        
+        if config_model.get("fast_training", False):
+            trainer_cmd.append("--fast")
+        
+        if config_model.get("profile_training", False):
+            trainer_cmd.append("--profile")
+        
+        trainer_cmd += [
+            "--intra_op_threads", str(config_model.get("intra_op_threads", 0)),
+            "--inter_op_threads", str(config_model.get("inter_op_threads", 0)),
+            "--keep_checkpoints", str(config_model.get("keep_checkpoints", 3)),
+            "--note_sampling_alpha", str(config_model.get("note_sampling_alpha", 0.0)),
+            "--sampling_anneal_epochs", str(config_model.get("sampling_anneal_epochs", 10)),
+            "--target_val_loss", str(config_model.get("target_val_loss", 0.0)),
+            "--lane_mirror_prob", str(config_model.get("lane_mirror_prob", 0.0)),
+            "--lane_permute_prob", str(config_model.get("lane_permute_prob", 0.0)),
+            "--feature_noise_std", str(config_model.get("feature_noise_std", 0.0)),
+            "--rms_gain_db", str(config_model.get("rms_gain_db", 0.0))
+        ]
+        
+        # Train a small student model on the outputs of a teacher model (optional).
+        if config_paths.get("teacher_model_path", ""):
+            trainer_cmd += [
+                "--teacher_model_path", config_paths["teacher_model_path"],
+                "--student_lstm_units", str(config_model.get("student_lstm_units", "64,32")),
+                "--student_dense_units", str(config_model.get("student_dense_units", 32)),
+                "--distill_alpha", str(config_model.get("distill_alpha", 1.0))
+            ]
+        
+        # Train data-parallel with several workers on this host (optional).
+        num_training_workers = config_model.get("num_training_workers", 1)
+        
+        if num_training_workers > 1:
+            trainer_cmd = [
+                "python", "-m", "src.model.distributedLauncher",
+                "--num_workers", str(num_training_workers)
+            ] + trainer_cmd[3:]
+        
+        run_step(trainer_cmd, "Train Model")
 
     # Step 6: Generate level
     if run_level_generator:
-        run_step([
-            "python", "src/model/levelGenerator.py",
+        generator_cmd = [
+            "python", "-m", "src.model.levelGenerator",
             "--audio_bpm", str(config_generation["audio_bpm"]),
             "--audio_start_ms", str(config_generation["audio_start_ms"]),
             "--note_precision", str(config_model["note_precision"]),
@@ -95,9 +137,34 @@ def main():
             "--sequence_length", str(config_model["sequence_length"]),
             "--audio_file_path", config_paths["audio_file_path"],
             "--model_path", config_paths["model_for_generation_path"],
+            "--model_format", str(config_generation.get("model_format", "keras")),
+            "--window_hop", str(config_generation.get("window_hop", 0)),
+            "--inference_batch_size", str(config_generation.get("inference_batch_size", 256)),
+            "--post_processor", str(config_generation.get("post_processor", "greedy")),
+            "--jack_penalty", str(config_generation.get("jack_penalty", 1.0)),
+            "--chord_penalty", str(config_generation.get("chord_penalty", 0.5)),
+            "--max_chord_size", str(config_generation.get("max_chord_size", 2)),
+            "--target_density", str(config_generation.get("target_density", 0.0)),
+            "--feature_cache_size_mb", str(config_generation.get("feature_cache_size_mb", 1024)),
+            "--silence_gate_db", str(config_generation.get("silence_gate_db", 0)),
             "--output_dir", config_paths["generation_dir"],
             "--file_name", config_paths["generation_file_name"]
-        ], "Generate Level")
+        ]
+        
+        if config_generation.get("streaming_generation", False):
+            generator_cmd.append("--streaming")
+        
+        if config_generation.get("reuse_predictions", False):
+            generator_cmd.append("--reuse_predictions")
+        
+        # Generate one level per post-processing profile from a single inference pass (optional).
+        if config_generation.get("variant_profiles", []):
+            generator_cmd += [ "--variant_profiles", json.dumps(config_generation["variant_profiles"]) ]
+            
+            if config_generation.get("export_variants", False):
+                generator_cmd.append("--export_variants")
+        
+        run_step(generator_cmd, "Generate Level")
 
     # Step 7: Run visualizer if enabled
     if config_generation.get("run_visualizer", False):
@@ -105,7 +172,13 @@ def main():
         audio_path = config_paths["visualizer_audio_path"]
         
         if config_generation.get("visualizer_use_last_gen", True):
-            beatmap_path = os.path.join(config_paths["generation_dir"], f"{config_paths['generation_file_name']}.gblf")
+            file_name = config_paths["generation_file_name"]
+            
+            # With variant profiles, only "<generation_file_name>_<name>.gblf"-files are generated, the first one is shown.
+            if config_generation.get("variant_profiles", []):
+                file_name += f"_{config_generation['variant_profiles'][0]['name']}"
+            
+            beatmap_path = os.path.join(config_paths["generation_dir"], f"{file_name}.gblf")
             audio_path = config_paths["audio_file_path"]
         
         run_step([
@@ -4,64 +4,293 @@ import glob
 import os
 
 
-def npy_file_generator(file_pattern : str):
+class SequenceStream:
     """
-    Generator that yields batches from each .npy-file
-    matching the pattern file_pattern.
+    Endless, shuffled stream over the sequences of one shard of .npy-files (optionally with their cached soft targets).
+
+    Every pass over the shard splits it into blocks of block_size consecutive sequences (or crops), reads the blocks in a
+    random order and yields the sequences of every block in a random order. Both orders only depend on the seed and the
+    index of the pass, so the stream is a function of the seed and the position alone: a stream started at the number
+    of sequences a training run consumed continues exactly where the run stopped (unlike a tf.data shuffle buffer,
+    whose contents are lost).
+    With several shards, every num_shards-th sequence (across all files) belongs to a shard; other shards are never read.
+    """
+    def __init__(self, file_pattern : str, num_shards : int = 1, shard_index : int = 0, soft_targets_dir : str = None, crop_length : int = 0, block_size : int = 10000, seed : int = None):
+        """
+        Args:
+            file_pattern (str): _The file pattern to check for .npy-files._
+            num_shards (int, optional): _The number of shards (e.g. training workers) the sequences are split into._ Defaults to 1.
+            shard_index (int, optional): _The shard to yield; every num_shards-th sequence (across all files) belongs to it._ Defaults to 0.
+            soft_targets_dir (str, optional): _The directory containing one soft target .npy-file (with the same file name)
+                for every sequence file. If set, (sequence, soft target) pairs are yielded._ Defaults to None.
+            crop_length (int, optional): _If set, every stored sequence is split into consecutive sequences of this length
+                (the remainder is dropped)._ Defaults to 0 (stored length).
+            block_size (int, optional): _The number of consecutive sequences that are shuffled together._ Defaults to 10000.
+            seed (int, optional): _Seed of the shuffle order._ Defaults to None (random).
+        """
+        files = sorted(glob.glob(file_pattern))
+        
+        if not files:
+            raise FileNotFoundError(f"No sequences found matching {file_pattern}.")
+        
+        self.views = []
+        self.soft_target_views = []
+        global_offset = 0
+        
+        for fname in files:
+            arr = np.load(fname, mmap_mode='r')
+            
+            # Strided view on the memory map, so other shards are never read.
+            first_idx = (shard_index - global_offset) % num_shards
+            global_offset += len(arr)
+            self.views.append(arr[first_idx::num_shards])
+            
+            if soft_targets_dir is not None:
+                soft_targets = np.load(os.path.join(soft_targets_dir, os.path.basename(fname)), mmap_mode='r')
+                self.soft_target_views.append(soft_targets[first_idx::num_shards])
+        
+        self.view_ends = np.cumsum([ len(view) for view in self.views ])
+        self.with_soft_targets = soft_targets_dir is not None
+        
+        stored_length = self.views[0].shape[1]
+        
+        if crop_length > stored_length:
+            raise ValueError(f"Cannot crop sequences of length {stored_length} to the longer length {crop_length}.")
+        
+        self.crop_length = crop_length if crop_length > 0 else stored_length
+        self.crops_per_sequence = stored_length // self.crop_length
+        self.num_elements = int(self.view_ends[-1]) * self.crops_per_sequence
+        
+        if self.num_elements == 0:
+            raise FileNotFoundError(f"No sequences of shard {shard_index} found matching {file_pattern}.")
+        
+        self.block_size = block_size
+        self.num_blocks = -(-self.num_elements // block_size)
+        self.seed = seed if seed is not None else np.random.SeedSequence().entropy
+
+
+    def get_element_spec(self):
+        sequence_shape = (self.crop_length,) + tuple(self.views[0].shape[2:])
+        spec = tf.TensorSpec(shape=sequence_shape, dtype=self.views[0].dtype)
+        
+        if not self.with_soft_targets:
+            return spec
+        
+        soft_target_shape = (self.crop_length,) + tuple(self.soft_target_views[0].shape[2:])
+        
+        return (spec, tf.TensorSpec(shape=soft_target_shape, dtype=self.soft_target_views[0].dtype))
+
+
+    def read_sequences(self, views : list, start : int, stop : int) -> np.ndarray:
+        # Read the sequences [start, stop) of the shard, which can span several files.
+        parts = []
+        view_idx = int(np.searchsorted(self.view_ends, start, side="right"))
+        
+        while start < stop:
+            view_start = self.view_ends[view_idx - 1] if view_idx > 0 else 0
+            end = min(stop, self.view_ends[view_idx])
+            parts.append(np.asarray(views[view_idx][start - view_start:end - view_start]))
+            start = end
+            view_idx += 1
+        
+        return np.concatenate(parts)
+
+
+    def read_block(self, views : list, block_idx : int) -> np.ndarray:
+        first_element = block_idx * self.block_size
+        last_element = min(first_element + self.block_size, self.num_elements)
+        
+        # Read the (few) whole sequences that contain the crops of the block.
+        first_sequence = first_element // self.crops_per_sequence
+        last_sequence = -(-last_element // self.crops_per_sequence)
+        sequences = self.read_sequences(views, first_sequence, last_sequence)
+        
+        crops = sequences[:, :self.crops_per_sequence * self.crop_length]
+        crops = crops.reshape((-1, self.crop_length) + crops.shape[2:])
+        first_crop = first_element - first_sequence * self.crops_per_sequence
+        
+        return crops[first_crop:first_crop + last_element - first_element]
+
+
+    def generator(self, start_position : int = 0):
+        """
+        Yield the stream from a position on.
+
+        Args:
+            start_position (int, optional): _The number of sequences (of all passes) to skip, e.g. the loader cursor
+                of a resumed training run._ Defaults to 0.
+
+        Yields:
+            _type_: _Sequence data (and its soft targets)._
+        """
+        pass_idx, offset = divmod(start_position, self.num_elements)
+        
+        while True:
+            block_order = np.random.default_rng([self.seed, pass_idx]).permutation(self.num_blocks)
+            
+            for block_idx in block_order:
+                block_length = min(self.block_size, self.num_elements - block_idx * self.block_size)
+                
+                # Skip whole blocks until the position is reached, they are never read.
+                if offset >= block_length:
+                    offset -= block_length
+                    continue
+                
+                order = np.random.default_rng([self.seed, pass_idx, block_idx]).permutation(block_length)[offset:]
+                offset = 0
+                
+                if not self.with_soft_targets:
+                    block = self.read_block(self.views, block_idx)
+                    
+                    for idx in order:
+                        yield block[idx]
+                else:
+                    block = self.read_block(self.views, block_idx)
+                    soft_targets = self.read_block(self.soft_target_views, block_idx)
+                    
+                    for idx in order:
+                        yield block[idx], soft_targets[idx]
+            
+            pass_idx += 1
+
+
+def get_sequence_file_pattern(sequences_root : str, difficulty : str, split : str = "train") -> str:
+    """
+    Return the file pattern of the sequence shards of a difficulty and split.
 
     Args:
-        file_pattern (str): _The file pattern to check for .npy-files._
+        sequences_root (str): _Root directory where difficulty folders are stored._
+        difficulty (str): _Difficulty label (e.g. "3-4_stars")._
+        split (str, optional): _Which split ("train" or "test")._ Defaults to "train".
+
+    Returns:
+        str: _The glob pattern of the .npy-files._
+    """
+    return os.path.join(sequences_root, difficulty, split, f"{difficulty}_{split}_sequences_*.npy")
+
 
-    Yields:
-        _type_: _Sequence data from a .npy-file._
+def get_augmentation_fn(rms_mean : float, rms_std : float, lane_mirror_prob : float = 0.0, lane_permute_prob : float = 0.0, feature_noise_std : float = 0.0, rms_gain_db : float = 0.0, num_features : int = 7, seed : int = 0):
     """
-    # Get all .npy-files that match the given pattern.
-    files = sorted(glob.glob(file_pattern))
+    Create a batched augmentation function for the tf.data pipeline (applied after batching).
+    All augmentations are drawn per sequence and run as graph operations, nothing is written to disk.
+    The random values of a batch only depend on the seed and the index of the batch (stateless random ops),
+    so a resumed training run augments its batches like an uninterrupted run.
+
+    Args:
+        rms_mean (float): _The mean of the RMS feature (normalization stats)._
+        rms_std (float): _The standard deviation of the RMS feature (normalization stats)._
+        lane_mirror_prob (float, optional): _Probability that the lanes of a sequence are mirrored._ Defaults to 0.0.
+        lane_permute_prob (float, optional): _Probability that the lanes of a sequence are randomly permuted
+            (instead of mirrored)._ Defaults to 0.0.
+        feature_noise_std (float, optional): _Standard deviation of the Gaussian noise added to the normalized features._ Defaults to 0.0.
+        rms_gain_db (float, optional): _Maximum gain in dB (uniform in [-rms_gain_db, rms_gain_db]) applied to the
+            unnormalized RMS of a sequence._ Defaults to 0.0.
+        num_features (int, optional): _The number of feature columns before the lane columns._ Defaults to 7.
+        seed (int, optional): _Seed of the augmentation._ Defaults to 0.
+
+    Returns:
+        _type_: _Function that maps the index of a batch and the batch (B, T, features + lanes), optionally followed by
+            target batches (B, T, lanes) such as teacher soft targets whose lanes are permuted the same way._
+    """
+    rms_col = num_features - 1
     
-    # Load all files.
-    for fname in files:
-        # print(f"Loading {fname} ...")
+    def augment(batch_idx, batch, *lane_targets):
+        seeds = tf.random.experimental.stateless_split(tf.stack([ tf.constant(seed, tf.int64), tf.cast(batch_idx, tf.int64) ]), num=4)
+        batch_size = tf.shape(batch)[0]
+        features = batch[:, :, :num_features]
+        lanes = batch[:, :, num_features:]
+        num_lanes = lanes.shape[-1]
         
-        arr = np.load(fname, mmap_mode='r')
+        # -------- Lane permutation --------
+        # Every sequence gets its own lane order: identity, mirrored or random.
+        identity = tf.tile(tf.range(num_lanes)[tf.newaxis], [batch_size, 1])
+        mirrored = tf.reverse(identity, axis=[1])
+        random_order = tf.argsort(tf.random.stateless_uniform([batch_size, num_lanes], seed=seeds[0]), axis=1)
         
-        for seq in arr:
-            yield seq
+        choice = tf.random.stateless_uniform([batch_size, 1], seed=seeds[1])
+        lane_order = tf.where(choice < lane_permute_prob, random_order,
+                              tf.where(choice < lane_permute_prob + lane_mirror_prob, mirrored, identity))
+        
+        def permute_lanes(targets):
+            return tf.gather(targets, lane_order, axis=2, batch_dims=1)
+        # ----------------------------------
+        
+        # -------- Feature augmentation --------
+        if rms_gain_db > 0:
+            # Scale the unnormalized RMS and normalize it again.
+            gain = tf.pow(10.0, tf.random.stateless_uniform([batch_size, 1], seed=seeds[2], minval=-rms_gain_db, maxval=rms_gain_db) / 20.0)
+            rms = features[:, :, rms_col] * (rms_std + 1e-6) + rms_mean
+            rms = (rms * tf.cast(gain, rms.dtype) - rms_mean) / (rms_std + 1e-6)
+            features = tf.concat([ features[:, :, :rms_col], rms[:, :, tf.newaxis], features[:, :, rms_col + 1:] ], axis=-1)
+        
+        if feature_noise_std > 0:
+            features = features + tf.random.stateless_normal(tf.shape(features), seed=seeds[3], stddev=feature_noise_std, dtype=features.dtype)
+        # --------------------------------------
+        
+        batch = tf.concat([ features, permute_lanes(lanes) ], axis=-1)
+        
+        if not lane_targets:
+            return batch
+        
+        return (batch,) + tuple(permute_lanes(targets) for targets in lane_targets)
+    
+    return augment
 
 
-def get_tf_dataset(file_pattern : str, batch_size : int = 64, shuffle_buffer : int = 10000) -> tf.data.Dataset:
+def get_tf_dataset(file_pattern : str, batch_size : int = 64, shuffle_buffer : int = 10000, num_shards : int = 1, shard_index : int = 0, start_offset : int = 0, seed : int = None, pipeline_probe = None, crop_length : int = 0, augment = None) -> tf.data.Dataset:
     """
-    Create a tf.data.Dataset from chunked .npy files.
+    Create an endless tf.data.Dataset from chunked .npy files (see SequenceStream).
 
     Args:
         file_pattern (str): _The file pattern to check for .npy-files._
         batch_size (int, optional): _The batch size of the loaded sequences._ Defaults to 64.
-        shuffle_buffer (int, optional): _The number of elements from which
-            the new batch will be randomly sampled when shuffling the dataset._ Defaults to 10000.
+        shuffle_buffer (int, optional): _The number of consecutive sequences that are shuffled together._ Defaults to 10000.
+        num_shards (int, optional): _The number of shards (e.g. training workers) the sequences are split into._ Defaults to 1.
+        shard_index (int, optional): _The shard of this dataset._ Defaults to 0.
+        start_offset (int, optional): _The number of sequences to skip (loader cursor of a resumed training run,
+            counted over all passes)._ Defaults to 0.
+        seed (int, optional): _Seed of the shuffle order._ Defaults to None (random).
+        pipeline_probe (optional): _Object with the methods probe_produced and probe_consumed that instrument
+            the dataset before and after prefetching (e.g. a StepTimeProfiler)._ Defaults to None.
+        crop_length (int, optional): _If set, every stored sequence is split into consecutive sequences of this length
+            (the remainder is dropped), so shorter sequence lengths can be trained on the same shards._ Defaults to 0 (stored length).
+        augment (optional): _Batched augmentation function (see get_augmentation_fn)._ Defaults to None.
 
     Returns:
         tf.data.Dataset: _A dataset created from chunks of .npy-files._
     """
-    # Infer shape and dtype from the first file.
-    first_file = sorted(glob.glob(file_pattern))[0]
-    sample = np.load(first_file, mmap_mode='r')[0]
+    stream = SequenceStream(file_pattern, num_shards=num_shards, shard_index=shard_index, crop_length=crop_length, block_size=shuffle_buffer, seed=seed)
     
-    output_shape = sample.shape
-    output_dtype = sample.dtype
-
+    # The stream is shuffled and endless itself, so neither shuffle() nor repeat() is needed.
     ds = tf.data.Dataset.from_generator(
-        lambda: npy_file_generator(file_pattern),
-        output_signature=tf.TensorSpec(shape=output_shape, dtype=output_dtype)
+        lambda: stream.generator(start_offset),
+        output_signature=stream.get_element_spec()
     )
-    
-    ds = ds.shuffle(shuffle_buffer)
     ds = ds.batch(batch_size)
-    ds = ds.repeat() # Repeat dataset so training does not get interrupted.
+    
+    if augment is not None:
+        # The batches are numbered from the cursor on, so a resumed run draws the same augmentations.
+        ds = ds.enumerate(start=start_offset // batch_size)
+        ds = ds.map(augment, num_parallel_calls=tf.data.AUTOTUNE)
+    
+    if pipeline_probe is not None:
+        ds = pipeline_probe.probe_produced(ds)
+    
     ds = ds.prefetch(tf.data.AUTOTUNE)
     
+    if pipeline_probe is not None:
+        ds = pipeline_probe.probe_consumed(ds)
+    
+    if num_shards > 1:
+        # The data is already sharded by the generator, tf.distribute must not shard it again.
+        options = tf.data.Options()
+        options.experimental_distribute.auto_shard_policy = tf.data.experimental.AutoShardPolicy.OFF
+        ds = ds.with_options(options)
+    
     return ds
 
 
-def get_difficulty_dataset(sequences_root : str, difficulty : str, split : str = "train", batch_size : int = 64, shuffle_buffer : int = 10000) ->tf.data.Dataset:
+def get_difficulty_dataset(sequences_root : str, difficulty : str, split : str = "train", batch_size : int = 64, shuffle_buffer : int = 10000, num_shards : int = 1, shard_index : int = 0, start_offset : int = 0, seed : int = None, pipeline_probe = None, crop_length : int = 0, augment = None) ->tf.data.Dataset:
     """
     Load a tf.data.Dataset for a specific difficulty and split.
 
@@ -70,10 +299,270 @@ def get_difficulty_dataset(sequences_root : str, difficulty : str, split : str =
         difficulty (str): _Difficulty label (e.g. "Insane", "Easy", etc.)._
         split (str, optional): _Which split to load ("train" or "test")._ Defaults to "train".
         batch_size (int, optional): _Batch size._ Defaults to 64.
-        shuffle_buffer (int, optional): _Shuffle buffer size._ Defaults to 10000.
+        shuffle_buffer (int, optional): _The number of consecutive sequences that are shuffled together._ Defaults to 10000.
+        num_shards (int, optional): _The number of shards (e.g. training workers) the sequences are split into._ Defaults to 1.
+        shard_index (int, optional): _The shard of this dataset._ Defaults to 0.
+        start_offset (int, optional): _The number of sequences to skip (loader cursor, counted over all passes)._ Defaults to 0.
+        seed (int, optional): _Seed of the shuffle order._ Defaults to None (random).
+        pipeline_probe (optional): _Object with the methods probe_produced and probe_consumed that instrument
+            the dataset before and after prefetching (e.g. a StepTimeProfiler)._ Defaults to None.
+        crop_length (int, optional): _Split the stored sequences into sequences of this length._ Defaults to 0 (stored length).
+        augment (optional): _Batched augmentation function (see get_augmentation_fn)._ Defaults to None.
 
     Returns:
         tf.data.Dataset: _A dataset for the specified difficulty and split._
     """
-    pattern = os.path.join(sequences_root, difficulty, split, f"{difficulty}_{split}_sequences_*.npy")
-    return get_tf_dataset(pattern, batch_size=batch_size, shuffle_buffer=shuffle_buffer)
+    pattern = get_sequence_file_pattern(sequences_root, difficulty, split)
+    return get_tf_dataset(pattern, batch_size=batch_size, shuffle_buffer=shuffle_buffer, num_shards=num_shards, shard_index=shard_index, start_offset=start_offset, seed=seed, pipeline_probe=pipeline_probe, crop_length=crop_length, augment=augment)
+
+
+def get_distillation_dataset(sequences_root : str, soft_targets_root : str, difficulty : str, split : str = "train", batch_size : int = 64, shuffle_buffer : int = 10000, start_offset : int = 0, seed : int = None, pipeline_probe = None, augment = None) -> tf.data.Dataset:
+    """
+    Load a tf.data.Dataset of (sequence, soft target) pairs for a specific difficulty and split.
+    The soft targets are the cached per-lane sigmoid outputs of a teacher model.
+
+    Args:
+        sequences_root (str): _Root directory where difficulty folders are stored._
+        soft_targets_root (str): _Root directory where the cached teacher predictions are stored._
+        difficulty (str): _Difficulty label (e.g. "3-4_stars")._
+        split (str, optional): _Which split to load ("train" or "test")._ Defaults to "train".
+        batch_size (int, optional): _Batch size._ Defaults to 64.
+        shuffle_buffer (int, optional): _The number of consecutive sequences that are shuffled together._ Defaults to 10000.
+        start_offset (int, optional): _The number of sequences to skip (loader cursor, counted over all passes)._ Defaults to 0.
+        seed (int, optional): _Seed of the shuffle order._ Defaults to None (random).
+        pipeline_probe (optional): _Object with the methods probe_produced and probe_consumed that instrument
+            the dataset before and after prefetching (e.g. a StepTimeProfiler)._ Defaults to None.
+        augment (optional): _Batched augmentation function (see get_augmentation_fn),
+            the lanes of the soft targets are permuted like the lane columns._ Defaults to None.
+
+    Returns:
+        tf.data.Dataset: _A dataset of (sequence, soft target) batches._
+    """
+    stream = SequenceStream(
+        get_sequence_file_pattern(sequences_root, difficulty, split),
+        soft_targets_dir=os.path.join(soft_targets_root, difficulty, split),
+        block_size=shuffle_buffer,
+        seed=seed
+    )
+    
+    ds = tf.data.Dataset.from_generator(
+        lambda: stream.generator(start_offset),
+        output_signature=stream.get_element_spec()
+    )
+    ds = ds.batch(batch_size)
+    
+    if augment is not None:
+        ds = ds.enumerate(start=start_offset // batch_size)
+        ds = ds.map(lambda batch_idx, pair: augment(batch_idx, *pair), num_parallel_calls=tf.data.AUTOTUNE)
+    
+    if pipeline_probe is not None:
+        ds = pipeline_probe.probe_produced(ds)
+    
+    ds = ds.prefetch(tf.data.AUTOTUNE)
+    
+    if pipeline_probe is not None:
+        ds = pipeline_probe.probe_consumed(ds)
+    
+    return ds
+
+
+def load_window_note_counts(file_pattern : str, num_features : int = 7) -> list:
+    """
+    Load the number of notes of every sequence (window) in all .npy-files matching file_pattern.
+    The counts are computed once per shard and cached in a note_counts directory next to the shards.
+
+    Args:
+        file_pattern (str): _The file pattern to check for .npy-files._
+        num_features (int, optional): _The number of feature columns before the lane columns._ Defaults to 7.
+
+    Returns:
+        list: _One array of note counts per shard file (in sorted file order)._
+    """
+    note_counts = []
+    
+    for fname in sorted(glob.glob(file_pattern)):
+        cache_dir = os.path.join(os.path.dirname(fname), "note_counts")
+        cache_path = os.path.join(cache_dir, os.path.basename(fname))
+        
+        if os.path.exists(cache_path) and os.path.getmtime(cache_path) >= os.path.getmtime(fname):
+            note_counts.append(np.load(cache_path))
+            continue
+        
+        arr = np.load(fname, mmap_mode='r')
+        counts = np.zeros(len(arr), dtype=np.int32)
+        
+        # Count in chunks, so large shards do not have to fit into memory at once.
+        for start in range(0, len(arr), 4096):
+            counts[start:start + 4096] = np.asarray(arr[start:start + 4096, :, num_features:]).sum(axis=(1, 2))
+        
+        os.makedirs(cache_dir, exist_ok=True)
+        np.save(cache_path, counts)
+        note_counts.append(counts)
+    
+    return note_counts
+
+
+class NoteWeightedSampler:
+    """
+    Sample training sequences (with replacement) with probabilities proportional to (note count + 1)^alpha.
+    alpha = 0 samples uniformly, larger values prefer note-rich sequences over sparse or empty ones.
+    alpha can be annealed linearly to 0 over several epochs (see SamplingScheduleCallback).
+
+    The draws of every chunk only depend on the seed, the epoch and the index of the chunk within the epoch,
+    so a sampler started at the number of sequences a training run consumed continues exactly where the run stopped.
+    With several shards, only the sequences of this shard are drawn (sharded like in SequenceStream).
+    """
+    def __init__(self, file_pattern : str, alpha : float = 1.0, seed : int = None, draws_per_chunk : int = 1024, anneal_epochs : int = None, sequences_per_epoch : int = 0, num_shards : int = 1, shard_index : int = 0):
+        """
+        Args:
+            file_pattern (str): _The file pattern to check for .npy-files._
+            alpha (float, optional): _The initial sampling exponent._ Defaults to 1.0.
+            seed (int, optional): _Seed of the sampling._ Defaults to None (random).
+            draws_per_chunk (int, optional): _How many sequences are drawn at once._ Defaults to 1024.
+            anneal_epochs (int, optional): _The number of epochs over which alpha decreases to 0 (0 = uniform from the start)._ Defaults to None (constant alpha).
+            sequences_per_epoch (int, optional): _The number of sequences the model trains on per epoch._ Defaults to 0 (one endless epoch).
+            num_shards (int, optional): _The number of shards (e.g. training workers) the sequences are split into._ Defaults to 1.
+            shard_index (int, optional): _The shard to draw from; every num_shards-th sequence (across all files) belongs to it._ Defaults to 0.
+        """
+        self.shards = [ np.load(fname, mmap_mode='r') for fname in sorted(glob.glob(file_pattern)) ]
+        
+        if not self.shards:
+            raise FileNotFoundError(f"No sequences found matching {file_pattern}.")
+        
+        # Global indices of the sequences of this shard, the probabilities are computed over them only.
+        note_counts = np.concatenate(load_window_note_counts(file_pattern))
+        self.sequence_idxs = np.arange(shard_index, len(note_counts), num_shards)
+        
+        if len(self.sequence_idxs) == 0:
+            raise FileNotFoundError(f"No sequences of shard {shard_index} found matching {file_pattern}.")
+        
+        self.note_counts = note_counts[self.sequence_idxs]
+        self.shard_ends = np.cumsum([ len(shard) for shard in self.shards ])
+        self.seed = seed if seed is not None else np.random.SeedSequence().entropy
+        self.draws_per_chunk = draws_per_chunk
+        self.alpha_start = alpha
+        self.anneal_epochs = anneal_epochs
+        self.sequences_per_epoch = sequences_per_epoch
+        self.probabilities = {}
+
+
+    def get_alpha(self, epoch : int) -> float:
+        if self.anneal_epochs is None:
+            return self.alpha_start
+        
+        progress = min(epoch / self.anneal_epochs, 1.0) if self.anneal_epochs > 0 else 1.0
+        
+        return self.alpha_start * (1.0 - progress)
+
+
+    def get_probabilities(self, alpha : float) -> np.ndarray:
+        # Only the probabilities of the current alpha are kept.
+        if alpha not in self.probabilities:
+            weights = (self.note_counts + 1.0) ** alpha
+            self.probabilities = { alpha: weights / weights.sum() }
+        
+        return self.probabilities[alpha]
+
+
+    def expected_notes_per_sequence(self, epoch : int) -> float:
+        return float(np.dot(self.get_probabilities(self.get_alpha(epoch)), self.note_counts))
+
+
+    def generator(self, start_position : int = 0):
+        """
+        Yield the drawn sequences from a position on.
+
+        Args:
+            start_position (int, optional): _The number of sequences to skip (loader cursor of a resumed training run)._ Defaults to 0.
+
+        Yields:
+            _type_: _Sequence data._
+        """
+        epoch, position = divmod(start_position, self.sequences_per_epoch) if self.sequences_per_epoch > 0 else (0, start_position)
+        chunk_idx, offset = divmod(position, self.draws_per_chunk)
+        
+        while True:
+            # The last chunk of an epoch is shorter, so every epoch is drawn with its own alpha.
+            num_draws = self.draws_per_chunk
+            
+            if self.sequences_per_epoch > 0:
+                num_draws = min(num_draws, self.sequences_per_epoch - chunk_idx * self.draws_per_chunk)
+            
+            rng = np.random.default_rng([self.seed, epoch, chunk_idx])
+            idxs = self.sequence_idxs[rng.choice(len(self.note_counts), size=num_draws, p=self.get_probabilities(self.get_alpha(epoch)))[offset:]]
+            shard_idxs = np.searchsorted(self.shard_ends, idxs, side="right")
+            offset = 0
+            
+            for idx, shard_idx in zip(idxs, shard_idxs):
+                first_idx = self.shard_ends[shard_idx - 1] if shard_idx > 0 else 0
+                yield self.shards[shard_idx][idx - first_idx]
+            
+            chunk_idx += 1
+            
+            if self.sequences_per_epoch > 0 and chunk_idx * self.draws_per_chunk >= self.sequences_per_epoch:
+                epoch += 1
+                chunk_idx = 0
+
+
+def get_note_weighted_dataset(sequences_root : str, difficulty : str, split : str = "train", batch_size : int = 64, alpha : float = 1.0, seed : int = None, anneal_epochs : int = None, sequences_per_epoch : int = 0, num_shards : int = 1, shard_index : int = 0, start_offset : int = 0, pipeline_probe = None, augment = None) -> tuple:
+    """
+    Load a tf.data.Dataset for a specific difficulty and split whose sequences are drawn by a NoteWeightedSampler.
+
+    Args:
+        sequences_root (str): _Root directory where difficulty folders are stored._
+        difficulty (str): _Difficulty label (e.g. "3-4_stars")._
+        split (str, optional): _Which split to load ("train" or "test")._ Defaults to "train".
+        batch_size (int, optional): _Batch size (the global batch size in multi-worker training)._ Defaults to 64.
+        alpha (float, optional): _The initial sampling exponent of the sampler._ Defaults to 1.0.
+        seed (int, optional): _Seed of the sampling._ Defaults to None (random).
+        anneal_epochs (int, optional): _The number of epochs over which alpha decreases to 0 (0 = uniform from the start)._ Defaults to None (constant alpha).
+        sequences_per_epoch (int, optional): _The number of sequences this dataset yields per training epoch. In multi-worker training,
+            every worker only trains on its part of the global batch (steps_per_epoch * per-worker batch size)._ Defaults to 0 (one endless epoch).
+        num_shards (int, optional): _The number of shards (e.g. training workers) the sequences are split into._ Defaults to 1.
+        shard_index (int, optional): _The shard of this dataset._ Defaults to 0.
+        start_offset (int, optional): _The number of sequences to skip (loader cursor of a resumed training run)._ Defaults to 0.
+        pipeline_probe (optional): _Object with the methods probe_produced and probe_consumed that instrument
+            the dataset before and after prefetching (e.g. a StepTimeProfiler)._ Defaults to None.
+        augment (optional): _Batched augmentation function (see get_augmentation_fn)._ Defaults to None.
+
+    Returns:
+        tuple: _The (infinite) dataset and its sampler._
+    """
+    sampler = NoteWeightedSampler(
+        get_sequence_file_pattern(sequences_root, difficulty, split),
+        alpha=alpha,
+        seed=seed,
+        anneal_epochs=anneal_epochs,
+        sequences_per_epoch=sequences_per_epoch,
+        num_shards=num_shards,
+        shard_index=shard_index
+    )
+    sample = sampler.shards[0][0]
+    
+    ds = tf.data.Dataset.from_generator(
+        lambda: sampler.generator(start_offset),
+        output_signature=tf.TensorSpec(shape=sample.shape, dtype=sample.dtype)
+    )
+    
+    # The sampler draws in random order, no shuffle buffer is needed.
+    ds = ds.batch(batch_size)
+    
+    if augment is not None:
+        ds = ds.enumerate(start=start_offset // batch_size)
+        ds = ds.map(augment, num_parallel_calls=tf.data.AUTOTUNE)
+    
+    if pipeline_probe is not None:
+        ds = pipeline_probe.probe_produced(ds)
+    
+    ds = ds.prefetch(tf.data.AUTOTUNE)
+    
+    if pipeline_probe is not None:
+        ds = pipeline_probe.probe_consumed(ds)
+    
+    if num_shards > 1:
+        # The data is already sharded by the sampler, tf.distribute must not shard it again.
+        options = tf.data.Options()
+        options.experimental_distribute.auto_shard_policy = tf.data.experimental.AutoShardPolicy.OFF
+        ds = ds.with_options(options)
+    
+    return ds, sampler
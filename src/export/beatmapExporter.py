@@ -35,6 +35,58 @@ def export_to_osz(audio_file_path : str, beatmap_file_path : str, export_path :
     os.rename(f"{archive_base}.zip", os.path.join(export_path, f"{beatmap_name}.osz"))
 
 
+def export_variants_to_osz(audio_file_path : str, beatmap_file_paths : list, export_path : str, metadata : dict, difficulty_names : list = None) -> None:
+    """
+    Export several levels of the same audio (e.g. the variants of a multi-variant generation)
+    as one .osz beatmap set named "<artist> - <title>.osz".
+
+    Args:
+        audio_file_path (str): _The path to the audio file of all levels._
+        beatmap_file_paths (list): _The paths to the .gblf-files of the levels._
+        export_path (str): _The directory the .osz-file is saved to._
+        metadata (dict): _The metadata of the beatmap set (like export_to_osz, the difficulty name is set per level)._
+        difficulty_names (list, optional): _The difficulty name of every level._ Defaults to the .gblf-file names.
+    """
+    # Check validty of audio file extension.
+    if audio_file_path.split('.')[-1] not in [ "mp3", "wav", "ogg" ]:
+        raise ValueError(f"Error: Could not export beatmap to .osz. Audio file {audio_file_path} has invalid extension.")
+    
+    for beatmap_file_path in beatmap_file_paths:
+        if beatmap_file_path.split('.')[-1] != "gblf":
+            raise ValueError(f"Error: Could not export beatmap .osz. Beatmap file {beatmap_file_path} has invalid extension.")
+    
+    if difficulty_names is None:
+        difficulty_names = [ os.path.basename(path).replace(".gblf", "") for path in beatmap_file_paths ]
+    
+    if len(set(difficulty_names)) != len(beatmap_file_paths):
+        raise ValueError(f"Error: Could not export beatmap set .osz. Every level needs its own difficulty name, got {difficulty_names}.")
+    
+    set_name = f"{metadata['artist']} - {metadata['title']}"
+    audio_file_name = os.path.basename(audio_file_path)
+    
+    temp_dir = os.path.join(export_path, f"{set_name}_temp")
+    os.makedirs(temp_dir, exist_ok=True)
+    
+    # One .osu-file per level, the audio is shared.
+    for beatmap_file_path, difficulty_name in zip(beatmap_file_paths, difficulty_names):
+        create_osu_file_template(
+            audio_file_name=audio_file_name,
+            beatmap_file_path=beatmap_file_path,
+            destination_file_path=temp_dir,
+            metadata=dict(metadata, difficulty_name=difficulty_name)
+        )
+    
+    shutil.copy(audio_file_path, os.path.join(temp_dir, audio_file_name))
+    
+    archive_base = os.path.join(export_path, f"{set_name}_exported")
+    shutil.make_archive(base_name=archive_base, format='zip', root_dir=temp_dir)
+    
+    shutil.rmtree(temp_dir)
+    
+    # Rename the .zip file to .osz.
+    os.rename(f"{archive_base}.zip", os.path.join(export_path, f"{set_name}.osz"))
+
+
 def export_to_qua(audio_file_path : str, beatmap_file_path : str, export_path : str, metadata : dict) -> None:
     # Check validity of audio file extension.
     if audio_file_path.split('.')[-1] not in [ "mp3", "wav", "ogg" ]:
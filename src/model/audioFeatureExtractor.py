@@ -0,0 +1,205 @@
+import librosa
+import numpy as np
+
+from src.model.tempoEstimator import estimate_tempo
+
+
+# Column of the onset strength in the frame features (5 MFCCs, onset strength, RMS).
+ONSET_FEATURE_IDX = 5
+
+
+def decode_audio(audio_path : str) -> tuple:
+    """
+    Decode an audio file once (mono, native sample rate).
+
+    Args:
+        audio_path (str): _The path to the audio file._
+
+    Returns:
+        tuple: _The samples and the sample rate._
+    """
+    return librosa.load(audio_path, sr=None)
+
+
+def compute_subbeat_timings(duration_ms : float, audio_start_ms : float, audio_bpm : float, note_precision : int) -> np.ndarray:
+    """
+    Compute the subbeat grid of an audio of a given duration.
+
+    Args:
+        duration_ms (float): _The duration of the audio in milliseconds._
+        audio_start_ms (float): _The time in milliseconds where the first beat occurs._
+        audio_bpm (float): _The BPM of the audio._
+        note_precision (int): _The amount of subbeats per quarter note._
+
+    Returns:
+        np.ndarray: _The subbeat timings in milliseconds._
+    """
+    ms_per_beat = 60_000 / audio_bpm
+    ms_per_subbeat = ms_per_beat / note_precision
+    
+    num_subbeats = max(int((duration_ms - audio_start_ms) // ms_per_subbeat), 0)
+    
+    return audio_start_ms + np.arange(num_subbeats) * ms_per_subbeat
+
+
+def calculate_subbeat_timings(audio_path : str, audio_start_ms : float, audio_bpm : float, note_precision : int) -> list:
+    """
+    Calculate the timings of all subbeats of an audio file.
+
+    Args:
+        audio_path (str): _The path to the audio file._
+        audio_start_ms (float): _The time in milliseconds where the first beat occurs._
+        audio_bpm (float): _The BPM of the audio._
+        note_precision (int): _The amount of subbeats per quarter note._
+
+    Returns:
+        list: _The subbeat timings in milliseconds._
+    """
+    y, sr = decode_audio(audio_path)
+    duration_ms = librosa.get_duration(y=y, sr=sr) * 1000
+    
+    return compute_subbeat_timings(duration_ms, audio_start_ms, audio_bpm, note_precision).tolist()
+
+
+def compute_rms(y : np.ndarray, frame_length : int = 2048, hop_length : int = 512) -> np.ndarray:
+    """
+    Compute the RMS of every (centered, zero-padded) frame like librosa.feature.rms,
+    but with a cumulative sum of the squared samples instead of framing the signal.
+
+    Args:
+        y (np.ndarray): _The decoded samples._
+        frame_length (int, optional): _The length of a frame._ Defaults to 2048.
+        hop_length (int, optional): _The hop length of the frames._ Defaults to 512.
+
+    Returns:
+        np.ndarray: _The RMS of every frame (equal to librosa.feature.rms up to float rounding)._
+    """
+    padded = np.pad(y.astype(np.float64), frame_length // 2)
+    cumulative_power = np.concatenate([ [0.0], np.cumsum(padded ** 2) ])
+    
+    frame_starts = np.arange(1 + (len(padded) - frame_length) // hop_length) * hop_length
+    power = (cumulative_power[frame_starts + frame_length] - cumulative_power[frame_starts]) / frame_length
+    
+    return np.sqrt(np.maximum(power, 0.0)).astype(y.dtype)
+
+
+def compute_frame_features(y : np.ndarray, sr : int, hop_length : int = 512) -> np.ndarray:
+    """
+    Compute the unnormalized audio features of every frame.
+
+    Args:
+        y (np.ndarray): _The decoded samples._
+        sr (int): _The sample rate._
+        hop_length (int, optional): _The hop length of the frames._ Defaults to 512.
+
+    Returns:
+        np.ndarray: _Array with the shape (num_frames, 7): 5 MFCCs, onset strength and RMS._
+    """
+    # MFCCs and onset strength are both computed from the same log-power mel spectrogram.
+    mel_db = librosa.power_to_db(librosa.feature.melspectrogram(y=y, sr=sr, hop_length=hop_length))
+    mfcc = librosa.feature.mfcc(S=mel_db, n_mfcc=5).T
+    onset_env = librosa.onset.onset_strength(S=mel_db, sr=sr, hop_length=hop_length)
+    rms = compute_rms(y, hop_length=hop_length)
+    
+    # Ensure all arrays are aligned in time.
+    max_frames = min(len(onset_env), len(rms), mfcc.shape[0])
+    
+    return np.column_stack([ mfcc[:max_frames], onset_env[:max_frames], rms[:max_frames] ])
+
+
+def extract_features_and_tempo(audio_path : str, audio_bpm : float, audio_start_ms : float, note_precision : int, means : list, stds : list) -> tuple:
+    """
+    Extract the normalized audio features and the timings of every subbeat of an audio file.
+    The audio is decoded only once. An unknown BPM or offset (None) is estimated from the onset strength.
+
+    Args:
+        audio_path (str): _The path to the audio file._
+        audio_bpm (float): _The BPM of the audio, None to estimate it._
+        audio_start_ms (float): _The time in milliseconds where the first beat occurs, None to estimate it._
+        note_precision (int): _The amount of subbeats per quarter note._
+        means (list): _The feature means used for normalization._
+        stds (list): _The feature standard deviations used for normalization._
+
+    Raises:
+        ValueError: _No features could be extracted._
+
+    Returns:
+        tuple: _Array with the shape (num_subbeats, num_features), the subbeat timings in milliseconds
+            and the tempo (audio_bpm, audio_start_ms and the confidence of the estimate, None if nothing was estimated)._
+    """
+    y, sr = decode_audio(audio_path)
+    hop_length = 512
+    frame_features = compute_frame_features(y, sr, hop_length=hop_length)
+    
+    tempo = { "audio_bpm": audio_bpm, "audio_start_ms": audio_start_ms, "confidence": None }
+    
+    if audio_bpm is None or audio_start_ms is None:
+        tempo = estimate_tempo(frame_features[:, ONSET_FEATURE_IDX], sr / hop_length, audio_bpm=audio_bpm, audio_start_ms=audio_start_ms)
+        audio_bpm, audio_start_ms = tempo["audio_bpm"], tempo["audio_start_ms"]
+    
+    subbeat_times_ms = compute_subbeat_timings(
+        duration_ms=librosa.get_duration(y=y, sr=sr) * 1000,
+        audio_start_ms=audio_start_ms,
+        audio_bpm=audio_bpm,
+        note_precision=note_precision
+    )
+    
+    if len(subbeat_times_ms) == 0 or len(frame_features) == 0:
+        raise ValueError(f"Feature extraction failed: {len(subbeat_times_ms)} subbeats, {len(frame_features)} frames")
+    
+    # Gather the frame of every subbeat at once, subbeats beyond the last frame use the last frame.
+    frame_idxs = ((subbeat_times_ms / 1000) * sr / hop_length).astype(np.int64)
+    frame_idxs = np.clip(frame_idxs, 0, len(frame_features) - 1)
+    
+    # -------- Normalize features --------
+    features = (frame_features[frame_idxs] - np.asarray(means)) / (np.asarray(stds) + 1e-6)
+    # ---------------------------------
+    
+    return features, subbeat_times_ms.tolist(), tempo
+
+
+def extract_features_and_timings(audio_path : str, audio_bpm : float, audio_start_ms : float, note_precision : int, means : list, stds : list) -> tuple:
+    """
+    Extract the normalized audio features and the timings of every subbeat of an audio file.
+    The audio is decoded only once.
+
+    Args:
+        audio_path (str): _The path to the audio file._
+        audio_bpm (float): _The BPM of the audio._
+        audio_start_ms (float): _The time in milliseconds where the first beat occurs._
+        note_precision (int): _The amount of subbeats per quarter note._
+        means (list): _The feature means used for normalization._
+        stds (list): _The feature standard deviations used for normalization._
+
+    Raises:
+        ValueError: _No features could be extracted._
+
+    Returns:
+        tuple: _Array with the shape (num_subbeats, num_features) and the subbeat timings in milliseconds._
+    """
+    features, subbeat_timings, _ = extract_features_and_tempo(audio_path, audio_bpm, audio_start_ms, note_precision, means, stds)
+    
+    return features, subbeat_timings
+
+
+def extract_features(audio_path : str, audio_bpm : float, audio_start_ms : float, note_precision : int, means : list, stds : list) -> np.ndarray:
+    """
+    Extract the normalized audio features of every subbeat of an audio file.
+
+    Args:
+        audio_path (str): _The path to the audio file._
+        audio_bpm (float): _The BPM of the audio._
+        audio_start_ms (float): _The time in milliseconds where the first beat occurs._
+        note_precision (int): _The amount of subbeats per quarter note._
+        means (list): _The feature means used for normalization._
+        stds (list): _The feature standard deviations used for normalization._
+
+    Raises:
+        ValueError: _No features could be extracted._
+
+    Returns:
+        np.ndarray: _Array with the shape (num_subbeats, num_features)._
+    """
+    features, _ = extract_features_and_timings(audio_path, audio_bpm, audio_start_ms, note_precision, means, stds)
+    
+    return features
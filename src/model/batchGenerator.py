@@ -0,0 +1,207 @@
+import argparse
+import concurrent.futures
+import csv
+import json
+import multiprocessing
+import os
+import time
+
+from src.model.generationCache import FEATURE_CACHE_DIR, extract_features_cached, get_prediction_cache_key, get_prediction_cache_path, save_predictions
+from src.model.inferenceBackend import MODEL_FORMATS, load_generation_model, predict_overlapping_windows_batch
+from src.model.tempoEstimator import parse_tempo_value
+from src.model.variantGenerator import DEFAULT_PROFILE, generate_variant
+
+
+NORM_STATS_PATH = os.path.join(os.getcwd(), "feature_norm_stats.json")
+
+NUM_LANES = 4
+
+
+def load_manifest(manifest_path : str) -> list:
+    """
+    Load the songs of a batch generation from a .csv-file (with header) or a .jsonl-file (one object per line).
+
+    Every song has an audio_path, audio_bpm, audio_start_ms (optional, defaults to 0) and name
+    (optional, defaults to the name of the audio file). Relative audio paths are relative to the manifest.
+    A BPM or offset of "auto" is estimated from the audio.
+
+    Args:
+        manifest_path (str): _The path to the manifest._
+
+    Raises:
+        ValueError: _A song has no path or BPM, an invalid BPM or offset, or two songs have the same name._
+
+    Returns:
+        list: _The songs of the manifest._
+    """
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        if manifest_path.lower().endswith(".jsonl"):
+            rows = [ json.loads(line) for line in f if line.strip() ]
+        else:
+            rows = list(csv.DictReader(f))
+    
+    manifest_dir = os.path.dirname(os.path.abspath(manifest_path))
+    songs = []
+    names = set()
+    
+    for line_idx, row in enumerate(rows):
+        if not row.get("audio_path") or not row.get("audio_bpm"):
+            raise ValueError(f"Song {line_idx + 1} of {manifest_path} needs an audio_path and an audio_bpm.")
+        
+        audio_path = os.path.join(manifest_dir, row["audio_path"])
+        name = row.get("name") or os.path.splitext(os.path.basename(audio_path))[0]
+        
+        if name in names:
+            raise ValueError(f"Song name {name} appears twice in {manifest_path}.")
+        
+        names.add(name)
+        songs.append({
+            "audio_path": audio_path,
+            "audio_bpm": parse_tempo_value(row["audio_bpm"]),
+            "audio_start_ms": parse_tempo_value(row.get("audio_start_ms") or 0),
+            "name": name
+        })
+    
+    return songs
+
+
+def extract_song(song : dict, note_precision : int, means : list, stds : list, cache_dir : str = FEATURE_CACHE_DIR, cache_size_mb : float = 0) -> tuple:
+    # Runs in a worker process: decode the audio once and extract its features and subbeat timings (or load them from the feature cache).
+    features, subbeat_timings, tempo, _ = extract_features_cached(
+        audio_path=song["audio_path"],
+        audio_bpm=song["audio_bpm"],
+        audio_start_ms=song["audio_start_ms"],
+        note_precision=note_precision,
+        means=means,
+        stds=stds,
+        cache_dir=cache_dir,
+        max_size_mb=cache_size_mb
+    )
+    
+    return features, subbeat_timings, tempo
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate the levels of all songs of a manifest with a single model load.")
+    parser.add_argument("--manifest", type=str, required=True)
+    parser.add_argument("--model_path", type=str, default=os.path.join(os.getcwd(), "models", "model-3-4_stars-P4-S128-V3.keras"))
+    parser.add_argument("--model_format", type=str, default="keras", choices=MODEL_FORMATS)
+    parser.add_argument("--sequence_length", type=int, default=0)
+    parser.add_argument("--note_precision", type=int, default=2)
+    parser.add_argument("--prediction_threshold", type=float, default=0.45)
+    parser.add_argument("--fixed_threshold", action="store_true")
+    parser.add_argument("--post_processor", type=str, default="greedy", choices=["greedy", "viterbi"])
+    parser.add_argument("--jack_penalty", type=float, default=1.0)
+    parser.add_argument("--chord_penalty", type=float, default=0.5)
+    parser.add_argument("--max_chord_size", type=int, default=2)
+    parser.add_argument("--target_density", type=float, default=0.0)
+    parser.add_argument("--window_hop", type=int, default=0)
+    parser.add_argument("--inference_batch_size", type=int, default=256)
+    parser.add_argument("--songs_per_predict", type=int, default=16)
+    parser.add_argument("--num_workers", type=int, default=os.cpu_count())
+    parser.add_argument("--output_dir", type=str, default=os.path.join(os.getcwd(), "generation"))
+    parser.add_argument("--feature_cache_dir", type=str, default=FEATURE_CACHE_DIR)
+    parser.add_argument("--feature_cache_size_mb", type=float, default=1024)
+    args = parser.parse_args()
+    
+    with open(NORM_STATS_PATH, "r") as f:
+        stats = json.load(f)
+    
+    songs = load_manifest(args.manifest)
+    
+    if not songs:
+        raise ValueError(f"No songs found in {args.manifest}.")
+    
+    os.makedirs(args.output_dir, exist_ok=True)
+    
+    model = load_generation_model(args.model_path, model_format=args.model_format)
+    
+    # Keras and NumPy models know their sequence length, TFLite models need --sequence_length.
+    input_shape = getattr(model, "input_shape", None)
+    sequence_length = args.sequence_length or (input_shape[1] if input_shape is not None else 0)
+    
+    if not sequence_length:
+        raise ValueError("The sequence length of the model is unknown, pass --sequence_length.")
+    
+    window_hop = args.window_hop if args.window_hop > 0 else max(1, sequence_length // 2)
+    
+    # Same post-processing as levelGenerator (the automatic threshold is used unless --fixed_threshold is given).
+    profile = dict(
+        DEFAULT_PROFILE,
+        post_processor=args.post_processor,
+        prediction_threshold=args.prediction_threshold,
+        use_auto_threshold=not args.fixed_threshold,
+        jack_penalty=args.jack_penalty,
+        chord_penalty=args.chord_penalty,
+        max_chord_size=args.max_chord_size,
+        target_density=args.target_density
+    )
+    
+    print(f"Generating {len(songs)} songs with {args.model_path} ({args.num_workers} feature workers, {args.songs_per_predict} songs per predict).")
+    start_time = time.perf_counter()
+    failed = []
+    num_generated = 0
+    
+    def generate_chunk(chunk):
+        # The windows of all songs of the chunk are predicted in one predict call.
+        predictions = predict_overlapping_windows_batch(model, [ features for _, features, _, _ in chunk ], sequence_length, window_hop, batch_size=args.inference_batch_size)
+        
+        for (song, _, subbeat_timings, tempo), raw_predictions in zip(chunk, predictions):
+            output_path = os.path.join(args.output_dir, song["name"])
+            
+            # The raw predictions are cached like in levelGenerator, so a song can be re-post-processed with --reuse_predictions.
+            cache_key = get_prediction_cache_key(
+                audio_path=song["audio_path"],
+                model_path=args.model_path,
+                model_format=args.model_format,
+                audio_bpm=song["audio_bpm"],
+                audio_start_ms=song["audio_start_ms"],
+                note_precision=args.note_precision,
+                sequence_length=sequence_length,
+                window_hop=window_hop
+            )
+            save_predictions(get_prediction_cache_path(output_path), cache_key, raw_predictions, subbeat_timings)
+            
+            result = generate_variant(raw_predictions, subbeat_timings, dict(profile, name=song["name"]), f"{output_path}.gblf", NUM_LANES)
+            print(f"{song['name']}: {result['notes_per_subbeat']:.3f} notes per subbeat -> {output_path}.gblf")
+            
+            if tempo["confidence"] is not None:
+                print(f"{song['name']}: estimated tempo {tempo['audio_bpm']:.3f} BPM, first beat at {tempo['audio_start_ms']:.0f} ms (confidence {tempo['confidence']:.2f}).")
+    
+    # Spawned workers do not inherit the TensorFlow runtime of this process.
+    mp_context = multiprocessing.get_context("spawn")
+    
+    with concurrent.futures.ProcessPoolExecutor(max_workers=args.num_workers, mp_context=mp_context) as executor:
+        futures = [ executor.submit(extract_song, song, args.note_precision, stats["means"], stats["stds"], args.feature_cache_dir, args.feature_cache_size_mb) for song in songs ]
+        chunk = []
+        
+        # Songs are predicted in manifest order while the workers keep extracting the next songs.
+        for song, future in zip(songs, futures):
+            try:
+                features, subbeat_timings, tempo = future.result()
+            except Exception as e:
+                failed.append(song["name"])
+                print(f"{song['name']}: feature extraction failed ({e}).")
+                continue
+            
+            chunk.append((song, features, subbeat_timings, tempo))
+            
+            if len(chunk) >= args.songs_per_predict:
+                generate_chunk(chunk)
+                num_generated += len(chunk)
+                chunk = []
+        
+        if chunk:
+            generate_chunk(chunk)
+            num_generated += len(chunk)
+    
+    elapsed = time.perf_counter() - start_time
+    
+    print(f"Generated {num_generated} songs in {elapsed:.1f} s ({60 * num_generated / max(elapsed, 1e-9):.1f} songs per minute).")
+    
+    if failed:
+        print(f"Failed songs: {failed}")
+
+
+if __name__ == "__main__":
+    main()
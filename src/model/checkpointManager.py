@@ -0,0 +1,242 @@
+import glob
+import json
+import numpy as np
+import os
+import threading
+import tensorflow as tf
+
+
+def get_optimizer_variables(optimizer) -> list:
+    """
+    Return the variables (slots, iteration counter, loss scale, ...) of a Keras optimizer.
+
+    Args:
+        optimizer (_type_): _The optimizer of a compiled model._
+
+    Returns:
+        list: _The optimizer variables._
+    """
+    # Keras 2.11+ optimizers expose the variables as property, older optimizers as method.
+    variables = optimizer.variables
+    
+    return variables() if callable(variables) else variables
+
+
+def build_optimizer_variables(optimizer, model : tf.keras.Model):
+    """
+    Create the optimizer variables of a model before the first training step,
+    so that the optimizer state of a checkpoint can be assigned to them.
+
+    Args:
+        optimizer (_type_): _The optimizer of the model._
+        model (tf.keras.Model): _The compiled model._
+    """
+    if hasattr(optimizer, "build"):
+        optimizer.build(model.trainable_variables)
+    else:
+        optimizer._create_all_weights(model.trainable_variables)
+
+
+class CheckpointManager(tf.keras.callbacks.Callback):
+    """
+    Save the full training state after every epoch and keep the last max_to_keep checkpoints.
+
+    Every checkpoint consists of an .npz-file (model weights, optimizer state and the best weights
+    of the early stopping callback) and a .json-file (epoch, step, early-stopping state, seed and
+    loader cursor). The .json-file is written last, so only complete checkpoints are ever restored.
+    The weights are copied on the training thread; writing the files happens in a background thread.
+    """
+    def __init__(self, checkpoint_dir : str, max_to_keep : int = 3, early_stopping : tf.keras.callbacks.EarlyStopping = None, seed : int = 0, batch_size : int = 64, start_offset : int = 0):
+        """
+        Args:
+            checkpoint_dir (str): _The directory of the checkpoints of one model._
+            max_to_keep (int, optional): _How many of the latest checkpoints are kept (at least 1)._ Defaults to 3.
+            early_stopping (tf.keras.callbacks.EarlyStopping, optional): _Early stopping callback whose state is saved and restored._ Defaults to None.
+            seed (int, optional): _The random seed of the training run._ Defaults to 0.
+            batch_size (int, optional): _The training batch size (to advance the loader cursor)._ Defaults to 64.
+            start_offset (int, optional): _The loader cursor the training run started at._ Defaults to 0.
+        """
+        super().__init__()
+        
+        # At least the latest checkpoint is needed to resume ([:-0] would also keep every checkpoint).
+        if max_to_keep < 1:
+            raise ValueError(f"max_to_keep must be at least 1, got {max_to_keep}.")
+        
+        self.checkpoint_dir = checkpoint_dir
+        self.max_to_keep = max_to_keep
+        self.early_stopping = early_stopping
+        self.seed = seed
+        self.batch_size = batch_size
+        self.start_offset = start_offset
+        self.steps = 0
+        self.restored_state = None
+        self.save_thread = None
+        self.save_error = None
+        
+        os.makedirs(checkpoint_dir, exist_ok=True)
+
+
+    def list_checkpoints(self) -> list:
+        # Only checkpoints with a state file are complete.
+        return sorted(glob.glob(os.path.join(self.checkpoint_dir, "ckpt-*.json")))
+
+
+    def latest_state(self) -> dict:
+        """
+        Read the state of the latest checkpoint (without loading the weights).
+
+        Returns:
+            dict: _The training state, or None if there is no checkpoint._
+        """
+        checkpoints = self.list_checkpoints()
+        
+        if not checkpoints:
+            return None
+        
+        with open(checkpoints[-1], "r") as f:
+            return json.load(f)
+
+
+    def restore(self, model : tf.keras.Model) -> dict:
+        """
+        Restore the model weights and the optimizer state of the latest checkpoint.
+        The early-stopping state is restored at the beginning of training (after Keras reset it).
+
+        Args:
+            model (tf.keras.Model): _The compiled model (with the same architecture as the checkpoint)._
+
+        Returns:
+            dict: _The restored training state, or None if there is no checkpoint._
+        """
+        state = self.latest_state()
+        
+        if state is None:
+            return None
+        
+        with np.load(os.path.join(self.checkpoint_dir, state["weights_file"])) as data:
+            model.set_weights([data[f"model_{i}"] for i in range(state["num_model_weights"])])
+            
+            build_optimizer_variables(model.optimizer, model)
+            optimizer_variables = get_optimizer_variables(model.optimizer)
+            
+            if len(optimizer_variables) != state["num_optimizer_weights"]:
+                raise RuntimeError(f"Optimizer state of checkpoint {state['weights_file']} does not match the model optimizer.")
+            
+            for i, variable in enumerate(optimizer_variables):
+                variable.assign(data[f"optimizer_{i}"])
+            
+            best_weights = None
+            
+            if state["early_stopping"] is not None and state["early_stopping"]["has_best_weights"]:
+                best_weights = [data[f"best_{i}"] for i in range(state["num_model_weights"])]
+        
+        self.restored_state = dict(state, best_weights=best_weights)
+        self.start_offset = state["cursor"]
+        
+        print(f"Restored checkpoint of epoch {state['epoch']} (step {state['step']}) from {self.checkpoint_dir}.")
+        
+        return state
+
+
+    def on_train_begin(self, logs=None):
+        self.steps = 0
+        
+        # EarlyStopping resets its state in on_train_begin, so this callback has to come after it.
+        if self.restored_state is None or self.early_stopping is None or self.restored_state["early_stopping"] is None:
+            return
+        
+        early_stopping_state = self.restored_state["early_stopping"]
+        self.early_stopping.wait = early_stopping_state["wait"]
+        self.early_stopping.best = early_stopping_state["best"]
+        self.early_stopping.best_weights = self.restored_state["best_weights"]
+        
+        if hasattr(self.early_stopping, "best_epoch"):
+            self.early_stopping.best_epoch = early_stopping_state["best_epoch"]
+
+
+    def on_train_batch_end(self, batch, logs=None):
+        self.steps += 1
+
+
+    def on_epoch_end(self, epoch, logs=None):
+        # Copy everything on the training thread, the next epoch changes the weights.
+        arrays = { f"model_{i}": w for i, w in enumerate(self.model.get_weights()) }
+        optimizer_variables = get_optimizer_variables(self.model.optimizer)
+        arrays.update({ f"optimizer_{i}": v.numpy() for i, v in enumerate(optimizer_variables) })
+        
+        early_stopping_state = None
+        
+        if self.early_stopping is not None:
+            best_weights = self.early_stopping.best_weights
+            early_stopping_state = {
+                "wait": int(self.early_stopping.wait),
+                "best": float(self.early_stopping.best),
+                "best_epoch": int(getattr(self.early_stopping, "best_epoch", 0)),
+                "has_best_weights": best_weights is not None
+            }
+            
+            if best_weights is not None:
+                arrays.update({ f"best_{i}": w for i, w in enumerate(best_weights) })
+        
+        # The cursor counts the sequences the model trained on (over all passes). The training stream is a function of the
+        # seed and this position, so unlike the read position of the loader it does not depend on prefetching.
+        cursor = self.start_offset + self.steps * self.batch_size
+        
+        name = f"ckpt-{epoch + 1:05d}"
+        state = {
+            "epoch": epoch + 1,
+            "step": int(self.model.optimizer.iterations.numpy()),
+            "seed": self.seed,
+            "cursor": int(cursor),
+            "early_stopping": early_stopping_state,
+            "logs": { key: float(value) for key, value in (logs or {}).items() },
+            "weights_file": f"{name}.npz",
+            "num_model_weights": len(self.model.get_weights()),
+            "num_optimizer_weights": len(optimizer_variables)
+        }
+        
+        # Only one save is in flight at a time, so the checkpoints are written in order.
+        self.wait_for_save()
+        self.save_thread = threading.Thread(target=self.write_checkpoint, args=(name, arrays, state), daemon=True)
+        self.save_thread.start()
+
+
+    def on_train_end(self, logs=None):
+        self.wait_for_save()
+
+
+    def wait_for_save(self):
+        if self.save_thread is not None:
+            self.save_thread.join()
+            self.save_thread = None
+        
+        if self.save_error is not None:
+            error, self.save_error = self.save_error, None
+            raise RuntimeError(f"Saving the checkpoint failed: {error}")
+
+
+    def write_checkpoint(self, name : str, arrays : dict, state : dict):
+        try:
+            weights_path = os.path.join(self.checkpoint_dir, f"{name}.npz")
+            state_path = os.path.join(self.checkpoint_dir, f"{name}.json")
+            
+            # Write to temporary files first, so an interrupted save never replaces a complete checkpoint.
+            with open(weights_path + ".tmp", "wb") as f:
+                np.savez(f, **arrays)
+            
+            os.replace(weights_path + ".tmp", weights_path)
+            
+            with open(state_path + ".tmp", "w") as f:
+                json.dump(state, f, indent=4)
+            
+            os.replace(state_path + ".tmp", state_path)
+            
+            # Delete the oldest checkpoints (state file first).
+            for old_state_path in self.list_checkpoints()[:-self.max_to_keep]:
+                os.remove(old_state_path)
+                old_weights_path = old_state_path[:-len(".json")] + ".npz"
+                
+                if os.path.exists(old_weights_path):
+                    os.remove(old_weights_path)
+        except Exception as e:
+            self.save_error = e
@@ -0,0 +1,95 @@
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+
+
+parser = argparse.ArgumentParser(description="Launch multi-worker training on this host. All unknown arguments are passed to the model trainer.")
+parser.add_argument("--num_workers", type=int, default=2)
+parser.add_argument("--base_port", type=int, default=20000)
+parser.add_argument("--threads_per_worker", type=int, default=0)
+parser.add_argument("--max_restarts", type=int, default=3)
+parser.add_argument("--cpu_only", action="store_true")
+args, trainer_args = parser.parse_known_args()
+
+# All workers and all their restarts train with the same seed, so a restarted worker continues the same data stream.
+if not any(arg == "--seed" or arg.startswith("--seed=") for arg in trainer_args):
+    trainer_args += [ "--seed", str(random.randrange(2**31)) ]
+
+
+def get_tf_config(num_workers : int, worker_index : int, base_port : int) -> str:
+    """
+    Create the TF_CONFIG of a worker for a cluster of workers on localhost.
+
+    Args:
+        num_workers (int): _The number of workers in the cluster._
+        worker_index (int): _The index of the worker (0 is the chief)._
+        base_port (int): _The port of the first worker; the other workers use the following ports._
+
+    Returns:
+        str: _The TF_CONFIG as JSON string._
+    """
+    return json.dumps({
+        "cluster": { "worker": [ f"localhost:{base_port + i}" for i in range(num_workers) ] },
+        "task": { "type": "worker", "index": worker_index }
+    })
+
+
+def start_worker(worker_index : int) -> subprocess.Popen:
+    env = dict(os.environ)
+    env["TF_CONFIG"] = get_tf_config(args.num_workers, worker_index, args.base_port)
+    
+    if args.cpu_only:
+        env["CUDA_VISIBLE_DEVICES"] = "-1"
+    
+    cmd = [ sys.executable, "-m", "src.model.modelTrainer", "--distributed" ] + trainer_args
+    
+    # Split the CPU cores between the workers, so they do not oversubscribe the host.
+    if args.threads_per_worker > 0:
+        cmd += [ "--intra_op_threads", str(args.threads_per_worker), "--inter_op_threads", "1" ]
+    
+    print(f"Starting worker {worker_index} ({' '.join(cmd)})")
+    process = subprocess.Popen(cmd, env=env)
+    print(f"Worker {worker_index} has PID {process.pid}.")
+    
+    return process
+
+
+def main():
+    workers = { i: start_worker(i) for i in range(args.num_workers) }
+    restarts = { i: 0 for i in range(args.num_workers) }
+    
+    while workers:
+        time.sleep(1)
+        
+        for worker_index, process in list(workers.items()):
+            return_code = process.poll()
+            
+            if return_code is None:
+                continue
+            
+            if return_code == 0:
+                print(f"Worker {worker_index} finished.")
+                del workers[worker_index]
+                continue
+            
+            # Restarted workers rejoin the cluster and continue from the last backup of the chief.
+            if restarts[worker_index] < args.max_restarts:
+                restarts[worker_index] += 1
+                print(f"Worker {worker_index} failed with exit code {return_code}, restarting ({restarts[worker_index]}/{args.max_restarts}).")
+                workers[worker_index] = start_worker(worker_index)
+                continue
+            
+            print(f"Worker {worker_index} failed with exit code {return_code}. Stopping all workers.")
+            
+            for other_process in workers.values():
+                other_process.terminate()
+            
+            sys.exit(return_code)
+
+
+if __name__ == "__main__":
+    main()
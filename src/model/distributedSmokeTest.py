@@ -0,0 +1,109 @@
+import argparse
+import os
+import re
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+
+
+parser = argparse.ArgumentParser(description="Train a few steps with two workers on localhost, kill one worker during the second epoch and check that the run resumes. All unknown arguments are passed to the model trainer.")
+parser.add_argument("--num_workers", type=int, default=2)
+parser.add_argument("--base_port", type=int, default=21000)
+parser.add_argument("--epochs", type=int, default=3)
+parser.add_argument("--steps_per_epoch", type=int, default=5)
+parser.add_argument("--kill_worker", type=int, default=1)
+parser.add_argument("--kill_epoch", type=int, default=2)
+parser.add_argument("--timeout", type=int, default=900)
+args, trainer_args = parser.parse_known_args()
+
+
+def read_output(process : subprocess.Popen, lines : list, kill_event : threading.Event):
+    """
+    Print the output of the launcher (and its workers) and kill the worker as soon as the kill epoch starts.
+
+    Args:
+        process (subprocess.Popen): _The launcher._
+        lines (list): _Receives the output lines and the index of the line the worker was killed at (as "KILLED")._
+        kill_event (threading.Event): _Set after the worker was killed._
+    """
+    worker_pids = {}
+    
+    for line in process.stdout:
+        print(line, end="", flush=True)
+        lines.append(line)
+        match = re.match(r"Worker (\d+) has PID (\d+)\.", line)
+        
+        if match:
+            worker_pids[int(match.group(1))] = int(match.group(2))
+        
+        # The epoch is only started after the backup of the previous epoch was written.
+        if not kill_event.is_set() and line.startswith(f"Epoch {args.kill_epoch}/") and args.kill_worker in worker_pids:
+            print(f"Killing worker {args.kill_worker} (PID {worker_pids[args.kill_worker]}).", flush=True)
+            os.kill(worker_pids[args.kill_worker], getattr(signal, "SIGKILL", signal.SIGTERM))
+            lines.append("KILLED")
+            kill_event.set()
+
+
+def main():
+    work_dir = tempfile.mkdtemp(prefix="rhythmapper_smoke_")
+    output_dir = os.path.join(work_dir, "models")
+    os.makedirs(output_dir)
+    
+    cmd = [
+        sys.executable, "-m", "src.model.distributedLauncher",
+        "--num_workers", str(args.num_workers),
+        "--base_port", str(args.base_port),
+        "--max_restarts", "2",
+        "--cpu_only",
+        "--threads_per_worker", "1",
+        "--epochs", str(args.epochs),
+        "--steps_per_epoch", str(args.steps_per_epoch),
+        "--validation_steps", str(args.steps_per_epoch),
+        "--output_dir", output_dir,
+        "--backup_dir", os.path.join(work_dir, "backup"),
+        "--checkpoint_dir", os.path.join(work_dir, "checkpoints"),
+        "--seed", "0"
+    ] + trainer_args
+    
+    # The workers inherit the environment, their output has to reach the pipe unbuffered.
+    env = dict(os.environ, PYTHONUNBUFFERED="1", TF_CPP_MIN_LOG_LEVEL="2")
+    process = subprocess.Popen(cmd, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    lines = []
+    kill_event = threading.Event()
+    reader = threading.Thread(target=read_output, args=(process, lines, kill_event), daemon=True)
+    reader.start()
+    
+    try:
+        return_code = process.wait(timeout=args.timeout)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        return_code = None
+    
+    reader.join(timeout=10)
+    
+    # After the kill, the restarted workers have to continue from the backup instead of the first epoch.
+    resumed_lines = lines[lines.index("KILLED") + 1:] if "KILLED" in lines else []
+    checks = {
+        "launcher finished": return_code == 0,
+        "worker killed": kill_event.is_set(),
+        "worker restarted": any(line.startswith(f"Worker {args.kill_worker} failed") for line in resumed_lines),
+        "resumed from backup": any(line.startswith(f"Epoch {args.epochs}/") for line in resumed_lines) and not any(line.startswith("Epoch 1/") for line in resumed_lines),
+        "model saved": any(fname.endswith(".keras") for fname in os.listdir(output_dir))
+    }
+    
+    print("\nDistributed smoke test:")
+    
+    for name, passed in checks.items():
+        print(f"  {name:<22} {'ok' if passed else 'FAILED'}")
+    
+    shutil.rmtree(work_dir, ignore_errors=True)
+    
+    if not all(checks.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
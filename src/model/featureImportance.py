@@ -0,0 +1,171 @@
+import argparse
+import glob
+import json
+import numpy as np
+import os
+
+from src.data_utils.dataSequenceLoader import get_sequence_file_pattern
+from src.model.inferenceBackend import MODEL_FORMATS, load_generation_model
+
+
+SEQUENCES_ROOT = os.path.join(os.getcwd(), "data", "sequences")
+
+FEATURE_NAMES = [ "mfcc0", "mfcc1", "mfcc2", "mfcc3", "mfcc4", "onset", "rms" ]
+NUM_FEATURES = 7
+
+
+def load_test_sequences(file_pattern : str, num_sequences : int, sequence_length : int = 0, seed : int = 0) -> tuple:
+    """
+    Load a random subset of the sequences in all .npy-files matching file_pattern.
+
+    Args:
+        file_pattern (str): _The file pattern of the sequence shards._
+        num_sequences (int): _The maximum number of sequences to load._
+        sequence_length (int, optional): _If shorter than the stored sequences, every stored sequence is
+            split into consecutive sequences of this length._ Defaults to 0 (stored length).
+        seed (int, optional): _Seed of the sequence selection._ Defaults to 0.
+
+    Returns:
+        tuple: _The features (num_sequences, sequence_length, 7) and labels (num_sequences, sequence_length, 4)._
+    """
+    files = sorted(glob.glob(file_pattern))
+    
+    if not files:
+        raise FileNotFoundError(f"No sequences found matching {file_pattern}.")
+    
+    shards = [ np.load(fname, mmap_mode='r') for fname in files ]
+    stored_length = shards[0].shape[1]
+    sequence_length = sequence_length or stored_length
+    
+    if sequence_length > stored_length:
+        raise ValueError(f"Cannot split sequences of length {stored_length} into sequences of length {sequence_length}.")
+    
+    crops_per_sequence = stored_length // sequence_length
+    
+    # Select (shard, sequence) pairs without loading the shards.
+    index = np.concatenate([ np.stack([np.full(len(shard), i), np.arange(len(shard))], axis=1) for i, shard in enumerate(shards) ])
+    rng = np.random.default_rng(seed)
+    num_stored = min(len(index), -(-num_sequences // crops_per_sequence))
+    selected = index[np.sort(rng.choice(len(index), size=num_stored, replace=False))]
+    
+    sequences = np.stack([ shards[shard_idx][seq_idx] for shard_idx, seq_idx in selected ]).astype(np.float32)
+    sequences = sequences[:, :crops_per_sequence * sequence_length].reshape(-1, sequence_length, sequences.shape[-1])[:num_sequences]
+    
+    return sequences[:, :, :NUM_FEATURES], sequences[:, :, NUM_FEATURES:]
+
+
+def binary_crossentropy_per_sequence(y_true : np.ndarray, y_pred : np.ndarray) -> np.ndarray:
+    # Same clipping as Keras, averaged over all subbeats and lanes of a sequence.
+    epsilon = 1e-7
+    y_pred = np.clip(y_pred, epsilon, 1.0 - epsilon)
+    loss = -(y_true * np.log(y_pred) + (1.0 - y_true) * np.log(1.0 - y_pred))
+    
+    return loss.reshape(len(loss), -1).mean(axis=1)
+
+
+def compute_permutation_importance(model, X : np.ndarray, y : np.ndarray, num_repeats : int = 5, seed : int = 0, batch_size : int = 256, feature_names : list = FEATURE_NAMES) -> list:
+    """
+    Compute the permutation feature importance of a model: the increase of the binary crossentropy
+    when the values of one feature are shuffled across all sequences and subbeats.
+    The unpermuted and all permuted copies of X are predicted in a single batched predict call.
+
+    Args:
+        model (_type_): _A model with a predict() method (Keras, TFLite or NumPy model)._
+        X (np.ndarray): _Test features with the shape (num_sequences, sequence_length, num_features)._
+        y (np.ndarray): _Test labels with the shape (num_sequences, sequence_length, num_lanes)._
+        num_repeats (int, optional): _How often every feature is permuted (with different permutations)._ Defaults to 5.
+        seed (int, optional): _Seed of the permutations._ Defaults to 0.
+        batch_size (int, optional): _The batch size of the predict call._ Defaults to 256.
+        feature_names (list, optional): _The names of the features._ Defaults to FEATURE_NAMES.
+
+    Returns:
+        list: _One dict per feature with the mean importance, its 95 % confidence interval
+            (over the sequences) and the standard deviation over the repeats._
+    """
+    rng = np.random.default_rng(seed)
+    num_sequences, sequence_length, num_features = X.shape
+    
+    # Copy 0 is the unpermuted baseline, copy 1 + f * num_repeats + r is feature f in repeat r.
+    X_all = np.repeat(X[np.newaxis], 1 + num_features * num_repeats, axis=0)
+    
+    for feature in range(num_features):
+        flat = X[..., feature].reshape(-1)
+        
+        for repeat in range(num_repeats):
+            copy_idx = 1 + feature * num_repeats + repeat
+            X_all[copy_idx, ..., feature] = flat[rng.permutation(len(flat))].reshape(num_sequences, sequence_length)
+    
+    predictions = model.predict(X_all.reshape(-1, sequence_length, num_features), batch_size=batch_size, verbose=0)
+    predictions = np.asarray(predictions).reshape(len(X_all), num_sequences, sequence_length, -1)
+    
+    losses = np.stack([ binary_crossentropy_per_sequence(y, prediction) for prediction in predictions ])
+    baseline = losses[0]
+    
+    # Loss increase per feature, repeat and sequence.
+    differences = (losses[1:] - baseline).reshape(num_features, num_repeats, num_sequences)
+    
+    importances = []
+    
+    for feature in range(num_features):
+        per_sequence = differences[feature].mean(axis=0)
+        mean = float(per_sequence.mean())
+        ci = float(1.96 * per_sequence.std(ddof=1) / np.sqrt(num_sequences)) if num_sequences > 1 else 0.0
+        
+        importances.append({
+            "feature": feature_names[feature] if feature < len(feature_names) else f"feature{feature}",
+            "importance": mean,
+            "ci95_low": mean - ci,
+            "ci95_high": mean + ci,
+            "repeat_std": float(differences[feature].mean(axis=1).std()),
+            "baseline_loss": float(baseline.mean())
+        })
+    
+    return importances
+
+
+def print_importances(importances : list):
+    print("Permutation feature importances (loss increase, 95 % CI):")
+    
+    for result in sorted(importances, key=lambda result: result["importance"], reverse=True):
+        print(f"{result['feature']:>6}: {result['importance']:.5f}  [{result['ci95_low']:.5f}, {result['ci95_high']:.5f}]  (repeat std {result['repeat_std']:.5f})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compute the permutation feature importance of a trained model on the test sequences.")
+    parser.add_argument("--model_path", type=str, required=True)
+    parser.add_argument("--model_format", type=str, default="keras", choices=MODEL_FORMATS)
+    parser.add_argument("--difficulty_range", type=str, default="3-4_stars")
+    parser.add_argument("--num_sequences", type=int, default=2048)
+    parser.add_argument("--num_repeats", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--batch_size", type=int, default=256)
+    parser.add_argument("--report_path", type=str, default="")
+    args = parser.parse_args()
+    
+    model = load_generation_model(args.model_path, args.model_format)
+    
+    # Keras and NumPy models know their sequence length, TFLite models use the stored length.
+    input_shape = getattr(model, "input_shape", None)
+    sequence_length = input_shape[1] if input_shape is not None and input_shape[1] is not None else 0
+    
+    X, y = load_test_sequences(
+        get_sequence_file_pattern(SEQUENCES_ROOT, args.difficulty_range, "test"),
+        num_sequences=args.num_sequences,
+        sequence_length=sequence_length,
+        seed=args.seed
+    )
+    
+    print(f"Computing permutation importance on {len(X)} test sequences ({args.num_repeats} repeats per feature).")
+    
+    importances = compute_permutation_importance(model, X, y, num_repeats=args.num_repeats, seed=args.seed, batch_size=args.batch_size)
+    print_importances(importances)
+    
+    if args.report_path:
+        with open(args.report_path, "w") as f:
+            json.dump({ "model_path": args.model_path, "num_sequences": len(X), "num_repeats": args.num_repeats, "seed": args.seed, "importances": importances }, f, indent=4)
+        
+        print(f"Report saved to {args.report_path}")
+
+
+if __name__ == "__main__":
+    main()
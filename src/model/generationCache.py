@@ -0,0 +1,300 @@
+import hashlib
+import importlib.metadata
+import json
+import numpy as np
+import os
+import zipfile
+
+
+def get_package_version(package_name : str) -> str:
+    # Read from the package metadata, so librosa does not have to be imported for a cache hit.
+    try:
+        return importlib.metadata.version(package_name)
+    except importlib.metadata.PackageNotFoundError:
+        return None
+
+
+# Describes how compute_frame_features computes the features. Change it whenever the features change,
+# so features cached by an older version are not used anymore. The decoding, resampling, MFCCs and onset
+# strength can change between librosa (and numpy) versions, so an upgrade invalidates the cache as well.
+FEATURE_SPEC = {
+    "version": 1,
+    "sample_rate": "native",
+    "hop_length": 512,
+    "features": [ "mfcc_1", "mfcc_2", "mfcc_3", "mfcc_4", "mfcc_5", "onset_strength", "rms" ],
+    "librosa_version": get_package_version("librosa"),
+    "numpy_version": np.__version__
+}
+
+FEATURE_CACHE_DIR = os.path.join(os.getcwd(), "cache", "features")
+
+# Hashes of the files hashed by this process, by path, size and modification time.
+file_hashes = {}
+
+
+def hash_file(path : str, chunk_size : int = 1 << 20) -> str:
+    """
+    Compute the SHA-256 hash of a file without loading it into memory at once.
+    The hash is only computed once per process as long as the file does not change.
+
+    Args:
+        path (str): _The path to the file._
+        chunk_size (int, optional): _The number of bytes read at once._ Defaults to 1 MiB.
+
+    Returns:
+        str: _The hex digest of the file contents._
+    """
+    stat = os.stat(path)
+    memo_key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    
+    if memo_key in file_hashes:
+        return file_hashes[memo_key]
+    
+    file_hash = hashlib.sha256()
+    
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            file_hash.update(chunk)
+    
+    file_hashes[memo_key] = file_hash.hexdigest()
+    
+    return file_hashes[memo_key]
+
+
+def get_prediction_cache_path(output_path : str) -> str:
+    # The raw predictions are saved next to the .gblf-file of the same generation.
+    return f"{output_path}.predictions.npz"
+
+
+def get_tempo_key_value(value : float) -> float:
+    # An estimated BPM or offset ("auto") is part of the key as None.
+    return None if value is None else float(value)
+
+
+def get_prediction_cache_key(audio_path : str, model_path : str, model_format : str, audio_bpm : float, audio_start_ms : float, note_precision : int, sequence_length : int, window_hop : int, silence_gate_db : float = 0.0) -> dict:
+    """
+    Describe everything the raw predictions of a generation depend on.
+    The post-processing settings are not part of the key, so they can be changed without predicting again.
+
+    Returns:
+        dict: _The cache key (JSON-serializable)._
+    """
+    return {
+        "audio_hash": hash_file(audio_path),
+        "model_hash": hash_file(model_path),
+        "model_format": model_format,
+        "audio_bpm": get_tempo_key_value(audio_bpm),
+        "audio_start_ms": get_tempo_key_value(audio_start_ms),
+        "note_precision": int(note_precision),
+        "sequence_length": int(sequence_length),
+        "window_hop": int(window_hop),
+        "silence_gate_db": float(silence_gate_db)
+    }
+
+
+def save_predictions(cache_path : str, cache_key : dict, raw_predictions : np.ndarray, subbeat_timings : list):
+    """
+    Save the raw per-subbeat predictions and subbeat timings of a generation.
+
+    Args:
+        cache_path (str): _The path of the .npz-file._
+        cache_key (dict): _The key of the predictions (see get_prediction_cache_key)._
+        raw_predictions (np.ndarray): _The raw predictions with the shape (num_subbeats, num_lanes)._
+        subbeat_timings (list): _The subbeat timings in milliseconds._
+    """
+    # Write to a temporary file first, so an interrupted save never leaves a broken cache.
+    with open(cache_path + ".tmp", "wb") as f:
+        np.savez(
+            f,
+            raw_predictions=np.asarray(raw_predictions, dtype=np.float32),
+            subbeat_timings=np.asarray(subbeat_timings, dtype=np.float64),
+            cache_key=np.array(json.dumps(cache_key, sort_keys=True))
+        )
+    
+    os.replace(cache_path + ".tmp", cache_path)
+
+
+def load_predictions(cache_path : str, cache_key : dict) -> tuple:
+    """
+    Load cached raw predictions if they were computed for the same key.
+
+    Args:
+        cache_path (str): _The path of the .npz-file._
+        cache_key (dict): _The key of the requested predictions._
+
+    Returns:
+        tuple: _The raw predictions and subbeat timings, or None if there is no matching cache._
+    """
+    if not os.path.exists(cache_path):
+        return None
+    
+    with np.load(cache_path) as data:
+        if str(data["cache_key"]) != json.dumps(cache_key, sort_keys=True):
+            return None
+        
+        return data["raw_predictions"], data["subbeat_timings"].tolist()
+
+
+def get_feature_cache_key(audio_path : str, audio_bpm : float, audio_start_ms : float, note_precision : int, means : list, stds : list) -> dict:
+    """
+    Describe everything the normalized subbeat features of an audio file depend on.
+
+    Returns:
+        dict: _The cache key (JSON-serializable)._
+    """
+    norm_stats = json.dumps({ "means": [ float(x) for x in means ], "stds": [ float(x) for x in stds ] }, sort_keys=True)
+    
+    return {
+        "audio_hash": hash_file(audio_path),
+        "audio_bpm": get_tempo_key_value(audio_bpm),
+        "audio_start_ms": get_tempo_key_value(audio_start_ms),
+        "note_precision": int(note_precision),
+        "feature_spec": FEATURE_SPEC,
+        "norm_stats_hash": hashlib.sha256(norm_stats.encode("utf-8")).hexdigest()
+    }
+
+
+def get_feature_cache_path(cache_dir : str, cache_key : dict) -> str:
+    # One file per key, named by the hash of the key.
+    key_hash = hashlib.sha256(json.dumps(cache_key, sort_keys=True).encode("utf-8")).hexdigest()
+    
+    return os.path.join(cache_dir, f"{key_hash}.npz")
+
+
+def load_features(cache_dir : str, cache_key : dict) -> tuple:
+    """
+    Load cached features if they were extracted for the same key. A hit marks the entry as recently used.
+
+    Args:
+        cache_dir (str): _The directory of the feature cache._
+        cache_key (dict): _The key of the requested features (see get_feature_cache_key)._
+
+    Returns:
+        tuple: _The normalized features, subbeat timings and tempo, or None if there is no matching cache entry._
+    """
+    cache_path = get_feature_cache_path(cache_dir, cache_key)
+    
+    try:
+        with np.load(cache_path) as data:
+            if str(data["cache_key"]) != json.dumps(cache_key, sort_keys=True):
+                return None
+            
+            features, subbeat_timings, tempo = data["features"], data["subbeat_timings"].tolist(), json.loads(str(data["tempo"]))
+    except (OSError, ValueError, KeyError, EOFError, zipfile.BadZipFile):
+        # Missing, evicted by another process meanwhile or broken.
+        return None
+    
+    # The modification time is the last use of an entry (for the LRU eviction).
+    try:
+        os.utime(cache_path)
+    except FileNotFoundError:
+        pass
+    
+    return features, subbeat_timings, tempo
+
+
+def evict_features(cache_dir : str, max_size_mb : float):
+    """
+    Delete the least recently used entries of the feature cache until it is at most max_size_mb large.
+
+    Args:
+        cache_dir (str): _The directory of the feature cache._
+        max_size_mb (float): _The maximum size of the cache in MiB._
+    """
+    entries = []
+    
+    for file_name in os.listdir(cache_dir):
+        if not file_name.endswith(".npz"):
+            continue
+        
+        try:
+            stat = os.stat(os.path.join(cache_dir, file_name))
+        except FileNotFoundError:
+            continue
+        
+        entries.append((stat.st_mtime, stat.st_size, file_name))
+    
+    total_size = sum(size for _, size, _ in entries)
+    
+    for _, size, file_name in sorted(entries):
+        if total_size <= max_size_mb * 1024 * 1024:
+            break
+        
+        try:
+            os.remove(os.path.join(cache_dir, file_name))
+        except FileNotFoundError:
+            pass
+        
+        total_size -= size
+
+
+def save_features(cache_dir : str, cache_key : dict, features : np.ndarray, subbeat_timings : list, tempo : dict, max_size_mb : float):
+    """
+    Save the normalized subbeat features of an audio file and evict old entries if the cache gets too large.
+
+    Args:
+        cache_dir (str): _The directory of the feature cache._
+        cache_key (dict): _The key of the features (see get_feature_cache_key)._
+        features (np.ndarray): _The normalized features with the shape (num_subbeats, num_features)._
+        subbeat_timings (list): _The subbeat timings in milliseconds._
+        tempo (dict): _The BPM, offset and tempo estimation confidence of the features._
+        max_size_mb (float): _The maximum size of the cache in MiB._
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    cache_path = get_feature_cache_path(cache_dir, cache_key)
+    
+    # Several generations can share the cache, so every process writes its own temporary file.
+    temp_path = f"{cache_path}.{os.getpid()}.tmp"
+    
+    with open(temp_path, "wb") as f:
+        np.savez(
+            f,
+            features=features,
+            subbeat_timings=np.asarray(subbeat_timings, dtype=np.float64),
+            tempo=np.array(json.dumps(tempo)),
+            cache_key=np.array(json.dumps(cache_key, sort_keys=True))
+        )
+    
+    os.replace(temp_path, cache_path)
+    evict_features(cache_dir, max_size_mb)
+
+
+def extract_features_cached(audio_path : str, audio_bpm : float, audio_start_ms : float, note_precision : int, means : list, stds : list, cache_dir : str = FEATURE_CACHE_DIR, max_size_mb : float = 1024) -> tuple:
+    """
+    Extract the normalized features and subbeat timings of an audio file (see extract_features_and_tempo),
+    or load them from the feature cache. On a hit, the audio is neither decoded nor analyzed.
+    A BPM or offset of None is estimated (and cached with the features).
+
+    Args:
+        cache_dir (str, optional): _The directory of the feature cache._ Defaults to FEATURE_CACHE_DIR.
+        max_size_mb (float, optional): _The maximum size of the cache in MiB, 0 disables the cache._ Defaults to 1024.
+
+    Returns:
+        tuple: _Array with the shape (num_subbeats, num_features), the subbeat timings in milliseconds,
+            the tempo (see extract_features_and_tempo) and whether the features were loaded from the cache._
+    """
+    cache_key = None
+    
+    if max_size_mb > 0:
+        cache_key = get_feature_cache_key(audio_path, audio_bpm, audio_start_ms, note_precision, means, stds)
+        cached = load_features(cache_dir, cache_key)
+        
+        if cached is not None:
+            return cached[0], cached[1], cached[2], True
+    
+    # librosa is only imported if the features have to be extracted.
+    from src.model.audioFeatureExtractor import extract_features_and_tempo
+    
+    features, subbeat_timings, tempo = extract_features_and_tempo(
+        audio_path=audio_path,
+        audio_bpm=audio_bpm,
+        audio_start_ms=audio_start_ms,
+        note_precision=note_precision,
+        means=means,
+        stds=stds
+    )
+    
+    if cache_key is not None:
+        save_features(cache_dir, cache_key, features, subbeat_timings, tempo, max_size_mb)
+    
+    return features, subbeat_timings, tempo, False
@@ -0,0 +1,623 @@
+import argparse
+import collections
+import concurrent.futures
+import http.server
+import json
+import multiprocessing
+import numpy as np
+import os
+import shutil
+import socketserver
+import tempfile
+import threading
+import time
+import urllib.parse
+
+from src.export.beatmapExporter import export_to_osz, export_to_qua
+from src.model.batchGenerator import extract_song
+from src.model.generationCache import FEATURE_CACHE_DIR
+from src.model.inferenceBackend import MODEL_FORMATS, load_generation_model, predict_overlapping_windows_batch
+from src.model.predictionPostProcessor import convert_predictions_to_gblf_format
+from src.model.tempoEstimator import parse_tempo_value
+from src.model.variantGenerator import apply_profile, resolve_profiles
+
+
+NORM_STATS_PATH = os.path.join(os.getcwd(), "feature_norm_stats.json")
+
+NUM_LANES = 4
+
+OUTPUT_FORMATS = [ "gblf", "osz", "qua" ]
+
+# Number of latest requests the latency percentiles are computed over.
+LATENCY_WINDOW = 1024
+
+
+def check_file_name(value, field : str) -> str:
+    """
+    Check a request value that becomes part of a file or folder name.
+
+    Raises:
+        ValueError: _The value is not a plain file name (path separators, "..", control characters)._
+
+    Returns:
+        str: _The value._
+    """
+    if not isinstance(value, str) or not value or value in [ ".", ".." ] or os.path.basename(value) != value or "/" in value or "\\" in value:
+        raise ValueError(f"The {field} has to be a plain file name without path separators, got {json.dumps(value)}.")
+    
+    if any(ord(char) < 32 or ord(char) == 127 for char in value):
+        raise ValueError(f"The {field} must not contain control characters, got {json.dumps(value)}.")
+    
+    return value
+
+
+def get_content_disposition(file_name : str) -> str:
+    # The quoted file name is an ASCII fallback, the exact name is sent percent-encoded (RFC 6266).
+    ascii_name = "".join(char if 32 <= ord(char) < 127 and char not in "\"\\" else "_" for char in file_name)
+    
+    return f"attachment; filename=\"{ascii_name}\"; filename*=UTF-8''{urllib.parse.quote(file_name, safe='')}"
+
+
+def get_export_metadata(song : dict, metadata : dict) -> dict:
+    # The timing always comes from the song, everything else can be set by the request.
+    return {
+        "title": song["name"],
+        "artist": "Unknown",
+        "difficulty_name": "Generated",
+        "audio_time_signature": 4,
+        **metadata,
+        "audio_bpm": song["audio_bpm"],
+        "audio_start_ms": song["audio_start_ms"]
+    }
+
+
+class ModelCache:
+    """
+    Keep the most recently used models loaded. A model is reloaded if its file changed since it was loaded.
+    """
+    def __init__(self, capacity : int):
+        self.capacity = max(1, capacity)
+        self.models = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+
+    def get(self, model_path : str, model_format : str):
+        """
+        Return a loaded model, loading it (and evicting the least recently used model) if needed.
+
+        Args:
+            model_path (str): _The path to the model file._
+            model_format (str): _The format / backend of the model (see load_generation_model)._
+
+        Returns:
+            _type_: _A model object that provides a predict() method._
+        """
+        key = (os.path.abspath(model_path), model_format, os.path.getmtime(model_path))
+        
+        with self.lock:
+            if key in self.models:
+                self.hits += 1
+                self.models.move_to_end(key)
+                return self.models[key]
+        
+        # Loading can take seconds, the lock is not held meanwhile (only the inference thread loads models).
+        model = load_generation_model(model_path, model_format=model_format)
+        
+        with self.lock:
+            self.misses += 1
+            self.models[key] = model
+            
+            while len(self.models) > self.capacity:
+                self.models.popitem(last=False)
+                self.evictions += 1
+        
+        return model
+
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            return {
+                "loaded": [ { "model_path": path, "model_format": model_format } for path, model_format, _ in self.models ],
+                "capacity": self.capacity,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions
+            }
+
+
+class InferenceBatcher:
+    """
+    Run the model predictions of all requests in a single inference thread. Requests for the same
+    model that arrive within max_wait_ms of the oldest waiting request are predicted in one predict call.
+    """
+    def __init__(self, model_cache : ModelCache, max_wait_ms : float, max_batch_songs : int, inference_batch_size : int):
+        """
+        Args:
+            model_cache (ModelCache): _The cache the models are taken from._
+            max_wait_ms (float): _How long the oldest waiting request waits for more requests to share its predict call._
+            max_batch_songs (int): _The maximum number of requests predicted in one predict call._
+            inference_batch_size (int): _The amount of windows per model batch._
+        """
+        self.model_cache = model_cache
+        self.max_wait_s = max_wait_ms / 1000
+        self.max_batch_songs = max(1, max_batch_songs)
+        self.inference_batch_size = inference_batch_size
+        
+        self.condition = threading.Condition()
+        self.pending = []
+        self.running = True
+        
+        # Number of requests of every predict call.
+        self.batch_sizes = collections.deque(maxlen=LATENCY_WINDOW)
+        self.num_batches = 0
+        
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+
+    def submit(self, model_path : str, model_format : str, sequence_length : int, window_hop : int, features : np.ndarray) -> concurrent.futures.Future:
+        """
+        Queue the features of a song for prediction.
+
+        Args:
+            model_path (str): _The path to the model file._
+            model_format (str): _The format / backend of the model._
+            sequence_length (int): _The sequence length of the model (0 = from the model)._
+            window_hop (int): _The distance in subbeats between the starts of two windows (0 = half a sequence)._
+            features (np.ndarray): _Subbeat features with the shape (num_subbeats, num_features)._
+
+        Returns:
+            concurrent.futures.Future: _Resolves to the raw predictions with the shape (num_subbeats, num_lanes)._
+        """
+        future = concurrent.futures.Future()
+        
+        with self.condition:
+            self.pending.append(((model_path, model_format, sequence_length, window_hop), features, future, time.perf_counter()))
+            self.condition.notify()
+        
+        return future
+
+
+    def get_queue_depth(self) -> int:
+        with self.condition:
+            return len(self.pending)
+
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+        
+        self.thread.join()
+
+
+    def take_batch(self) -> list:
+        # Wait for the first request, then up to max_wait_s (from its arrival) for more requests of the same model.
+        with self.condition:
+            while self.running and not self.pending:
+                self.condition.wait()
+            
+            if not self.pending:
+                return []
+            
+            key = self.pending[0][0]
+            deadline = self.pending[0][3] + self.max_wait_s
+            
+            while self.running and sum(item[0] == key for item in self.pending) < self.max_batch_songs:
+                remaining = deadline - time.perf_counter()
+                
+                if remaining <= 0:
+                    break
+                
+                self.condition.wait(remaining)
+            
+            batch = [ item for item in self.pending if item[0] == key ][:self.max_batch_songs]
+            batch_ids = { id(item) for item in batch }
+            self.pending = [ item for item in self.pending if id(item) not in batch_ids ]
+        
+        return batch
+
+
+    def run(self):
+        while True:
+            batch = self.take_batch()
+            
+            if not batch:
+                return
+            
+            (model_path, model_format, sequence_length, window_hop) = batch[0][0]
+            
+            try:
+                model = self.model_cache.get(model_path, model_format)
+                
+                # Keras and NumPy models know their sequence length, TFLite models need it in the request.
+                input_shape = getattr(model, "input_shape", None)
+                sequence_length = sequence_length or (input_shape[1] if input_shape is not None else 0)
+                
+                if not sequence_length:
+                    raise ValueError(f"The sequence length of {model_path} is unknown, pass sequence_length.")
+                
+                window_hop = window_hop if window_hop > 0 else max(1, sequence_length // 2)
+                predictions = predict_overlapping_windows_batch(model, [ item[1] for item in batch ], sequence_length, window_hop, batch_size=self.inference_batch_size)
+            except Exception as e:
+                for item in batch:
+                    item[2].set_exception(e)
+                continue
+            
+            with self.condition:
+                self.batch_sizes.append(len(batch))
+                self.num_batches += 1
+            
+            for item, raw_predictions in zip(batch, predictions):
+                item[2].set_result(raw_predictions)
+
+
+class ServiceMetrics:
+    """
+    Count the requests of the service and keep the latencies of the latest requests per stage.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.start_time = time.time()
+        self.num_requests = 0
+        self.num_failed = 0
+        self.in_flight = 0
+        self.latencies = collections.defaultdict(lambda: collections.deque(maxlen=LATENCY_WINDOW))
+
+
+    def begin_request(self):
+        with self.lock:
+            self.num_requests += 1
+            self.in_flight += 1
+
+
+    def end_request(self, stage_times : dict, failed : bool):
+        with self.lock:
+            self.in_flight -= 1
+            
+            if failed:
+                self.num_failed += 1
+                return
+            
+            for stage, seconds in stage_times.items():
+                self.latencies[stage].append(seconds * 1000)
+
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            latency_stats = {
+                stage: {
+                    "p50_ms": float(np.percentile(values, 50)),
+                    "p90_ms": float(np.percentile(values, 90)),
+                    "p99_ms": float(np.percentile(values, 99)),
+                    "max_ms": float(np.max(values)),
+                    "count": len(values)
+                }
+                for stage, values in self.latencies.items() if values
+            }
+            
+            return {
+                "uptime_s": time.time() - self.start_time,
+                "requests": self.num_requests,
+                "failed_requests": self.num_failed,
+                "requests_in_flight": self.in_flight,
+                "latency": latency_stats
+            }
+
+
+class GenerationService:
+    """
+    Generate levels for requests of the HTTP handler: the features are extracted in a process pool,
+    the predictions are batched by the InferenceBatcher and the post-processing runs in the request thread.
+    """
+    def __init__(self, args):
+        with open(NORM_STATS_PATH, "r") as f:
+            self.stats = json.load(f)
+        
+        self.args = args
+        self.metrics = ServiceMetrics()
+        self.model_cache = ModelCache(args.max_models)
+        self.batcher = InferenceBatcher(self.model_cache, args.max_wait_ms, args.max_batch_songs, args.inference_batch_size)
+        
+        # Spawned workers do not inherit the TensorFlow runtime of the service.
+        self.feature_executor = None
+        
+        if args.feature_workers > 0:
+            mp_context = multiprocessing.get_context("spawn")
+            self.feature_executor = concurrent.futures.ProcessPoolExecutor(max_workers=args.feature_workers, mp_context=mp_context)
+
+
+    def close(self):
+        self.batcher.stop()
+        
+        if self.feature_executor is not None:
+            self.feature_executor.shutdown()
+
+
+    def parse_request(self, request : dict) -> tuple:
+        """
+        Validate a generation request and fill in the defaults of the service.
+
+        Raises:
+            ValueError: _The request is missing a field or has an invalid value._
+            FileNotFoundError: _The audio or model file does not exist._
+
+        Returns:
+            tuple: _The song (see load_manifest), the model settings, the post-processing profile and the output settings._
+        """
+        if not request.get("audio_path") or not request.get("audio_bpm"):
+            raise ValueError("A generation request needs an audio_path and an audio_bpm.")
+        
+        song = {
+            "audio_path": request["audio_path"],
+            "audio_bpm": parse_tempo_value(request["audio_bpm"]),
+            "audio_start_ms": parse_tempo_value(request.get("audio_start_ms") or 0),
+            "name": check_file_name(request.get("name") or os.path.splitext(os.path.basename(request["audio_path"]))[0], "name")
+        }
+        
+        # The exporters use the title, artist and difficulty name in file and folder names.
+        metadata = request.get("metadata") or {}
+        
+        if not isinstance(metadata, dict):
+            raise ValueError("The metadata has to be a JSON object.")
+        
+        for key in [ "title", "artist", "difficulty_name" ]:
+            if key in metadata:
+                check_file_name(metadata[key], f"metadata {key}")
+        
+        model_settings = {
+            "model_path": request.get("model_path") or self.args.model_path,
+            "model_format": request.get("model_format") or self.args.model_format,
+            "sequence_length": int(request.get("sequence_length") or 0),
+            "window_hop": int(request.get("window_hop") or 0)
+        }
+        
+        if model_settings["model_format"] not in MODEL_FORMATS:
+            raise ValueError(f"Unsupported model format '{model_settings['model_format']}'. Supported formats: {MODEL_FORMATS}")
+        
+        for path in [ song["audio_path"], model_settings["model_path"] ]:
+            if not os.path.isfile(path):
+                raise FileNotFoundError(f"{path} does not exist on the machine of the service.")
+        
+        # Like levelGenerator, the automatic threshold is used unless the request turns it off.
+        profile = resolve_profiles([ dict(request.get("post_processing") or {}, name=song["name"]) ], defaults={ "use_auto_threshold": True })[0]
+        
+        output_format = request.get("output", "gblf")
+        
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError(f"Unsupported output '{output_format}'. Supported outputs: {OUTPUT_FORMATS}")
+        
+        return song, model_settings, profile, output_format
+
+
+    def generate(self, request : dict) -> tuple:
+        """
+        Generate the level of one request.
+
+        Returns:
+            tuple: _The response body (bytes), its content type, its file name, the time of every stage in seconds
+                and the tempo of the level (see extract_features_and_tempo)._
+        """
+        song, model_settings, profile, output_format = self.parse_request(request)
+        note_precision = int(request.get("note_precision") or 2)
+        stage_times = {}
+        
+        start_time = time.perf_counter()
+        
+        extract_args = (song, note_precision, self.stats["means"], self.stats["stds"], self.args.feature_cache_dir, self.args.feature_cache_size_mb)
+        
+        if self.feature_executor is not None:
+            features, subbeat_timings, tempo = self.feature_executor.submit(extract_song, *extract_args).result()
+        else:
+            features, subbeat_timings, tempo = extract_song(*extract_args)
+        
+        # An estimated BPM and offset are used for the export.
+        song.update(audio_bpm=tempo["audio_bpm"], audio_start_ms=tempo["audio_start_ms"])
+        
+        stage_times["features"] = time.perf_counter() - start_time
+        
+        stage_start = time.perf_counter()
+        raw_predictions = self.batcher.submit(features=features, **model_settings).result()
+        stage_times["inference"] = time.perf_counter() - stage_start
+        
+        stage_start = time.perf_counter()
+        binary_preds = apply_profile(raw_predictions, profile, NUM_LANES)
+        gblf_contents = convert_predictions_to_gblf_format(
+            raw_predictions=raw_predictions,
+            post_processed_predictions=binary_preds,
+            subbeat_timings=subbeat_timings
+        )
+        stage_times["post_processing"] = time.perf_counter() - stage_start
+        
+        if output_format == "gblf":
+            body, content_type, file_name = gblf_contents.encode("utf-8"), "text/plain; charset=utf-8", f"{song['name']}.gblf"
+        else:
+            stage_start = time.perf_counter()
+            body, content_type, file_name = self.export(song, gblf_contents, output_format, request.get("metadata") or {})
+            stage_times["export"] = time.perf_counter() - stage_start
+        
+        stage_times["total"] = time.perf_counter() - start_time
+        
+        return body, content_type, file_name, stage_times, tempo
+
+
+    def export(self, song : dict, gblf_contents : str, output_format : str, metadata : dict) -> tuple:
+        # The exporters work on files, so the level is exported in a temporary directory and sent as one archive.
+        metadata = get_export_metadata(song, metadata)
+        
+        with tempfile.TemporaryDirectory() as temp_dir:
+            beatmap_file_path = os.path.join(temp_dir, f"{song['name']}.gblf")
+            
+            with open(beatmap_file_path, "w", encoding="utf-8") as f:
+                f.write(gblf_contents)
+            
+            export_dir = os.path.join(temp_dir, "export")
+            os.makedirs(export_dir)
+            
+            if output_format == "osz":
+                export_to_osz(song["audio_path"], beatmap_file_path, export_dir, metadata)
+                archive_path = os.path.join(export_dir, f"{song['name']}.osz")
+                file_name = f"{song['name']}.osz"
+            else:
+                # The .qua-file and the audio are exported into a folder, which is sent as a .zip-file.
+                export_to_qua(song["audio_path"], beatmap_file_path, export_dir, metadata)
+                archive_path = shutil.make_archive(os.path.join(temp_dir, song["name"]), format="zip", root_dir=export_dir)
+                file_name = f"{song['name']}.zip"
+            
+            with open(archive_path, "rb") as f:
+                return f.read(), "application/zip", file_name
+
+
+    def get_metrics(self) -> dict:
+        metrics = self.metrics.get_stats()
+        
+        with self.batcher.condition:
+            batch_sizes = list(self.batcher.batch_sizes)
+            num_batches = self.batcher.num_batches
+        
+        metrics["queue_depth"] = self.batcher.get_queue_depth()
+        metrics["inference_batches"] = num_batches
+        metrics["mean_songs_per_batch"] = float(np.mean(batch_sizes)) if batch_sizes else 0.0
+        metrics["model_cache"] = self.model_cache.get_stats()
+        
+        return metrics
+
+
+class GenerationRequestHandler(http.server.BaseHTTPRequestHandler):
+    """
+    POST /generate: generate a level (JSON request, see README), responds with the .gblf-, .osz- or .zip-file.
+    GET /metrics: latency percentiles per stage, queue depth, batching and model cache stats (JSON).
+    GET /health: responds with {"status": "ok"}.
+    """
+    service = None
+
+
+    def send_body(self, status : int, body : bytes, content_type : str, headers : dict = None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        
+        self.end_headers()
+        self.wfile.write(body)
+
+
+    def send_json(self, status : int, data : dict):
+        self.send_body(status, json.dumps(data, indent=4).encode("utf-8"), "application/json")
+
+
+    def do_GET(self):
+        if self.path == "/metrics":
+            self.send_json(200, self.service.get_metrics())
+        elif self.path == "/health":
+            self.send_json(200, { "status": "ok" })
+        else:
+            self.send_json(404, { "error": f"Unknown path {self.path}." })
+
+
+    def do_POST(self):
+        if self.path != "/generate":
+            self.send_json(404, { "error": f"Unknown path {self.path}." })
+            return
+        
+        self.service.metrics.begin_request()
+        stage_times, failed = {}, True
+        
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+            
+            if not isinstance(request, dict):
+                raise ValueError("The request has to be a JSON object.")
+            
+            body, content_type, file_name, stage_times, tempo = self.service.generate(request)
+            failed = False
+        except (ValueError, FileNotFoundError) as e:
+            self.send_json(400, { "error": str(e) })
+        except Exception as e:
+            self.send_json(500, { "error": f"{type(e).__name__}: {e}" })
+        finally:
+            self.service.metrics.end_request(stage_times, failed)
+        
+        if not failed:
+            headers = {
+                "Content-Disposition": get_content_disposition(file_name),
+                "X-Audio-BPM": str(tempo["audio_bpm"]),
+                "X-Audio-Start-Ms": str(tempo["audio_start_ms"])
+            }
+            
+            # The confidence is only known if the BPM or offset was estimated.
+            if tempo["confidence"] is not None:
+                headers["X-Tempo-Confidence"] = f"{tempo['confidence']:.3f}"
+            
+            self.send_body(200, body, content_type, headers)
+
+
+    def log_message(self, format, *args):
+        if not self.service.args.quiet:
+            print(f"[{time.strftime('%H:%M:%S')}] {format % args}")
+
+
+class ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+    def get_request(self):
+        # BaseHTTPRequestHandler expects a (host, port) client address.
+        request, _ = super().get_request()
+        return request, ("unix", 0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Keep generation models loaded and serve level generation requests over HTTP.")
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--unix_socket", type=str, default="")
+    parser.add_argument("--model_path", type=str, default=os.path.join(os.getcwd(), "models", "model-3-4_stars-P4-S128-V3.keras"))
+    parser.add_argument("--model_format", type=str, default="keras", choices=MODEL_FORMATS)
+    parser.add_argument("--max_models", type=int, default=2)
+    parser.add_argument("--max_wait_ms", type=float, default=20)
+    parser.add_argument("--max_batch_songs", type=int, default=16)
+    parser.add_argument("--inference_batch_size", type=int, default=256)
+    parser.add_argument("--feature_workers", type=int, default=os.cpu_count())
+    parser.add_argument("--feature_cache_dir", type=str, default=FEATURE_CACHE_DIR)
+    parser.add_argument("--feature_cache_size_mb", type=float, default=1024)
+    parser.add_argument("--preload", action="store_true")
+    parser.add_argument("--quiet", action="store_true")
+    args = parser.parse_args()
+    
+    service = GenerationService(args)
+    GenerationRequestHandler.service = service
+    
+    if args.preload:
+        service.model_cache.get(args.model_path, args.model_format)
+        print(f"Loaded {args.model_path}.")
+    
+    if args.unix_socket:
+        if os.path.exists(args.unix_socket):
+            os.remove(args.unix_socket)
+        
+        server = ThreadingUnixHTTPServer(args.unix_socket, GenerationRequestHandler)
+        print(f"Generation service listening on {args.unix_socket}.")
+    else:
+        server = http.server.ThreadingHTTPServer((args.host, args.port), GenerationRequestHandler)
+        print(f"Generation service listening on http://{args.host}:{args.port}.")
+    
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("Stopping the generation service.")
+    finally:
+        server.server_close()
+        service.close()
+        
+        if args.unix_socket and os.path.exists(args.unix_socket):
+            os.remove(args.unix_socket)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,299 @@
+import argparse
+import concurrent.futures
+import csv
+import glob
+import json
+import math
+import multiprocessing
+import numpy as np
+import os
+import tensorflow as tf
+import time
+
+from keras.callbacks import EarlyStopping
+from keras.losses import BinaryFocalCrossentropy
+from keras.metrics import BinaryCrossentropy, Precision, Recall
+from src.data_utils.dataSequenceLoader import get_difficulty_dataset, get_sequence_file_pattern
+from src.model.lstmManiaModel import build_lstm_model
+from src.model.trainingCallbacks import AshaPruningCallback
+
+
+SEQUENCES_ROOT = os.path.join(os.getcwd(), "data", "sequences")
+
+# Search space that is used if no --search_space file is given.
+DEFAULT_SEARCH_SPACE = {
+    "sequence_length": [ 32, 64, 128 ],
+    "lstm_units": [ "256,128", "128,64", "64,32" ],
+    "dense_units": [ 32, 64 ],
+    "focal_gamma": { "min": 1.0, "max": 3.0 },
+    "dropout": { "min": 0.1, "max": 0.4 },
+    "batch_size": [ 32, 64, 128 ]
+}
+
+
+def sample_trial_params(search_space : dict, rng : np.random.Generator) -> dict:
+    """
+    Sample one set of hyperparameters from a search space.
+
+    Args:
+        search_space (dict): _Parameter name -> list of choices, or dict with "min" and "max"
+            (uniform, or log-uniform if "log" is true)._
+        rng (np.random.Generator): _The random generator of the sweep._
+
+    Returns:
+        dict: _The sampled hyperparameters._
+    """
+    params = {}
+    
+    for name, space in search_space.items():
+        if isinstance(space, list):
+            params[name] = space[rng.integers(len(space))]
+        elif space.get("log", False):
+            params[name] = float(math.exp(rng.uniform(math.log(space["min"]), math.log(space["max"]))))
+        else:
+            params[name] = float(rng.uniform(space["min"], space["max"]))
+    
+    return params
+
+
+def get_rung_epochs(min_epochs : int, max_epochs : int, reduction_factor : int) -> list:
+    """
+    Compute the epochs at which trials are compared (min_epochs * reduction_factor^k).
+
+    Args:
+        min_epochs (int): _The epochs every trial trains for at least._
+        max_epochs (int): _The epochs of a trial that is never pruned._
+        reduction_factor (int): _The growth of the rungs._
+
+    Returns:
+        list: _The rung epochs (below max_epochs)._
+    """
+    rungs = []
+    epochs = min_epochs
+    
+    while epochs < max_epochs:
+        rungs.append(epochs)
+        epochs *= reduction_factor
+    
+    return rungs
+
+
+def init_worker(threads_per_trial : int):
+    """
+    Limit the threads of a worker process before TensorFlow executes any operation,
+    so that the parallel trials do not oversubscribe the CPU.
+    """
+    if threads_per_trial > 0:
+        tf.config.threading.set_intra_op_parallelism_threads(threads_per_trial)
+        tf.config.threading.set_inter_op_parallelism_threads(1)
+
+
+def run_trial(trial_id : int, params : dict, settings : dict, rung_results, lock) -> dict:
+    """
+    Train one model of the sweep on the existing sequence shards.
+
+    Args:
+        trial_id (int): _The id of the trial._
+        params (dict): _The hyperparameters of the trial._
+        settings (dict): _The settings shared by all trials (difficulty, epochs, steps, rungs, ...)._
+        rung_results (_type_): _Shared ASHA rung results._
+        lock (_type_): _Shared lock for the rung results._
+
+    Returns:
+        dict: _The result of the trial._
+    """
+    tf.keras.backend.clear_session()
+    tf.random.set_seed(settings["seed"] + trial_id)
+    
+    sequence_length = int(params.get("sequence_length", settings["stored_sequence_length"]))
+    batch_size = int(params.get("batch_size", 64))
+    lstm_units = tuple(int(units) for units in str(params.get("lstm_units", "256,128")).split(","))
+    dropout = float(params.get("dropout", 0.3))
+    
+    result = { "trial": trial_id, **params, "status": "completed", "epochs": 0, "best_val_bce": float("nan"), "final_val_bce": float("nan"), "best_val_loss": float("nan"), "final_val_loss": float("nan"), "train_time_s": 0.0 }
+    start_time = time.perf_counter()
+    
+    try:
+        datasets = []
+        
+        # Shorter sequence lengths are cut out of the stored sequences, so every trial reads the same shards.
+        for split in [ "train", "test" ]:
+            ds = get_difficulty_dataset(
+                sequences_root=settings["sequences_root"],
+                difficulty=settings["difficulty"],
+                split=split,
+                batch_size=batch_size,
+                seed=settings["seed"] + trial_id,
+                crop_length=sequence_length
+            )
+            datasets.append(ds.map(lambda batch: (batch[:, :, :7], batch[:, :, 7:])))
+        
+        model = build_lstm_model(
+            input_shape=(sequence_length, 7),
+            output_dim=4,
+            lstm_units=lstm_units,
+            dense_units=int(params.get("dense_units", 64)),
+            loss=BinaryFocalCrossentropy(gamma=float(params.get("focal_gamma", 2.0))),
+            dropout=(dropout, dropout),
+            # The focal loss shrinks as gamma grows, so trials are compared on the plain binary crossentropy.
+            metrics=[ Precision(), Recall(), BinaryCrossentropy(name="bce") ]
+        )
+        
+        pruning_callback = AshaPruningCallback(
+            trial_id=trial_id,
+            rung_epochs=settings["rung_epochs"],
+            rung_results=rung_results,
+            lock=lock,
+            reduction_factor=settings["reduction_factor"],
+            monitor="val_bce"
+        )
+        
+        history = model.fit(
+            datasets[0],
+            validation_data=datasets[1],
+            epochs=settings["max_epochs"],
+            steps_per_epoch=settings["steps_per_epoch"],
+            validation_steps=settings["validation_steps"],
+            callbacks=[ EarlyStopping(monitor="val_bce", patience=settings["patience"]), pruning_callback ],
+            verbose=0
+        )
+        
+        val_bces = history.history.get("val_bce", [])
+        val_losses = history.history.get("val_loss", [])
+        result["epochs"] = len(val_bces)
+        
+        if val_bces:
+            result["best_val_bce"] = float(np.min(val_bces))
+            result["final_val_bce"] = float(val_bces[-1])
+        
+        # The loss depends on focal_gamma and is only saved for reference.
+        if val_losses:
+            result["best_val_loss"] = float(np.min(val_losses))
+            result["final_val_loss"] = float(val_losses[-1])
+        
+        if pruning_callback.pruned_at_epoch is not None:
+            result["status"] = f"pruned@{pruning_callback.pruned_at_epoch}"
+    except Exception as e:
+        result["status"] = f"failed: {e}"
+    
+    result["train_time_s"] = time.perf_counter() - start_time
+    
+    return result
+
+
+def write_results(results : list, results_path : str):
+    """
+    Write the results of all finished trials to a .csv-file, sorted by the best validation binary crossentropy.
+
+    Args:
+        results (list): _The results of the finished trials._
+        results_path (str): _The path of the .csv-file._
+    """
+    fieldnames = []
+    
+    for result in results:
+        fieldnames += [ key for key in result if key not in fieldnames ]
+    
+    sorted_results = sorted(results, key=lambda result: result["best_val_bce"] if not math.isnan(result["best_val_bce"]) else math.inf)
+    
+    with open(results_path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames)
+        writer.writeheader()
+        writer.writerows(sorted_results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a parallel hyperparameter sweep with ASHA pruning on the existing sequence shards.")
+    parser.add_argument("--search_space", type=str, default="")
+    parser.add_argument("--difficulty_range", type=str, default="3-4_stars")
+    parser.add_argument("--num_trials", type=int, default=12)
+    parser.add_argument("--max_parallel", type=int, default=2)
+    parser.add_argument("--threads_per_trial", type=int, default=0)
+    parser.add_argument("--cpu_only", action="store_true")
+    parser.add_argument("--min_epochs", type=int, default=1)
+    parser.add_argument("--max_epochs", type=int, default=27)
+    parser.add_argument("--reduction_factor", type=int, default=3)
+    parser.add_argument("--patience", type=int, default=5)
+    parser.add_argument("--steps_per_epoch", type=int, default=200)
+    parser.add_argument("--validation_steps", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--results_path", type=str, default="")
+    args = parser.parse_args()
+    
+    search_space = DEFAULT_SEARCH_SPACE
+    
+    if args.search_space:
+        with open(args.search_space, "r") as f:
+            search_space = json.load(f)
+    
+    # The stored sequence length is the longest length a trial can use.
+    shard_files = sorted(glob.glob(get_sequence_file_pattern(SEQUENCES_ROOT, args.difficulty_range, "train")))
+    
+    if not shard_files:
+        raise FileNotFoundError(f"No training sequences found for difficulty {args.difficulty_range} in {SEQUENCES_ROOT}.")
+    
+    stored_sequence_length = np.load(shard_files[0], mmap_mode='r').shape[1]
+    
+    for sequence_length in search_space.get("sequence_length", []):
+        if sequence_length > stored_sequence_length:
+            raise ValueError(f"Sequence length {sequence_length} is longer than the stored sequences ({stored_sequence_length}).")
+    
+    rng = np.random.default_rng(args.seed)
+    trials = [ sample_trial_params(search_space, rng) for _ in range(args.num_trials) ]
+    
+    settings = {
+        "sequences_root": SEQUENCES_ROOT,
+        "difficulty": args.difficulty_range,
+        "stored_sequence_length": int(stored_sequence_length),
+        "max_epochs": args.max_epochs,
+        "steps_per_epoch": args.steps_per_epoch,
+        "validation_steps": args.validation_steps,
+        "patience": args.patience,
+        "reduction_factor": args.reduction_factor,
+        "rung_epochs": get_rung_epochs(args.min_epochs, args.max_epochs, args.reduction_factor),
+        "seed": args.seed
+    }
+    
+    results_path = args.results_path or os.path.join(os.getcwd(), "logs", "sweeps", f"sweep_{time.strftime('%Y%m%d-%H%M%S')}.csv")
+    os.makedirs(os.path.dirname(results_path), exist_ok=True)
+    
+    print(f"Running {len(trials)} trials ({args.max_parallel} in parallel, rungs at epochs {settings['rung_epochs']}).")
+    
+    # Trials run in spawned processes, so every worker gets a fresh TensorFlow runtime with its own thread limits.
+    # The environment is inherited by the workers.
+    if args.cpu_only:
+        os.environ["CUDA_VISIBLE_DEVICES"] = "-1"
+    
+    if args.threads_per_trial > 0:
+        os.environ["OMP_NUM_THREADS"] = str(args.threads_per_trial)
+    
+    mp_context = multiprocessing.get_context("spawn")
+    manager = mp_context.Manager()
+    rung_results = manager.dict()
+    lock = manager.Lock()
+    results = []
+    
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=args.max_parallel,
+        mp_context=mp_context,
+        initializer=init_worker,
+        initargs=(args.threads_per_trial,)
+    ) as executor:
+        futures = [ executor.submit(run_trial, trial_id, params, settings, rung_results, lock) for trial_id, params in enumerate(trials) ]
+        
+        for future in concurrent.futures.as_completed(futures):
+            result = future.result()
+            results.append(result)
+            
+            print(f"Trial {result['trial']} {result['status']} after {result['epochs']} epochs: best val_bce {result['best_val_bce']:.5f} ({result['train_time_s']:.0f} s)")
+            
+            # Rewrite the table after every trial, so an interrupted sweep keeps its results.
+            write_results(results, results_path)
+    
+    best = min(results, key=lambda result: result["best_val_bce"] if not math.isnan(result["best_val_bce"]) else math.inf)
+    print(f"Best trial: {best['trial']} (val_bce {best['best_val_bce']:.5f}) {json.dumps({ name: best[name] for name in search_space })}")
+    print(f"Results saved to {results_path}")
+
+
+if __name__ == "__main__":
+    main()
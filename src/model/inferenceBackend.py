@@ -0,0 +1,262 @@
+import numpy as np
+import time
+
+
+MODEL_FORMATS = [ "keras", "tflite", "numpy" ]
+
+# Column of the RMS in the subbeat features (5 MFCCs, onset strength, RMS).
+RMS_FEATURE_IDX = 6
+
+
+class TFLiteModel:
+    """
+    Minimal wrapper around a TFLite interpreter that mimics the predict()
+    method of a Keras model, so it can be used as a drop-in replacement for generation.
+    """
+    def __init__(self, model_path : str, num_threads : int = None):
+        # Prefer the lightweight TFLite runtime and fall back to the interpreter bundled with TensorFlow.
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            import tensorflow as tf
+            Interpreter = tf.lite.Interpreter
+        
+        self.interpreter = Interpreter(model_path=model_path, num_threads=num_threads)
+        self.input_index = self.interpreter.get_input_details()[0]["index"]
+        self.output_index = self.interpreter.get_output_details()[0]["index"]
+        self.input_shape = None
+
+
+    def predict(self, features : np.ndarray, batch_size : int = 256, verbose : int = 0) -> np.ndarray:
+        """
+        Run the TFLite model on a batch of sequences.
+
+        Args:
+            features (np.ndarray): _Input sequences with the shape (num_sequences, sequence_length, num_features)._
+            batch_size (int, optional): _The amount of sequences per interpreter invocation._ Defaults to 256.
+            verbose (int, optional): _Unused, only kept for compatibility with keras.Model.predict()._ Defaults to 0.
+
+        Returns:
+            np.ndarray: _The model outputs with the shape (num_sequences, sequence_length, num_lanes)._
+        """
+        outputs = []
+        
+        for start in range(0, len(features), batch_size):
+            batch = np.ascontiguousarray(features[start:start + batch_size], dtype=np.float32)
+            
+            # Only reallocate the tensors if the batch shape changes (usually just for the last batch).
+            if batch.shape != self.input_shape:
+                self.interpreter.resize_tensor_input(self.input_index, batch.shape)
+                self.interpreter.allocate_tensors()
+                self.input_shape = batch.shape
+            
+            self.interpreter.set_tensor(self.input_index, batch)
+            self.interpreter.invoke()
+            outputs.append(np.copy(self.interpreter.get_tensor(self.output_index)))
+        
+        return np.concatenate(outputs, axis=0)
+
+
+def load_generation_model(model_path : str, model_format : str = "keras"):
+    """
+    Load a trained model for generation.
+
+    Args:
+        model_path (str): _The path to the model file._
+        model_format (str, optional): _The format / backend of the model ("keras", "tflite" or "numpy").
+            "numpy" runs a .keras-file without TensorFlow._ Defaults to "keras".
+
+    Raises:
+        ValueError: _The model format is not supported._
+
+    Returns:
+        _type_: _A model object that provides a predict() method._
+    """
+    if model_format == "keras":
+        import tensorflow as tf
+        return tf.keras.models.load_model(model_path, compile=False)
+    elif model_format == "tflite":
+        return TFLiteModel(model_path)
+    elif model_format == "numpy":
+        from src.model.numpyInference import NumpyModel
+        return NumpyModel(model_path)
+    
+    raise ValueError(f"Unsupported model format '{model_format}'. Supported formats: {MODEL_FORMATS}")
+
+
+def build_inference_windows(features : np.ndarray, sequence_length : int, hop : int) -> tuple:
+    """
+    Split the subbeat features of a song into (overlapping) windows of the model sequence length.
+    The last window always ends at the last subbeat, so every subbeat is covered by at least one window.
+
+    Args:
+        features (np.ndarray): _Subbeat features with the shape (num_subbeats, num_features)._
+        sequence_length (int): _The sequence length of the model._
+        hop (int): _The distance in subbeats between the starts of two consecutive windows.
+            Values above sequence_length are clamped, so that no subbeat is skipped._
+
+    Returns:
+        tuple: _The windows with the shape (num_windows, sequence_length, num_features)
+            and the start subbeat of every window._
+    """
+    # Songs shorter than a single window are padded with zeros (= mean feature values).
+    if len(features) < sequence_length:
+        features = np.concatenate([ features, np.zeros((sequence_length - len(features), features.shape[1]), dtype=features.dtype) ])
+    
+    last_start = len(features) - sequence_length
+    starts = np.arange(0, last_start + 1, min(max(1, hop), sequence_length))
+    
+    if starts[-1] != last_start:
+        starts = np.append(starts, last_start)
+    
+    windows = features[starts[:, None] + np.arange(sequence_length)]
+    
+    return windows, starts
+
+
+def stitch_window_predictions(window_preds : np.ndarray, starts : np.ndarray, num_subbeats : int) -> np.ndarray:
+    """
+    Stitch the predictions of overlapping windows back into one prediction per subbeat.
+    Overlapping predictions are averaged with a Hann window, so predictions
+    from the center of a window (with context on both sides) weigh more than those at its edges.
+
+    Args:
+        window_preds (np.ndarray): _Predictions with the shape (num_windows, sequence_length, num_lanes)._
+        starts (np.ndarray): _The start subbeat of every window._
+        num_subbeats (int): _The number of subbeats of the song._
+
+    Returns:
+        np.ndarray: _The stitched predictions with the shape (num_subbeats, num_lanes)._
+    """
+    sequence_length = window_preds.shape[1]
+    num_positions = max(num_subbeats, int(starts[-1]) + sequence_length)
+    
+    # Strictly positive weights, so that subbeats only covered by a window edge still get a prediction.
+    weights = np.hanning(sequence_length + 2)[1:-1]
+    idxs = (starts[:, None] + np.arange(sequence_length)).ravel()
+    
+    weight_sums = np.bincount(idxs, weights=np.tile(weights, len(starts)), minlength=num_positions)
+    stitched = np.stack([
+        np.bincount(idxs, weights=(window_preds[..., lane] * weights).ravel(), minlength=num_positions)
+        for lane in range(window_preds.shape[-1])
+    ], axis=-1)
+    
+    # Subbeats without any window (only if windows were skipped) are predicted as 0.
+    stitched = np.divide(stitched, weight_sums[:, None], out=np.zeros_like(stitched), where=weight_sums[:, None] > 0)
+    
+    return stitched[:num_subbeats].astype(window_preds.dtype)
+
+
+def predict_overlapping_windows(model, features : np.ndarray, sequence_length : int, hop : int, batch_size : int = 256) -> np.ndarray:
+    """
+    Predict every subbeat of a song with overlapping windows in a single (batched) predict call.
+
+    Args:
+        model (_type_): _A model object that provides a predict() method._
+        features (np.ndarray): _Subbeat features with the shape (num_subbeats, num_features)._
+        sequence_length (int): _The sequence length of the model._
+        hop (int): _The distance in subbeats between the starts of two consecutive windows._
+        batch_size (int, optional): _The amount of windows per model batch._ Defaults to 256.
+
+    Returns:
+        np.ndarray: _The predictions with the shape (num_subbeats, num_lanes)._
+    """
+    windows, starts = build_inference_windows(features, sequence_length, hop)
+    window_preds = model.predict(windows, batch_size=batch_size, verbose=0)
+    
+    return stitch_window_predictions(window_preds, starts, len(features))
+
+
+def predict_overlapping_windows_batch(model, features_list : list, sequence_length : int, hop : int, batch_size : int = 256) -> list:
+    """
+    Predict several songs at once: the windows of all songs are packed into a single (batched)
+    predict call and stitched back per song afterwards.
+
+    Args:
+        model (_type_): _A model object that provides a predict() method._
+        features_list (list): _Subbeat features of every song with the shape (num_subbeats, num_features)._
+        sequence_length (int): _The sequence length of the model._
+        hop (int): _The distance in subbeats between the starts of two consecutive windows._
+        batch_size (int, optional): _The amount of windows per model batch._ Defaults to 256.
+
+    Returns:
+        list: _The predictions of every song with the shape (num_subbeats, num_lanes)._
+    """
+    windows_list, starts_list = zip(*[ build_inference_windows(features, sequence_length, hop) for features in features_list ])
+    window_preds = model.predict(np.concatenate(windows_list), batch_size=batch_size, verbose=0)
+    
+    # Split the packed predictions back into the windows of every song.
+    split_idxs = np.cumsum([ len(windows) for windows in windows_list ])[:-1]
+    
+    return [
+        stitch_window_predictions(song_window_preds, starts, len(features))
+        for song_window_preds, starts, features in zip(np.split(window_preds, split_idxs), starts_list, features_list)
+    ]
+
+
+def find_silent_subbeats(features : np.ndarray, means : list, stds : list, silence_db : float) -> np.ndarray:
+    """
+    Find the silent or near-silent subbeats of a song by their RMS relative to the loudest subbeat.
+
+    Args:
+        features (np.ndarray): _Normalized subbeat features with the shape (num_subbeats, num_features)._
+        means (list): _The feature means used for normalization._
+        stds (list): _The feature standard deviations used for normalization._
+        silence_db (float): _Subbeats whose RMS is more than this many dB below the loudest subbeat are silent._
+
+    Returns:
+        np.ndarray: _Boolean mask with the shape (num_subbeats,)._
+    """
+    # Undo the normalization of the RMS feature.
+    rms = features[:, RMS_FEATURE_IDX] * (stds[RMS_FEATURE_IDX] + 1e-6) + means[RMS_FEATURE_IDX]
+    rms = np.maximum(rms, 0.0)
+    
+    if len(rms) == 0 or np.max(rms) <= 0:
+        return np.ones(len(rms), dtype=bool)
+    
+    return rms < np.max(rms) * 10 ** (-abs(silence_db) / 20)
+
+
+def predict_overlapping_windows_gated(model, features : np.ndarray, sequence_length : int, hop : int, silent_subbeats : np.ndarray, batch_size : int = 256, num_lanes : int = 4) -> tuple:
+    """
+    Predict every subbeat of a song with overlapping windows like predict_overlapping_windows,
+    but skip the windows whose subbeats are all silent. Skipped windows are stitched in with zero predictions,
+    so subbeats only covered by skipped windows are predicted as 0 and subbeats at the edge of a silent part
+    are averaged with these zeros (they are lower than without the gate). Subbeats that are not covered by
+    any skipped window are predicted exactly as without the gate.
+
+    Args:
+        model (_type_): _A model object that provides a predict() method._
+        features (np.ndarray): _Subbeat features with the shape (num_subbeats, num_features)._
+        sequence_length (int): _The sequence length of the model._
+        hop (int): _The distance in subbeats between the starts of two consecutive windows._
+        silent_subbeats (np.ndarray): _Boolean mask of the silent subbeats (see find_silent_subbeats)._
+        batch_size (int, optional): _The amount of windows per model batch._ Defaults to 256.
+        num_lanes (int, optional): _The number of lanes (only needed if all windows are skipped)._ Defaults to 4.
+
+    Returns:
+        tuple: _The predictions with the shape (num_subbeats, num_lanes) and a dict with the number of
+            windows, the number of skipped windows and the estimated inference time saved in seconds._
+    """
+    windows, starts = build_inference_windows(features, sequence_length, hop)
+    
+    # Padding subbeats of songs shorter than a window count as silent.
+    padded_silence = np.concatenate([ silent_subbeats, np.ones(max(sequence_length - len(silent_subbeats), 0), dtype=bool) ])
+    skip = padded_silence[starts[:, None] + np.arange(sequence_length)].all(axis=1)
+    
+    gate_stats = { "windows": len(starts), "skipped_windows": int(skip.sum()), "saved_s": 0.0 }
+    
+    if skip.all():
+        return np.zeros((len(features), num_lanes), dtype=np.float32), gate_stats
+    
+    start_time = time.perf_counter()
+    window_preds = model.predict(windows[~skip], batch_size=batch_size, verbose=0)
+    
+    # The skipped windows would have taken about as long as the predicted ones.
+    gate_stats["saved_s"] = (time.perf_counter() - start_time) / (~skip).sum() * skip.sum()
+    
+    # The skipped windows take part in the weighted average with zero predictions.
+    all_window_preds = np.zeros((len(starts),) + window_preds.shape[1:], dtype=window_preds.dtype)
+    all_window_preds[~skip] = window_preds
+    
+    return stitch_window_predictions(all_window_preds, starts, len(features)), gate_stats
@@ -1,9 +1,17 @@
 import argparse
 import json
-import librosa
 import numpy as np
 import os
-import tensorflow as tf
+import time
+
+from src.export.beatmapExporter import export_variants_to_osz
+from src.model.generationCache import FEATURE_CACHE_DIR, extract_features_cached, get_prediction_cache_key, get_prediction_cache_path, load_predictions, save_predictions
+from src.model.inferenceBackend import MODEL_FORMATS, find_silent_subbeats, load_generation_model, predict_overlapping_windows, predict_overlapping_windows_gated
+from src.model.predictionPostProcessor import convert_predictions_to_gblf_format, post_process_predictions
+from src.model.streamingGenerator import generate_streaming
+from src.model.tempoEstimator import parse_tempo_value
+from src.model.variantGenerator import generate_variants, resolve_profiles
+from src.model.viterbiDecoder import decode_lane_states
 
 
 parser = argparse.ArgumentParser()
@@ -11,23 +19,66 @@ parser.add_argument("--auto_threshold", type=bool, default=True)
 parser.add_argument("--prediction_threshold", type=float, default=0.45)
 parser.add_argument("--sequence_length", type=int, default=64)
 parser.add_argument("--note_precision", type=int, default=2)
-parser.add_argument("--audio_bpm", type=float, default=100)
-parser.add_argument("--audio_start_ms", type=int, default=0)
+parser.add_argument("--audio_bpm", type=str, default="100")
+parser.add_argument("--audio_start_ms", type=str, default="0")
 parser.add_argument("--audio_file_path", type=str, default="")
 parser.add_argument("--model_path", type=str, default=os.path.join(os.getcwd(), "models", "model-3-4_stars-P4-S128-V3.keras"))
+parser.add_argument("--model_format", type=str, default="keras", choices=MODEL_FORMATS)
 parser.add_argument("--output_dir", type=str, default=os.path.join(os.getcwd(), "generation"))
 parser.add_argument("--file_name", type=str, default="test")
+parser.add_argument("--window_hop", type=int, default=0)
+parser.add_argument("--inference_batch_size", type=int, default=256)
+parser.add_argument("--streaming", action="store_true")
+parser.add_argument("--stream_block_frames", type=int, default=2048)
+parser.add_argument("--reuse_predictions", action="store_true")
+parser.add_argument("--post_processor", type=str, default="greedy", choices=["greedy", "viterbi"])
+parser.add_argument("--jack_penalty", type=float, default=1.0)
+parser.add_argument("--chord_penalty", type=float, default=0.5)
+parser.add_argument("--max_chord_size", type=int, default=2)
+parser.add_argument("--target_density", type=float, default=0.0)
+parser.add_argument("--variant_profiles", type=str, default="")
+parser.add_argument("--variant_workers", type=int, default=0)
+parser.add_argument("--export_variants", action="store_true")
+parser.add_argument("--feature_cache_dir", type=str, default=FEATURE_CACHE_DIR)
+parser.add_argument("--feature_cache_size_mb", type=float, default=1024)
+parser.add_argument("--silence_gate_db", type=float, default=0.0)
 args = parser.parse_args()
 
 AUDIO_PATH = args.audio_file_path
 MODEL_PATH = args.model_path
+MODEL_FORMAT = args.model_format
 NORM_STATS_PATH = os.path.join(os.getcwd(), "feature_norm_stats.json")
 
-AUDIO_BPM = args.audio_bpm
-AUDIO_START_MS = args.audio_start_ms
+# "auto" estimates the BPM / offset from the onset strength of the audio.
+try:
+    AUDIO_BPM = parse_tempo_value(args.audio_bpm)
+    AUDIO_START_MS = parse_tempo_value(args.audio_start_ms)
+except ValueError:
+    parser.error("--audio_bpm and --audio_start_ms have to be numbers or auto.")
+
 SEQUENCE_LENGTH = args.sequence_length
 NOTE_PRECISION = args.note_precision
 
+# Distance between the starts of two overlapping inference windows (0 = half a sequence).
+WINDOW_HOP = args.window_hop if args.window_hop > 0 else max(1, SEQUENCE_LENGTH // 2)
+INFERENCE_BATCH_SIZE = args.inference_batch_size
+
+# Streaming generation processes the audio chunk by chunk with a unidirectional model.
+USE_STREAMING = args.streaming
+STREAM_BLOCK_FRAMES = args.stream_block_frames
+
+# Windows whose subbeats are all more than this many dB quieter than the loudest subbeat are not predicted (0 = off).
+SILENCE_GATE_DB = abs(args.silence_gate_db)
+
+# The raw predictions are cached next to the .gblf-file. If they are reused, only the post-processing runs again.
+REUSE_PREDICTIONS = args.reuse_predictions
+
+if USE_STREAMING and REUSE_PREDICTIONS:
+    parser.error("--reuse_predictions cannot be combined with --streaming.")
+
+if USE_STREAMING and (AUDIO_BPM is None or AUDIO_START_MS is None):
+    parser.error("--audio_bpm auto and --audio_start_ms auto cannot be combined with --streaming.")
+
 USE_AUTO_PREDICTION_THRESHOLD = args.auto_threshold
 PREDICTION_THRESHOLD = args.prediction_threshold
 
@@ -38,178 +89,65 @@ NUM_LANES = 4
 MAX_PREDICTION_DELTA = PREDICTION_THRESHOLD / NUM_LANES
 PREDICTION_FREQUENCY_BIAS = 0.002
 
-def calculate_subbeat_timings(audio_path, audio_start_ms, audio_bpm, note_precision):
-    ms_per_beat = 60_000 / audio_bpm
-    ms_per_subbeat = ms_per_beat / note_precision
-    
-    y, sr = librosa.load(audio_path, sr=None)
-    duration_ms = librosa.get_duration(y=y, sr=sr) * 1000
-    
-    num_subbeats = int((duration_ms - audio_start_ms) // ms_per_subbeat)
-    
-    subbeat_times_ms = [audio_start_ms + (i * ms_per_subbeat) for i in range(num_subbeats)]
-    
-    return subbeat_times_ms
+# The Viterbi decoder chooses the notes of the whole song at once, with costs for jacks and chords.
+USE_VITERBI_DECODER = (args.post_processor == "viterbi")
 
+if USE_STREAMING and USE_VITERBI_DECODER:
+    parser.error("--post_processor viterbi cannot be combined with --streaming.")
 
-def extract_features(audio_path, audio_bpm, audio_start_ms, sequence_length, note_precision, means, stds):
-    y, sr = librosa.load(audio_path, sr=None)
-    hop_length = 512
-    mfcc = librosa.feature.mfcc(y=y, sr=sr, n_mfcc=5, hop_length=hop_length).T
-    onset_env = librosa.onset.onset_strength(y=y, sr=sr, hop_length=hop_length)
-    rms = librosa.feature.rms(y=y, hop_length=hop_length)[0]
+# Multi-variant generation: one inference pass, one level per post-processing profile (JSON list of profiles).
+VARIANT_PROFILES = json.loads(args.variant_profiles) if args.variant_profiles else []
 
-    # Ensure all arrays are aligned in time.
-    max_frames = min(len(onset_env), len(rms), mfcc.shape[0])
-    mfcc = mfcc[:max_frames]
-    onset_env = onset_env[:max_frames]
-    rms = rms[:max_frames]
+if USE_STREAMING and VARIANT_PROFILES:
+    parser.error("--variant_profiles cannot be combined with --streaming.")
 
-    subbeat_times_ms = calculate_subbeat_timings(
-        audio_path=audio_path,
-        audio_start_ms=audio_start_ms,
-        audio_bpm=audio_bpm,
-        note_precision=note_precision
-    )
-     
-    features = []
-    
-    # No need for subbeat_idxs.
-    for t_ms in subbeat_times_ms:
-        frame_idx = int((t_ms / 1000) * sr / hop_length)
-        frame_idx = min(max(frame_idx, 0), max_frames - 1)
-        
-        feature_vector = list(mfcc[frame_idx])
-        feature_vector.append(float(onset_env[frame_idx]))
-        feature_vector.append(float(rms[frame_idx]))
-        
-        features.append(feature_vector)
-    
-    
-    features = np.array(features)
-    
-    # -------- Normalize features --------
-    if features.ndim == 2 and features.shape[0] > 0:
-        for col in range(features.shape[1]):
-            features[:, col] = (features[:, col] - means[col]) / (stds[col] + 1e-6)
-    else:
-        raise ValueError(f"Feature extraction failed: features shape is {features}")
-    # ---------------------------------
-    
-    n = features.shape[0]
-    n_trim = n - (n % sequence_length)
-    
-    features = features[:n_trim]
-    features = features.reshape(-1, sequence_length, features.shape[1])
-    
-    return features
+# All variants are packed into one .osz beatmap set in the output directory.
+EXPORT_VARIANTS = args.export_variants
 
+if EXPORT_VARIANTS and not VARIANT_PROFILES:
+    parser.error("--export_variants requires --variant_profiles.")
 
-def compute_combined_prediction_bias(lane_weights, lane_history, num_lanes, history_window, long_weight=0.3, short_weight=0.7):
-    # Long-term-weights
-    weights_array = np.array(lane_weights)
-    max_weight = max(1.0, np.max(np.abs(weights_array)))
-    normalized_long_weights = weights_array / max_weight
-    
-    # Short-term-weights
-    recent_counts = [ 0 ] * num_lanes
-    
-    for past in lane_history[-history_window:]:
-        for idx, val in enumerate(past):
-            recent_counts[idx] += val
-    
-    max_recent = max(1.0, np.max(recent_counts))
-    normalized_short_weights = np.array(recent_counts) / max_recent
-    
-    # Combine biases.
-    combined_bias = (long_weight * normalized_long_weights) + (short_weight * normalized_short_weights)
-    return combined_bias
-    
 
+def export_variants(variants : list, tempo : dict, means : list, stds : list):
+    """
+    Export the levels of a multi-variant generation as one .osz beatmap set named
+    "Unknown - <file_name>.osz", with the profile names as difficulty names.
 
-def post_process_predictions(raw_predictions, num_lanes, history_window = 8):
-    binary_preds = []
-    lane_history = []
-    lane_weights = [ 0 ] * num_lanes
-    
-    lane_frequencies = [ 0 ] * num_lanes
-    
-    # -------- EXPERIMENTAL --------
-    threshold = np.percentile(raw_predictions, 80) if USE_AUTO_PREDICTION_THRESHOLD else PREDICTION_THRESHOLD
-    # ------------------------------
-    
-    for lane_pred in raw_predictions:
-        binary_lane_preds = [ 0 ] * num_lanes
-        
-        combined_bias = compute_combined_prediction_bias(
-            lane_weights=lane_weights,
-            lane_history=lane_history,
-            num_lanes=num_lanes,
-            history_window=history_window
+    Args:
+        variants (list): _The generated variants (see variantGenerator.generate_variants)._
+        tempo (dict): _The BPM and offset of the levels, None if they were estimated but are not known yet._
+        means (list): _The feature means of the normalization stats._
+        stds (list): _The feature standard deviations of the normalization stats._
+    """
+    if tempo["audio_bpm"] is None or tempo["audio_start_ms"] is None:
+        # Reused predictions do not carry the estimated tempo, it is taken from the feature cache (or estimated again).
+        _, _, tempo, _ = extract_features_cached(
+            audio_path=AUDIO_PATH,
+            audio_bpm=AUDIO_BPM,
+            audio_start_ms=AUDIO_START_MS,
+            note_precision=NOTE_PRECISION,
+            means=means,
+            stds=stds,
+            cache_dir=args.feature_cache_dir,
+            max_size_mb=args.feature_cache_size_mb
         )
-        
-        adjusted_pred = np.array(lane_pred) - combined_bias * PREDICTION_FREQUENCY_BIAS
-        
-        # Store the indices of the best predictions in descending order.
-        best_preds_idxs = np.argsort(adjusted_pred)[::-1]
-        max_pred = adjusted_pred[best_preds_idxs[0]]
-        
-        # Skip iteration if the highest prediction valuedoes not exceed the threshold.
-        if max_pred < threshold:
-            binary_preds.append(binary_lane_preds)
-            lane_history.append(binary_lane_preds)
-            continue
-        
-        binary_lane_preds[best_preds_idxs[0]] = 1
-        
-        # Rename max_pred to current_pred for clarity.
-        current_pred = max_pred
-        
-        # Loop over all other predictions until the delta between two predictions exceeds a limit.
-        for pred_idx in best_preds_idxs[1:]:
-            previous_max_pred = current_pred
-            current_pred = adjusted_pred[pred_idx]
-            
-            delta_ok = ((previous_max_pred - current_pred) <= MAX_PREDICTION_DELTA)
-            threshold_ok = (current_pred >= threshold)
-            
-            # The difference between the current and previous prediction
-            # MUST be lower than the maximum prediction delta to get counted
-            # as an actual note whilst still surpassing the original prediction threshold.
-            if delta_ok and threshold_ok:
-                binary_lane_preds[pred_idx] = 1
-            else:
-                break
-        
-        for lane_idx in range(num_lanes):
-            sign = 1 if (binary_lane_preds[lane_idx] == 1) else -1
-            lane_weights[lane_idx] += sign * lane_pred[lane_idx]
-            lane_frequencies[lane_idx] += np.sign(binary_lane_preds[lane_idx])
-
-        binary_preds.append(binary_lane_preds)
-        lane_history.append(binary_lane_preds)
     
-    if USE_AUTO_PREDICTION_THRESHOLD:
-        print(f"Automatic threshold: {threshold}")
-    print(f"Lane frequencies after post-processing: {lane_frequencies}")
-    
-    return binary_preds
-
-
-def convert_predictions_to_gblf_format(raw_predictions, post_processed_predictions, subbeat_timings):
-    gblf_contents = ""
-    
-    for i, (raw_prediction, post_processed_prediction) in enumerate(zip(raw_predictions, post_processed_predictions)):
-        pred_line = f"{int(subbeat_timings[i])}|"
-        
-        for j in range(len(raw_prediction) - 1):
-            pred_line += f"{post_processed_prediction[j]}:{raw_prediction[j]:.3f}|"
-        
-        pred_line += f"{post_processed_prediction[-1]}:{raw_prediction[-1]:.3f}"
-    
-        gblf_contents += pred_line + "\n"
-    
-    return gblf_contents
+    metadata = {
+        "title": args.file_name,
+        "artist": "Unknown",
+        "audio_bpm": tempo["audio_bpm"],
+        "audio_start_ms": tempo["audio_start_ms"],
+        "audio_time_signature": 4
+    }
+    
+    export_variants_to_osz(
+        audio_file_path=AUDIO_PATH,
+        beatmap_file_paths=[ variant["path"] for variant in variants ],
+        export_path=args.output_dir,
+        metadata=metadata,
+        difficulty_names=[ variant["name"] for variant in variants ]
+    )
+    print(f"Exported {len(variants)} levels to {os.path.join(args.output_dir, metadata['artist'] + ' - ' + metadata['title'] + '.osz')}.")
 
 
 def main():
@@ -221,20 +159,143 @@ def main():
     means = stats["means"]
     stds = stats["stds"]
     
-    features = extract_features(
+    output_path = os.path.join(args.output_dir, args.file_name)
+    
+    if USE_STREAMING:
+        generate_streaming(
+            audio_path=AUDIO_PATH,
+            model_path=MODEL_PATH,
+            output_path=f"{output_path}.gblf",
+            audio_bpm=AUDIO_BPM,
+            audio_start_ms=AUDIO_START_MS,
+            note_precision=NOTE_PRECISION,
+            means=means,
+            stds=stds,
+            post_process_args={
+                "num_lanes": NUM_LANES,
+                "prediction_threshold": PREDICTION_THRESHOLD,
+                "use_auto_threshold": USE_AUTO_PREDICTION_THRESHOLD,
+                "max_prediction_delta": MAX_PREDICTION_DELTA,
+                "prediction_frequency_bias": PREDICTION_FREQUENCY_BIAS
+            },
+            block_frames=STREAM_BLOCK_FRAMES
+        )
+        return
+    
+    start_time = time.perf_counter()
+    cache_path = get_prediction_cache_path(output_path)
+    cache_key = get_prediction_cache_key(
         audio_path=AUDIO_PATH,
+        model_path=MODEL_PATH,
+        model_format=MODEL_FORMAT,
         audio_bpm=AUDIO_BPM,
         audio_start_ms=AUDIO_START_MS,
-        sequence_length=SEQUENCE_LENGTH,
         note_precision=NOTE_PRECISION,
-        means=means,
-        stds=stds
+        sequence_length=SEQUENCE_LENGTH,
+        window_hop=WINDOW_HOP,
+        silence_gate_db=SILENCE_GATE_DB
     )
     
-    model = tf.keras.models.load_model(MODEL_PATH, compile=False)
-    preds = model.predict(features)
-    preds = preds.reshape(-1, preds.shape[-1])
-    preds_bin = post_process_predictions(preds, num_lanes=NUM_LANES)
+    cached = load_predictions(cache_path, cache_key) if REUSE_PREDICTIONS else None
+    tempo = { "audio_bpm": AUDIO_BPM, "audio_start_ms": AUDIO_START_MS }
+    
+    if cached is not None:
+        preds, subbeat_timings = cached
+        print(f"Reusing the raw predictions from {cache_path}.")
+    else:
+        if REUSE_PREDICTIONS:
+            print(f"No cached predictions for this audio, model and timing in {cache_path}, predicting again.")
+        
+        # The audio is decoded once for the features and the subbeat timings (or not at all if they are cached).
+        feature_start_time = time.perf_counter()
+        features, subbeat_timings, tempo, features_cached = extract_features_cached(
+            audio_path=AUDIO_PATH,
+            audio_bpm=AUDIO_BPM,
+            audio_start_ms=AUDIO_START_MS,
+            note_precision=NOTE_PRECISION,
+            means=means,
+            stds=stds,
+            cache_dir=args.feature_cache_dir,
+            max_size_mb=args.feature_cache_size_mb
+        )
+        print(f"Features {'loaded from the cache' if features_cached else 'extracted'} in {time.perf_counter() - feature_start_time:.2f} s.")
+        
+        if tempo["confidence"] is not None:
+            print(f"Estimated tempo: {tempo['audio_bpm']:.3f} BPM, first beat at {tempo['audio_start_ms']:.0f} ms (confidence {tempo['confidence']:.2f}).")
+        
+        model = load_generation_model(MODEL_PATH, model_format=MODEL_FORMAT)
+        
+        if SILENCE_GATE_DB > 0:
+            # Silent intros, outros and breaks are predicted as 0 without running the model.
+            silent_subbeats = find_silent_subbeats(features, means, stds, SILENCE_GATE_DB)
+            preds, gate_stats = predict_overlapping_windows_gated(
+                model,
+                features,
+                sequence_length=SEQUENCE_LENGTH,
+                hop=WINDOW_HOP,
+                silent_subbeats=silent_subbeats,
+                batch_size=INFERENCE_BATCH_SIZE,
+                num_lanes=NUM_LANES
+            )
+            print(f"Silence gate: {np.mean(silent_subbeats):.1%} of the subbeats are silent, skipped {gate_stats['skipped_windows']} of {gate_stats['windows']} windows (about {gate_stats['saved_s']:.2f} s of inference saved).")
+        else:
+            preds = predict_overlapping_windows(
+                model,
+                features,
+                sequence_length=SEQUENCE_LENGTH,
+                hop=WINDOW_HOP,
+                batch_size=INFERENCE_BATCH_SIZE
+            )
+        
+        os.makedirs(args.output_dir, exist_ok=True)
+        save_predictions(cache_path, cache_key, preds, subbeat_timings)
+    
+    if VARIANT_PROFILES:
+        # Settings that a profile does not set are taken from the command line.
+        profiles = resolve_profiles(VARIANT_PROFILES, defaults={
+            "post_processor": args.post_processor,
+            "prediction_threshold": PREDICTION_THRESHOLD,
+            "use_auto_threshold": USE_AUTO_PREDICTION_THRESHOLD,
+            "prediction_frequency_bias": PREDICTION_FREQUENCY_BIAS,
+            "jack_penalty": args.jack_penalty,
+            "chord_penalty": args.chord_penalty,
+            "max_chord_size": args.max_chord_size,
+            "target_density": args.target_density
+        })
+        
+        os.makedirs(args.output_dir, exist_ok=True)
+        variants = generate_variants(preds, subbeat_timings, profiles, output_path, num_lanes=NUM_LANES, num_workers=args.variant_workers)
+        
+        for variant in variants:
+            print(f"{variant['name']}: {variant['notes_per_subbeat']:.3f} notes per subbeat, lane frequencies {variant['lane_frequencies']} -> {variant['path']}")
+        
+        print(f"{len(variants)} levels generated in {time.perf_counter() - start_time:.2f} s.")
+        
+        if EXPORT_VARIANTS:
+            export_variants(variants, tempo, means, stds)
+        
+        return
+    
+    if USE_VITERBI_DECODER:
+        preds_bin = decode_lane_states(
+            preds,
+            num_lanes=NUM_LANES,
+            prediction_threshold=PREDICTION_THRESHOLD,
+            use_auto_threshold=USE_AUTO_PREDICTION_THRESHOLD,
+            jack_penalty=args.jack_penalty,
+            chord_penalty=args.chord_penalty,
+            max_chord_size=args.max_chord_size,
+            target_density=args.target_density
+        )
+    else:
+        preds_bin = post_process_predictions(
+            preds,
+            num_lanes=NUM_LANES,
+            prediction_threshold=PREDICTION_THRESHOLD,
+            use_auto_threshold=USE_AUTO_PREDICTION_THRESHOLD,
+            max_prediction_delta=MAX_PREDICTION_DELTA,
+            prediction_frequency_bias=PREDICTION_FREQUENCY_BIAS
+        )
     
     note_density = np.mean(preds_bin)
     
@@ -244,23 +305,16 @@ def main():
     print("Mean:", np.mean(preds))
     print(f"Note density: {note_density}")
     
-    subbeat_timings = calculate_subbeat_timings(
-        audio_path=AUDIO_PATH,
-        audio_start_ms=AUDIO_START_MS,
-        audio_bpm=AUDIO_BPM,
-        note_precision=NOTE_PRECISION
-    )
-    
     gblf_contents = convert_predictions_to_gblf_format(
         raw_predictions=preds,
         post_processed_predictions=preds_bin,
         subbeat_timings=subbeat_timings
     )
-
-    output_path = os.path.join(args.output_dir, args.file_name)
     
     with open(f"{output_path}.gblf", "w", encoding="utf-8") as f:
         f.write(gblf_contents)
+    
+    print(f"Level generated in {time.perf_counter() - start_time:.2f} s.")
 
 
 if __name__ == "__main__":
@@ -4,31 +4,45 @@ from keras.losses import BinaryFocalCrossentropy
 from keras.metrics import Recall, Precision
 
 
-def build_lstm_model(input_shape : tuple, output_dim : int) -> tf.keras.Model:
+def build_lstm_model(input_shape : tuple, output_dim : int, lstm_units : tuple = (256, 128), dense_units : int = 64, loss = None, bidirectional : bool = True, jit_compile : bool = False, dropout : tuple = (0.3, 0.2), metrics : list = None) -> tf.keras.Model:
     """
     Build and return a sequential LSTM model for osu!mania sequence generation.
 
     Args:
         input_shape (tuple): _Shape of the input sequence, e.g. (sequence_length, num_features)._
         output_dim (int): _Number of output units (e.g. 4 for 4 lanes)._
+        lstm_units (tuple, optional): _Units of the first and second bidirectional LSTM layer._ Defaults to (256, 128).
+        dense_units (int, optional): _Units of the hidden TimeDistributed Dense layer._ Defaults to 64.
+        loss (optional): _Loss to compile the model with._ Defaults to BinaryFocalCrossentropy(gamma=2).
+        bidirectional (bool, optional): _If false, unidirectional LSTM layers are used instead,
+            which allows streaming generation with carried hidden states._ Defaults to True.
+        jit_compile (bool, optional): _If true, the training step is compiled with XLA._ Defaults to False.
+        dropout (tuple, optional): _Dropout rates after the first and second LSTM layer._ Defaults to (0.3, 0.2).
+        metrics (list, optional): _Metrics to compile the model with._ Defaults to [Precision(), Recall()].
 
     Returns:
         tf.keras.Model: _The Compiled LSTM model._
     """
+    def recurrent_layer(units):
+        lstm = tf.keras.layers.LSTM(units, return_sequences=True)
+        return tf.keras.layers.Bidirectional(lstm) if bidirectional else lstm
+    
     model = tf.keras.Sequential([
         tf.keras.layers.Input(shape=input_shape),
-        tf.keras.layers.Bidirectional(tf.keras.layers.LSTM(256, return_sequences=True)),
-        tf.keras.layers.Dropout(0.3),
-        tf.keras.layers.Bidirectional(tf.keras.layers.LSTM(128, return_sequences=True)),
-        tf.keras.layers.Dropout(0.2),
-        tf.keras.layers.TimeDistributed(tf.keras.layers.Dense(64, activation='relu')),
-        tf.keras.layers.TimeDistributed(tf.keras.layers.Dense(output_dim, activation='sigmoid'))
+        recurrent_layer(lstm_units[0]),
+        tf.keras.layers.Dropout(dropout[0]),
+        recurrent_layer(lstm_units[1]),
+        tf.keras.layers.Dropout(dropout[1]),
+        tf.keras.layers.TimeDistributed(tf.keras.layers.Dense(dense_units, activation='relu')),
+        # The output layer is always float32, so that the sigmoid outputs stay stable under mixed precision.
+        tf.keras.layers.TimeDistributed(tf.keras.layers.Dense(output_dim, activation='sigmoid', dtype='float32'))
     ])
     
     model.compile(
         optimizer='adam',
-        loss=BinaryFocalCrossentropy(gamma=2),
-        metrics=[Precision(), Recall()]
+        loss=loss if loss is not None else BinaryFocalCrossentropy(gamma=2),
+        metrics=metrics if metrics is not None else [Precision(), Recall()],
+        jit_compile=jit_compile
     )
     
     return model
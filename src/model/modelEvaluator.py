@@ -0,0 +1,283 @@
+import argparse
+import concurrent.futures
+import csv
+import json
+import multiprocessing
+import numpy as np
+import os
+import pandas as pd
+import time
+
+from glob import glob
+from src.model.inferenceBackend import MODEL_FORMATS, load_generation_model, predict_overlapping_windows_batch
+from src.model.predictionPostProcessor import post_process_predictions
+
+
+NORM_STATS_PATH = os.path.join(os.getcwd(), "feature_norm_stats.json")
+
+NUM_FEATURES = 7
+NUM_LANES = 4
+PREDICTION_FREQUENCY_BIAS = 0.002
+
+
+def load_preprocessed_beatmap(csv_path : str, means : list, stds : list) -> tuple:
+    """
+    Load a preprocessed beatmap and normalize its audio features like the sequence splitter does.
+
+    Args:
+        csv_path (str): _The path to the preprocessed bm_<ID>.csv-file._
+        means (list): _The feature means of the normalization stats._
+        stds (list): _The feature standard deviations of the normalization stats._
+
+    Returns:
+        tuple: _The normalized features (num_subbeats, 7) and the notes (num_subbeats, 4)._
+    """
+    data = pd.read_csv(csv_path).values
+    features = (data[:, :NUM_FEATURES] - np.array(means)) / (np.array(stds) + 1e-6)
+    
+    return features.astype(np.float32), data[:, NUM_FEATURES:NUM_FEATURES + NUM_LANES].astype(np.int8)
+
+
+def match_notes(predicted : np.ndarray, reference : np.ndarray, tolerance : int) -> np.ndarray:
+    """
+    Match generated notes one-to-one with the notes of the beatmap in the same lane within tolerance subbeats.
+    Closer pairs are matched first (offset 0, then -1, +1, -2, ...): at every offset, each still unmatched reference
+    note is matched with the unmatched predicted note at that offset, for all subbeats and lanes at once.
+
+    Args:
+        predicted (np.ndarray): _Binary generated notes with the shape (num_subbeats, num_lanes)._
+        reference (np.ndarray): _Binary notes of the beatmap with the same shape._
+        tolerance (int): _The timing tolerance in subbeats._
+
+    Returns:
+        np.ndarray: _The number of matched pairs per lane._
+    """
+    unmatched_predicted = np.array(predicted, dtype=bool)
+    unmatched_reference = np.array(reference, dtype=bool)
+    num_subbeats = len(unmatched_reference)
+    num_matched = np.zeros(unmatched_reference.shape[1], dtype=np.int64)
+    
+    for offset in [0] + [ sign * distance for distance in range(1, max(tolerance, 0) + 1) for sign in [-1, 1] ]:
+        if abs(offset) >= num_subbeats:
+            continue
+        
+        # Views that pair the reference note of every subbeat with the predicted note offset subbeats later.
+        reference_view = unmatched_reference[max(0, -offset):num_subbeats - max(0, offset)]
+        predicted_view = unmatched_predicted[max(0, offset):num_subbeats - max(0, -offset)]
+        
+        matched = reference_view & predicted_view
+        reference_view &= ~matched
+        predicted_view &= ~matched
+        num_matched += matched.sum(axis=0)
+    
+    return num_matched
+
+
+def compute_beatmap_metrics(predicted : np.ndarray, reference : np.ndarray, tolerance : int) -> dict:
+    """
+    Compare generated notes with the notes of the original beatmap.
+
+    Predicted and reference notes are matched one-to-one within tolerance subbeats (see match_notes), so every
+    matched pair is one hit predicted note and one found reference note. Extra notes around a reference note
+    (or extra reference notes around a predicted note) are not counted as hits.
+
+    Args:
+        predicted (np.ndarray): _Binary generated notes with the shape (num_subbeats, num_lanes)._
+        reference (np.ndarray): _Binary notes of the beatmap with the same shape._
+        tolerance (int): _The timing tolerance in subbeats._
+
+    Returns:
+        dict: _Per-lane hit counts, note densities and chord rates._
+    """
+    predicted = np.asarray(predicted, dtype=bool)
+    reference = np.asarray(reference, dtype=bool)
+    
+    def chord_rate(notes):
+        notes_per_subbeat = notes.sum(axis=1)
+        return float(np.mean(notes_per_subbeat[notes_per_subbeat > 0] >= 2)) if notes_per_subbeat.any() else 0.0
+    
+    num_matched = match_notes(predicted, reference, tolerance)
+    
+    return {
+        "num_predicted": predicted.sum(axis=0),
+        "num_reference": reference.sum(axis=0),
+        "hit_predicted": num_matched,
+        "found_reference": num_matched,
+        "predicted_density": float(predicted.sum() / len(predicted)),
+        "reference_density": float(reference.sum() / len(reference)),
+        "predicted_chord_rate": chord_rate(predicted),
+        "reference_chord_rate": chord_rate(reference)
+    }
+
+
+def compute_f1(hit_predicted, num_predicted, found_reference, num_reference) -> np.ndarray:
+    precision = np.divide(hit_predicted, num_predicted, out=np.zeros(np.shape(num_predicted)), where=np.asarray(num_predicted) > 0)
+    recall = np.divide(found_reference, num_reference, out=np.zeros(np.shape(num_reference)), where=np.asarray(num_reference) > 0)
+    
+    return np.divide(2 * precision * recall, precision + recall, out=np.zeros(np.shape(precision)), where=(precision + recall) > 0)
+
+
+def evaluate_beatmap(beatmap_name : str, raw_predictions : np.ndarray, reference : np.ndarray, thresholds : list, tolerance : int) -> list:
+    """
+    Post-process the raw predictions of one beatmap with every threshold and compute its metrics.
+
+    Returns:
+        list: _One row of metrics per threshold._
+    """
+    rows = []
+    
+    for threshold in thresholds:
+        predicted = np.array(post_process_predictions(
+            raw_predictions,
+            num_lanes=NUM_LANES,
+            prediction_threshold=threshold,
+            use_auto_threshold=False,
+            max_prediction_delta=threshold / NUM_LANES,
+            prediction_frequency_bias=PREDICTION_FREQUENCY_BIAS,
+            state={}
+        ))
+        
+        metrics = compute_beatmap_metrics(predicted, reference, tolerance)
+        lane_f1 = compute_f1(metrics["hit_predicted"], metrics["num_predicted"], metrics["found_reference"], metrics["num_reference"])
+        
+        rows.append({
+            "beatmap": beatmap_name,
+            "threshold": threshold,
+            **metrics,
+            "lane_f1": lane_f1,
+            "f1": float(lane_f1.mean()),
+            "density_error": metrics["predicted_density"] - metrics["reference_density"],
+            # Beatmaps without reference notes have no relative error, they are counted separately in the summary.
+            "relative_density_error": (metrics["predicted_density"] - metrics["reference_density"]) / metrics["reference_density"] if metrics["reference_density"] > 0 else None,
+            "chord_rate_error": metrics["predicted_chord_rate"] - metrics["reference_chord_rate"]
+        })
+    
+    return rows
+
+
+def summarize(rows : list, thresholds : list) -> list:
+    """
+    Aggregate the per-beatmap metrics of every threshold.
+
+    Returns:
+        list: _One summary per threshold: micro-averaged per-lane F1 (hits summed over all beatmaps),
+            the mean per-beatmap F1, the mean absolute note-density error (in notes per subbeat and relative, the latter
+            only over beatmaps with reference notes), the number of beatmaps without reference notes and the mean absolute chord-rate error._
+    """
+    summaries = []
+    
+    for threshold in thresholds:
+        threshold_rows = [ row for row in rows if row["threshold"] == threshold ]
+        totals = { key: np.sum([ row[key] for row in threshold_rows ], axis=0) for key in [ "hit_predicted", "num_predicted", "found_reference", "num_reference" ] }
+        lane_f1 = compute_f1(totals["hit_predicted"], totals["num_predicted"], totals["found_reference"], totals["num_reference"])
+        relative_density_errors = [ abs(row["relative_density_error"]) for row in threshold_rows if row["relative_density_error"] is not None ]
+        
+        summaries.append({
+            "threshold": threshold,
+            "num_beatmaps": len(threshold_rows),
+            "micro_f1": float(lane_f1.mean()),
+            **{ f"lane{lane}_f1": float(lane_f1[lane]) for lane in range(NUM_LANES) },
+            "mean_beatmap_f1": float(np.mean([ row["f1"] for row in threshold_rows ])),
+            "mean_abs_density_error": float(np.mean([ abs(row["density_error"]) for row in threshold_rows ])),
+            "mean_abs_relative_density_error": float(np.mean(relative_density_errors)) if relative_density_errors else None,
+            "num_empty_reference_beatmaps": len(threshold_rows) - len(relative_density_errors),
+            "mean_abs_chord_rate_error": float(np.mean([ abs(row["chord_rate_error"]) for row in threshold_rows ]))
+        })
+    
+    return summaries
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate a trained model on held-out preprocessed beatmaps.")
+    parser.add_argument("--model_path", type=str, required=True)
+    parser.add_argument("--model_format", type=str, default="keras", choices=MODEL_FORMATS)
+    parser.add_argument("--beatmaps_dir", type=str, required=True)
+    parser.add_argument("--max_beatmaps", type=int, default=0)
+    parser.add_argument("--sequence_length", type=int, default=0)
+    parser.add_argument("--window_hop", type=int, default=0)
+    parser.add_argument("--batch_size", type=int, default=256)
+    parser.add_argument("--beatmaps_per_predict", type=int, default=32)
+    parser.add_argument("--thresholds", type=str, default="0.45")
+    parser.add_argument("--tolerance", type=int, default=1)
+    parser.add_argument("--num_workers", type=int, default=os.cpu_count())
+    parser.add_argument("--report_path", type=str, default="")
+    args = parser.parse_args()
+    
+    with open(NORM_STATS_PATH, "r") as f:
+        stats = json.load(f)
+    
+    csv_paths = sorted(glob(os.path.join(args.beatmaps_dir, "**", "bm_*.csv"), recursive=True))
+    
+    if args.max_beatmaps > 0:
+        csv_paths = csv_paths[:args.max_beatmaps]
+    
+    if not csv_paths:
+        raise FileNotFoundError(f"No preprocessed beatmaps (bm_*.csv) found in {args.beatmaps_dir}.")
+    
+    thresholds = [ float(threshold) for threshold in args.thresholds.split(",") ]
+    beatmap_names = [ os.path.splitext(os.path.basename(path))[0] for path in csv_paths ]
+    
+    model = load_generation_model(args.model_path, args.model_format)
+    
+    # Keras and NumPy models know their sequence length, TFLite models need --sequence_length.
+    input_shape = getattr(model, "input_shape", None)
+    sequence_length = args.sequence_length or (input_shape[1] if input_shape is not None else 0)
+    
+    if not sequence_length:
+        raise ValueError("The sequence length of the model is unknown, pass --sequence_length.")
+    
+    hop = args.window_hop if args.window_hop > 0 else sequence_length // 2
+    
+    print(f"Evaluating {args.model_path} on {len(csv_paths)} beatmaps (thresholds {thresholds}, tolerance ±{args.tolerance} subbeats).")
+    start_time = time.perf_counter()
+    
+    # Spawned workers do not inherit the TensorFlow runtime of this process.
+    mp_context = multiprocessing.get_context("spawn")
+    rows = []
+    
+    with concurrent.futures.ProcessPoolExecutor(max_workers=args.num_workers, mp_context=mp_context) as executor:
+        beatmaps = list(executor.map(load_preprocessed_beatmap, csv_paths, [ stats["means"] ] * len(csv_paths), [ stats["stds"] ] * len(csv_paths)))
+        futures = []
+        
+        # The windows of several beatmaps are predicted together, post-processing runs in the workers.
+        for start in range(0, len(beatmaps), args.beatmaps_per_predict):
+            chunk = beatmaps[start:start + args.beatmaps_per_predict]
+            predictions = predict_overlapping_windows_batch(model, [ features for features, _ in chunk ], sequence_length, hop, batch_size=args.batch_size)
+            
+            for name, raw_predictions, (_, reference) in zip(beatmap_names[start:start + args.beatmaps_per_predict], predictions, chunk):
+                futures.append(executor.submit(evaluate_beatmap, name, raw_predictions, reference, thresholds, args.tolerance))
+        
+        for future in concurrent.futures.as_completed(futures):
+            rows += future.result()
+    
+    summaries = summarize(rows, thresholds)
+    elapsed = time.perf_counter() - start_time
+    
+    print(f"Evaluated {len(csv_paths)} beatmaps in {elapsed:.1f} s.")
+    print(f"{'threshold':>9} | {'micro F1':>8} | {'lane F1':>27} | {'map F1':>6} | {'density err':>11} | {'rel. density err':>16} | {'chord err':>9}")
+    
+    for summary in summaries:
+        lane_f1 = " ".join(f"{summary[f'lane{lane}_f1']:.3f}" for lane in range(NUM_LANES))
+        relative_density_error = summary["mean_abs_relative_density_error"]
+        relative_density_error = f"{relative_density_error:>16.3f}" if relative_density_error is not None else f"{'-':>16}"
+        print(f"{summary['threshold']:>9.3f} | {summary['micro_f1']:>8.3f} | {lane_f1:>27} | {summary['mean_beatmap_f1']:>6.3f} | {summary['mean_abs_density_error']:>11.3f} | {relative_density_error} | {summary['mean_abs_chord_rate_error']:>9.3f}")
+    
+    if summaries and summaries[0]["num_empty_reference_beatmaps"]:
+        print(f"{summaries[0]['num_empty_reference_beatmaps']} beatmaps without reference notes are not part of the relative density error.")
+    
+    if args.report_path:
+        with open(args.report_path, "w") as f:
+            json.dump({ "model_path": args.model_path, "tolerance": args.tolerance, "summaries": summaries }, f, indent=4)
+        
+        # Per-beatmap metrics next to the report.
+        with open(os.path.splitext(args.report_path)[0] + "_beatmaps.csv", "w", newline="") as f:
+            fieldnames = [ "beatmap", "threshold", "f1", "density_error", "relative_density_error", "chord_rate_error", "predicted_density", "reference_density", "predicted_chord_rate", "reference_chord_rate" ]
+            writer = csv.DictWriter(f, fieldnames=fieldnames, extrasaction="ignore")
+            writer.writeheader()
+            writer.writerows(sorted(rows, key=lambda row: (row["beatmap"], row["threshold"])))
+        
+        print(f"Report saved to {args.report_path}")
+
+
+if __name__ == "__main__":
+    main()
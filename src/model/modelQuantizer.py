@@ -0,0 +1,285 @@
+import argparse
+import concurrent.futures
+import glob
+import json
+import multiprocessing
+import numpy as np
+import os
+import time
+import tensorflow as tf
+
+from src.model.audioFeatureExtractor import extract_features
+from src.model.inferenceBackend import TFLiteModel, build_inference_windows
+from src.model.predictionPostProcessor import post_process_predictions
+from src.model.resourceMonitor import get_rss_mb
+
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--model_path", type=str, default=os.path.join(os.getcwd(), "models", "model-3-4_stars-P4-S128-V3.keras"))
+parser.add_argument("--output_path", type=str, default="")
+parser.add_argument("--quantization", type=str, default="dynamic", choices=[ "dynamic", "int8", "float16" ])
+parser.add_argument("--difficulty_range", type=str, default="3-4_stars")
+parser.add_argument("--calibration_sequences", type=int, default=512)
+parser.add_argument("--benchmark_audio_dir", type=str, default="")
+parser.add_argument("--benchmark_bpm", type=float, default=120)
+parser.add_argument("--benchmark_start_ms", type=int, default=0)
+parser.add_argument("--note_precision", type=int, default=4)
+parser.add_argument("--prediction_threshold", type=float, default=0.45)
+parser.add_argument("--report_path", type=str, default="")
+args = parser.parse_args()
+
+SEQUENCES_ROOT = os.path.join(os.getcwd(), "data", "sequences")
+NORM_STATS_PATH = os.path.join(os.getcwd(), "feature_norm_stats.json")
+
+NUM_LANES = 4
+AUDIO_EXTENSIONS = [ "mp3", "wav", "ogg" ]
+
+
+def get_representative_dataset(sequences_root : str, difficulty : str, num_sequences : int):
+    """
+    Create a representative dataset from the test sequence shards
+    that is used to calibrate the int8 quantization ranges.
+
+    Args:
+        sequences_root (str): _Root directory where difficulty folders are stored._
+        difficulty (str): _Difficulty label (e.g. "3-4_stars")._
+        num_sequences (int): _The amount of calibration sequences._
+
+    Raises:
+        RuntimeError: _No test sequences are available._
+
+    Returns:
+        _type_: _A generator function yielding single calibration sequences._
+    """
+    pattern = os.path.join(sequences_root, difficulty, "test", f"{difficulty}_test_sequences_*.npy")
+    files = sorted(glob.glob(pattern))
+    
+    if not files:
+        raise RuntimeError(f"No test sequences found for calibration ({pattern}).")
+    
+    def representative_dataset():
+        # Spread the calibration samples evenly over all test shards.
+        per_file = max(1, num_sequences // len(files))
+        
+        for fname in files:
+            sequences = np.load(fname, mmap_mode='r')
+            idxs = np.linspace(0, len(sequences) - 1, num=min(per_file, len(sequences)), dtype=int)
+            
+            for idx in idxs:
+                yield [ np.asarray(sequences[idx:idx + 1, :, :7], dtype=np.float32) ]
+    
+    return representative_dataset
+
+
+def export_quantized_model(model : tf.keras.Model, quantization : str, representative_dataset = None) -> bytes:
+    """
+    Convert a trained Keras model into a quantized TFLite model.
+
+    Args:
+        model (tf.keras.Model): _The trained float32 model._
+        quantization (str): _The quantization mode ("dynamic", "int8" or "float16")._
+        representative_dataset (optional): _Calibration data generator, required for "int8"._ Defaults to None.
+
+    Raises:
+        ValueError: _int8 quantization was requested without calibration data._
+
+    Returns:
+        bytes: _The serialized TFLite model._
+    """
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    converter.optimizations = [ tf.lite.Optimize.DEFAULT ]
+    
+    if quantization == "int8":
+        if representative_dataset is None:
+            raise ValueError("int8 quantization requires a representative dataset for calibration.")
+        
+        # Quantize weights and activations to int8; ops without int8 kernels fall back to float.
+        # Inputs and outputs stay float32, so the model can be used like the original one.
+        converter.representative_dataset = representative_dataset
+        converter.target_spec.supported_ops = [ tf.lite.OpsSet.TFLITE_BUILTINS_INT8, tf.lite.OpsSet.TFLITE_BUILTINS ]
+    elif quantization == "float16":
+        converter.target_spec.supported_types = [ tf.float16 ]
+    
+    return converter.convert()
+
+
+def benchmark_model(model_path : str, model_format : str, features_list : list) -> dict:
+    """
+    Measure the load time, inference time and memory usage of a model.
+    Should run in a fresh process (see benchmark_model_in_subprocess), so the memory usage of different models is comparable.
+
+    Args:
+        model_path (str): _The path to the model._
+        model_format (str): _"keras" or "tflite"._
+        features_list (list): _Feature sequences of every benchmark audio file._
+
+    Returns:
+        dict: _The benchmark results and raw predictions of every audio file._
+    """
+    rss_before = get_rss_mb()
+    
+    start = time.perf_counter()
+    model = TFLiteModel(model_path) if model_format == "tflite" else tf.keras.models.load_model(model_path, compile=False)
+    load_time = time.perf_counter() - start
+    
+    # Warm up once so that tracing / tensor allocation is not part of the measured inference time.
+    model.predict(features_list[0][:1], verbose=0)
+    
+    predictions = []
+    start = time.perf_counter()
+    
+    for features in features_list:
+        preds = model.predict(features, verbose=0)
+        predictions.append(preds.reshape(-1, preds.shape[-1]))
+    
+    inference_time = time.perf_counter() - start
+    
+    return {
+        "load_time_s": load_time,
+        "inference_time_s": inference_time,
+        "rss_increase_mb": get_rss_mb() - rss_before,
+        "predictions": predictions
+    }
+
+
+def benchmark_model_in_subprocess(model_path : str, model_format : str, features_list : list) -> dict:
+    # A loaded Keras model leaves TensorFlow allocator pools behind that a second model would reuse,
+    # so every model is measured in its own spawned process that starts from the same state.
+    mp_context = multiprocessing.get_context("spawn")
+    
+    with concurrent.futures.ProcessPoolExecutor(max_workers=1, mp_context=mp_context) as executor:
+        return executor.submit(benchmark_model, model_path, model_format, features_list).result()
+
+
+def compute_note_agreement(reference_preds : np.ndarray, preds : np.ndarray, threshold : float) -> dict:
+    """
+    Compare the post-processed note placements of two prediction matrices.
+
+    Args:
+        reference_preds (np.ndarray): _Raw predictions of the float model._
+        preds (np.ndarray): _Raw predictions of the quantized model._
+        threshold (float): _The prediction threshold used for post-processing._
+
+    Returns:
+        dict: _Note F1 score, row agreement and raw prediction differences._
+    """
+    post_process_args = {
+        "num_lanes": NUM_LANES,
+        "prediction_threshold": threshold,
+        "use_auto_threshold": False,
+        "max_prediction_delta": threshold / NUM_LANES,
+        "prediction_frequency_bias": 0.002
+    }
+    
+    reference_notes = np.array(post_process_predictions(reference_preds, **post_process_args), dtype=bool)
+    notes = np.array(post_process_predictions(preds, **post_process_args), dtype=bool)
+    
+    matching_notes = np.sum(reference_notes & notes)
+    total_notes = np.sum(reference_notes) + np.sum(notes)
+    
+    return {
+        "note_f1": float(2 * matching_notes / total_notes) if total_notes > 0 else 1.0,
+        "row_agreement": float(np.mean(np.all(reference_notes == notes, axis=1))),
+        "max_abs_diff": float(np.max(np.abs(reference_preds - preds))),
+        "mean_abs_diff": float(np.mean(np.abs(reference_preds - preds)))
+    }
+
+
+def run_benchmark(model_path : str, quantized_path : str, audio_dir : str, model : tf.keras.Model) -> dict:
+    with open(NORM_STATS_PATH, "r") as f:
+        stats = json.load(f)
+    
+    audio_paths = sorted(
+        path for path in glob.glob(os.path.join(audio_dir, "*"))
+        if path.split('.')[-1].lower() in AUDIO_EXTENSIONS
+    )
+    
+    if not audio_paths:
+        raise RuntimeError(f"No audio files found in {audio_dir}.")
+    
+    sequence_length = model.input_shape[1]
+    
+    print(f"Extracting features for {len(audio_paths)} benchmark audio files ...")
+    
+    features_list = [
+        build_inference_windows(
+            extract_features(
+                audio_path=path,
+                audio_bpm=args.benchmark_bpm,
+                audio_start_ms=args.benchmark_start_ms,
+                note_precision=args.note_precision,
+                means=stats["means"],
+                stds=stats["stds"]
+            ).astype(np.float32),
+            sequence_length=sequence_length,
+            hop=sequence_length
+        )[0]
+        for path in audio_paths
+    ]
+    
+    quantized_results = benchmark_model_in_subprocess(quantized_path, "tflite", features_list)
+    float_results = benchmark_model_in_subprocess(model_path, "keras", features_list)
+    
+    per_file = []
+    
+    for path, reference_preds, preds in zip(audio_paths, float_results["predictions"], quantized_results["predictions"]):
+        agreement = compute_note_agreement(reference_preds, preds, threshold=args.prediction_threshold)
+        agreement["audio_file"] = os.path.basename(path)
+        per_file.append(agreement)
+    
+    report = {
+        "quantization": args.quantization,
+        "float_model_size_mb": os.path.getsize(model_path) / 1024**2,
+        "quantized_model_size_mb": os.path.getsize(quantized_path) / 1024**2,
+        "float": { k: v for k, v in float_results.items() if k != "predictions" },
+        "quantized": { k: v for k, v in quantized_results.items() if k != "predictions" },
+        "speedup": float_results["inference_time_s"] / max(quantized_results["inference_time_s"], 1e-9),
+        "mean_note_f1": float(np.mean([ entry["note_f1"] for entry in per_file ])),
+        "files": per_file
+    }
+    
+    print("\n-------- Quantization benchmark --------")
+    print(f"Model size:       {report['float_model_size_mb']:.2f} MB -> {report['quantized_model_size_mb']:.2f} MB")
+    print(f"Load time:        {report['float']['load_time_s']:.2f} s -> {report['quantized']['load_time_s']:.2f} s")
+    print(f"Inference time:   {report['float']['inference_time_s']:.2f} s -> {report['quantized']['inference_time_s']:.2f} s ({report['speedup']:.2f}x)")
+    print(f"RSS increase:     {report['float']['rss_increase_mb']:.1f} MB -> {report['quantized']['rss_increase_mb']:.1f} MB")
+    print(f"Mean note F1 vs. float model: {report['mean_note_f1']:.4f}")
+    
+    for entry in per_file:
+        print(f"  {entry['audio_file']}: note F1 {entry['note_f1']:.4f}, row agreement {entry['row_agreement']:.4f}, max |diff| {entry['max_abs_diff']:.4f}")
+    print("----------------------------------------")
+    
+    return report
+
+
+def main():
+    model = tf.keras.models.load_model(args.model_path, compile=False)
+    
+    representative_dataset = None
+    
+    if args.quantization == "int8":
+        representative_dataset = get_representative_dataset(
+            sequences_root=SEQUENCES_ROOT,
+            difficulty=args.difficulty_range,
+            num_sequences=args.calibration_sequences
+        )
+    
+    tflite_model = export_quantized_model(model, args.quantization, representative_dataset=representative_dataset)
+    
+    output_path = args.output_path or f"{os.path.splitext(args.model_path)[0]}-{args.quantization}.tflite"
+    
+    with open(output_path, "wb") as f:
+        f.write(tflite_model)
+    
+    print(f"Saved {args.quantization} quantized model to {output_path}.")
+    
+    if args.benchmark_audio_dir:
+        report = run_benchmark(args.model_path, output_path, args.benchmark_audio_dir, model=model)
+        
+        if args.report_path:
+            with open(args.report_path, "w") as f:
+                json.dump(report, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,24 @@
 import argparse
-import copy
+import glob
+import json
 import numpy as np
 import os
+import random
+import tempfile
+import time
 # -------- UNCOMMENT THIS LINE FOR MODEL TRAINING ON THE CPU --------
 # os.environ["CUDA_VISIBLE_DEVICES"] = "-1"
 # -------------------------------------------------------------------
 import tensorflow as tf
 
-from keras.callbacks import ModelCheckpoint, EarlyStopping
-from src.data_utils.dataSequenceLoader import get_difficulty_dataset
+from keras.callbacks import EarlyStopping
+from keras.losses import BinaryCrossentropy
+from keras.metrics import Recall, Precision
+from src.data_utils.dataSequenceLoader import get_augmentation_fn, get_difficulty_dataset, get_distillation_dataset, get_note_weighted_dataset, get_sequence_file_pattern
+from src.model.checkpointManager import CheckpointManager
+from src.model.featureImportance import compute_permutation_importance, load_test_sequences, print_importances
 from src.model.lstmManiaModel import build_lstm_model
+from src.model.trainingCallbacks import BackupEpochMarker, SamplingScheduleCallback, StepRateLogger, StepTimeProfiler, TimeToTargetCallback
 
 
 parser = argparse.ArgumentParser()
@@ -19,13 +28,77 @@ parser.add_argument("--note_precision", type=int, default=2)
 parser.add_argument("--sequence_length", type=int, default=64)
 parser.add_argument("--output_dir", type=str, default=os.path.join(os.getcwd(), "models"))
 parser.add_argument("--epochs", type=int, default=100)
+parser.add_argument("--steps_per_epoch", type=int, default=500)
+parser.add_argument("--validation_steps", type=int, default=100)
+parser.add_argument("--teacher_model_path", type=str, default="")
+parser.add_argument("--student_lstm_units", type=str, default="64,32")
+parser.add_argument("--student_dense_units", type=int, default=32)
+parser.add_argument("--distill_alpha", type=float, default=1.0)
+parser.add_argument("--unidirectional", action="store_true")
+parser.add_argument("--fast", action="store_true")
+parser.add_argument("--intra_op_threads", type=int, default=0)
+parser.add_argument("--inter_op_threads", type=int, default=0)
+parser.add_argument("--distributed", action="store_true")
+parser.add_argument("--backup_dir", type=str, default=os.path.join(os.getcwd(), "checkpoints", "backup"))
+parser.add_argument("--checkpoint_dir", type=str, default=os.path.join(os.getcwd(), "checkpoints"))
+parser.add_argument("--keep_checkpoints", type=int, default=3)
+parser.add_argument("--seed", type=int, default=-1)
+parser.add_argument("--profile", action="store_true")
+parser.add_argument("--profile_dir", type=str, default=os.path.join(os.getcwd(), "logs", "profile"))
+parser.add_argument("--trace_steps", type=str, default="")
+parser.add_argument("--note_sampling_alpha", type=float, default=0.0)
+parser.add_argument("--sampling_anneal_epochs", type=int, default=10)
+parser.add_argument("--target_val_loss", type=float, default=0.0)
+parser.add_argument("--ab_report_path", type=str, default=os.path.join(os.getcwd(), "logs", "time_to_target.jsonl"))
+parser.add_argument("--lane_mirror_prob", type=float, default=0.0)
+parser.add_argument("--lane_permute_prob", type=float, default=0.0)
+parser.add_argument("--feature_noise_std", type=float, default=0.0)
+parser.add_argument("--rms_gain_db", type=float, default=0.0)
 args = parser.parse_args()
 
 SEQUENCES_ROOT = os.path.join(os.getcwd(), "data", "sequences")
+TEACHER_PREDICTIONS_ROOT = os.path.join(os.getcwd(), "data", "teacher_predictions")
+NORM_STATS_PATH = os.path.join(os.getcwd(), "feature_norm_stats.json")
 DATA_NOTE_PRECISION = args.note_precision
 GPU_MAX_VRAM = args.max_vram_mb
 MODEL_SEQUENCE_LENGTH = args.sequence_length
 MODEL_TARGET_DIFFICULTY = args.difficulty_range
+MODEL_BIDIRECTIONAL = not args.unidirectional
+
+# Knowledge distillation is enabled by passing a teacher model.
+USE_DISTILLATION = bool(args.teacher_model_path)
+STUDENT_LSTM_UNITS = tuple(int(units) for units in args.student_lstm_units.split(","))
+STUDENT_DENSE_UNITS = args.student_dense_units
+DISTILL_ALPHA = args.distill_alpha
+
+# Fast training mode: XLA compilation and mixed precision (if supported by the hardware).
+USE_FAST_TRAINING = args.fast
+
+if USE_DISTILLATION and args.distributed:
+    parser.error("--teacher_model_path cannot be combined with --distributed.")
+
+# Note-aware sampling: training sequences are drawn with weights (note count + 1)^alpha, alpha is annealed to 0.
+USE_NOTE_SAMPLING = args.note_sampling_alpha > 0
+
+if USE_DISTILLATION and USE_NOTE_SAMPLING:
+    parser.error("--teacher_model_path cannot be combined with --note_sampling_alpha.")
+
+# On-the-fly augmentation of the training batches (lane mirroring / permutation, feature noise, RMS gain).
+USE_AUGMENTATION = (args.lane_mirror_prob > 0) or (args.lane_permute_prob > 0) or (args.feature_noise_std > 0) or (args.rms_gain_db > 0)
+
+if args.lane_mirror_prob + args.lane_permute_prob > 1:
+    parser.error("--lane_mirror_prob and --lane_permute_prob must not add up to more than 1.")
+
+if args.keep_checkpoints < 1:
+    parser.error("--keep_checkpoints must be at least 1.")
+
+
+# Thread settings must be applied before TensorFlow executes any operation (0 = TensorFlow default).
+if args.intra_op_threads > 0:
+    tf.config.threading.set_intra_op_parallelism_threads(args.intra_op_threads)
+
+if args.inter_op_threads > 0:
+    tf.config.threading.set_inter_op_parallelism_threads(args.inter_op_threads)
 
 
 # Prevent tensorflow from taking all VRAM from the GPU
@@ -38,97 +111,454 @@ if gpus:
         print(e)
 
 
+def cpu_supports_bf16() -> bool:
+    """
+    Check whether the CPU has native bfloat16 instructions (AVX512-BF16 or AMX-BF16).
+
+    Returns:
+        bool: _True if bfloat16 is supported natively._
+    """
+    try:
+        with open("/proc/cpuinfo", "r") as f:
+            cpu_flags = f.read()
+    except OSError:
+        return False
+    
+    return ("avx512_bf16" in cpu_flags) or ("amx_bf16" in cpu_flags)
+
+
+def get_mixed_precision_policy() -> str:
+    """
+    Choose the mixed precision policy for the available hardware.
+
+    Returns:
+        str: _The Keras dtype policy name._
+    """
+    if gpus:
+        return "mixed_float16"
+    
+    if cpu_supports_bf16():
+        return "mixed_bfloat16"
+    
+    return "float32"
+
+
+if USE_FAST_TRAINING:
+    mixed_precision_policy = get_mixed_precision_policy()
+    tf.keras.mixed_precision.set_global_policy(mixed_precision_policy)
+    print(f"Fast training mode: XLA enabled, dtype policy '{mixed_precision_policy}'.")
+
+
+# -------- Multi-worker training --------
+# The cluster is described by the TF_CONFIG environment variable (see distributedLauncher.py).
+# The strategy has to be created before TensorFlow executes any operation.
+USE_DISTRIBUTED_TRAINING = args.distributed
+TF_CONFIG = json.loads(os.environ.get("TF_CONFIG", "{}"))
+
+if USE_DISTRIBUTED_TRAINING:
+    strategy = tf.distribute.MultiWorkerMirroredStrategy()
+    NUM_WORKERS = len(TF_CONFIG.get("cluster", {}).get("worker", [])) or 1
+    WORKER_INDEX = int(TF_CONFIG.get("task", {}).get("index", 0))
+    IS_CHIEF = (WORKER_INDEX == 0)
+    print(f"Distributed training: worker {WORKER_INDEX + 1} / {NUM_WORKERS}.")
+else:
+    strategy = tf.distribute.get_strategy()
+    NUM_WORKERS = 1
+    WORKER_INDEX = 0
+    IS_CHIEF = True
+# ---------------------------------------
+
+
+def get_worker_path(path : str) -> str:
+    """
+    Return the path a worker should save a model to. In multi-worker training all workers
+    have to save, but only the chief writes to the actual path; the others write to a temporary directory.
+
+    Args:
+        path (str): _The path the model should be saved to._
+
+    Returns:
+        str: _The path for this worker._
+    """
+    if IS_CHIEF:
+        return path
+    
+    worker_dir = os.path.join(tempfile.gettempdir(), f"rhythmapper_worker_{WORKER_INDEX}")
+    os.makedirs(worker_dir, exist_ok=True)
+    
+    return os.path.join(worker_dir, os.path.basename(path))
+
+
+def get_backup_and_restore_callback(backup_dir : str) -> tf.keras.callbacks.Callback:
+    # BackupAndRestore left the experimental namespace in TensorFlow 2.8.
+    if hasattr(tf.keras.callbacks, "BackupAndRestore"):
+        return tf.keras.callbacks.BackupAndRestore(backup_dir=backup_dir)
+    
+    return tf.keras.callbacks.experimental.BackupAndRestore(backup_dir=backup_dir)
+
+
 def split_X_y(batch):
     # X: all columns except last 4 columns.
     # y: last 4 columns.
     return batch[:, :, :7], batch[:, :, 7:]
 
 
-def main():
-    # Create datasets.
-    train_ds = get_difficulty_dataset(
-        sequences_root=SEQUENCES_ROOT,
-        difficulty=MODEL_TARGET_DIFFICULTY,
-        split="train",
-        batch_size=64
-    )
+def split_X_soft_y(batch, soft_targets):
+    # X: all columns except last 4 columns.
+    # y: teacher soft targets blended with the last 4 (hard label) columns.
+    hard_targets = tf.cast(batch[:, :, 7:], soft_targets.dtype)
+    X = tf.cast(batch[:, :, :7], soft_targets.dtype)
     
-    test_ds = get_difficulty_dataset(
-        sequences_root=SEQUENCES_ROOT,
-        difficulty=MODEL_TARGET_DIFFICULTY,
-        split="test",
-        batch_size=64
-    )
+    return X, DISTILL_ALPHA * soft_targets + (1.0 - DISTILL_ALPHA) * hard_targets
+
+
+def cache_teacher_predictions(teacher_model_path : str, sequences_root : str, difficulty : str, batch_size : int = 256) -> str:
+    """
+    Run the teacher model once over every sequence shard of a difficulty and
+    save its per-lane sigmoid outputs next to each other in a cache directory.
+    Shards whose cache is newer than the teacher model are not predicted again.
+
+    Args:
+        teacher_model_path (str): _The path to the trained teacher .keras-file._
+        sequences_root (str): _Root directory where difficulty folders are stored._
+        difficulty (str): _Difficulty label (e.g. "3-4_stars")._
+        batch_size (int, optional): _Batch size used for the teacher predictions._ Defaults to 256.
+
+    Returns:
+        str: _The root directory of the cached teacher predictions._
+    """
+    teacher_name = os.path.splitext(os.path.basename(teacher_model_path))[0]
+    cache_root = os.path.join(TEACHER_PREDICTIONS_ROOT, teacher_name)
+    teacher_mtime = os.path.getmtime(teacher_model_path)
+    teacher = None
     
-    # Map to (X, y) pairs.
-    train_ds = train_ds.map(split_X_y)
-    test_ds = test_ds.map(split_X_y)
+    for split in ["train", "test"]:
+        pattern = os.path.join(sequences_root, difficulty, split, f"{difficulty}_{split}_sequences_*.npy")
+        cache_dir = os.path.join(cache_root, difficulty, split)
+        os.makedirs(cache_dir, exist_ok=True)
+        
+        for fname in sorted(glob.glob(pattern)):
+            cache_path = os.path.join(cache_dir, os.path.basename(fname))
+            sequences = np.load(fname, mmap_mode='r')
+            
+            # Skip shards that are already cached for this teacher.
+            if os.path.exists(cache_path) and os.path.getmtime(cache_path) >= max(teacher_mtime, os.path.getmtime(fname)):
+                cached = np.load(cache_path, mmap_mode='r')
+                
+                if cached.shape[:2] == sequences.shape[:2]:
+                    continue
+            
+            if teacher is None:
+                print(f"Loading teacher model {teacher_model_path}.")
+                teacher = tf.keras.models.load_model(teacher_model_path, compile=False)
+            
+            print(f"Caching teacher predictions for {os.path.basename(fname)} ...")
+            
+            # Write to a temporary file first, an interrupted run must not leave a zero-filled cache behind.
+            soft_targets = np.lib.format.open_memmap(
+                cache_path + ".tmp",
+                mode="w+",
+                dtype=np.float32,
+                shape=(sequences.shape[0], sequences.shape[1], sequences.shape[2] - 7)
+            )
+            
+            # Predict in chunks so that large shards do not have to fit into memory at once.
+            chunk_size = batch_size * 64
+            
+            for start in range(0, sequences.shape[0], chunk_size):
+                X = np.asarray(sequences[start:start + chunk_size, :, :7], dtype=np.float32)
+                soft_targets[start:start + chunk_size] = teacher.predict(X, batch_size=batch_size, verbose=0)
+            
+            soft_targets.flush()
+            del soft_targets
+            os.replace(cache_path + ".tmp", cache_path)
     
-    # Build the model.
-    num_features = 7
-    output_dim = 4
+    return cache_root
+
+
+def main():
+    model_code = f"{MODEL_TARGET_DIFFICULTY}-P{DATA_NOTE_PRECISION}-S{MODEL_SEQUENCE_LENGTH}"
     
-    model = None
+    if USE_DISTILLATION:
+        model_code += "-student"
     
-    checkpoint_callback = ModelCheckpoint(
-        "checkpoint_model.keras",
-        save_best_only=False,
-        save_weights_only=False
-    )
+    if not MODEL_BIDIRECTIONAL:
+        model_code += "-U"
+    
+    batch_size = 64
+    steps_per_epoch = args.steps_per_epoch
+    num_features = 7
     
+    # -------- Resumable checkpoints --------
+    # Every model has its own checkpoint directory. If it contains a checkpoint, the interrupted run
+    # continues with the same seed, epoch, early-stopping state and position in the training shards.
+    # The training sequences, their order and their augmentation only depend on the seed and this position,
+    # so the resumed run trains on the same batches as an uninterrupted run. Only the dropout masks differ,
+    # they are drawn by stateful TensorFlow kernels that cannot be restored.
+    # Distributed runs are restored by BackupAndRestore instead. The launcher passes the same seed to every worker
+    # and every restart, and a restarted worker continues its shard at the epoch of the backup (see BackupEpochMarker).
     early_stop = EarlyStopping(
         monitor="val_loss",
         patience=10,
         restore_best_weights=True
     )
     
-    if not os.path.exists("checkpoint_model.keras"):
-        print("Creating new model.")
-        model = build_lstm_model(input_shape=(MODEL_SEQUENCE_LENGTH, num_features), output_dim=output_dim)
+    checkpoint_manager = None
+    checkpoint_state = None
+    initial_epoch = 0
+    start_offset = 0
+    seed = args.seed if args.seed >= 0 else random.randrange(2**31)
+    
+    if not USE_DISTRIBUTED_TRAINING:
+        checkpoint_manager = CheckpointManager(
+            checkpoint_dir=os.path.join(args.checkpoint_dir, model_code),
+            max_to_keep=args.keep_checkpoints,
+            early_stopping=early_stop,
+            batch_size=batch_size
+        )
+        checkpoint_state = checkpoint_manager.latest_state()
+        
+        if checkpoint_state is not None:
+            seed = checkpoint_state["seed"]
+            initial_epoch = checkpoint_state["epoch"]
+            start_offset = checkpoint_state["cursor"]
+        
+        checkpoint_manager.seed = seed
+        checkpoint_manager.start_offset = start_offset
     else:
-        print("Continuing last mode from checkpoint_model.keras file.")
-        model = tf.keras.models.load_model("checkpoint_model.keras")
+        # Every worker trains on batch_size sequences of its own shard per step.
+        backup_marker_path = os.path.join(args.backup_dir, f"worker_{WORKER_INDEX}_epoch.json")
+        start_offset = BackupEpochMarker.read_epoch(backup_marker_path) * steps_per_epoch * batch_size
+    
+    tf.random.set_seed(seed)
+    np.random.seed(seed)
+    random.seed(seed)
+    # ---------------------------------------
+    
+    # Step-time profiling (optional): the training dataset is instrumented around its prefetch buffer.
+    step_profiler = None
+    
+    if args.profile or args.trace_steps:
+        trace_steps = tuple(int(step) for step in args.trace_steps.split(",")) if args.trace_steps else None
+        
+        if trace_steps is not None and len(trace_steps) != 2:
+            raise ValueError(f"--trace_steps must be the first and last step of the trace window (e.g. \"100,110\"), got \"{args.trace_steps}\".")
+        step_profiler = StepTimeProfiler(
+            log_dir=args.profile_dir,
+            run_name=f"{model_code}_{time.strftime('%Y%m%d-%H%M%S')}",
+            trace_steps=trace_steps
+        )
+    
+    # Training batches are augmented in the tf.data graph, the test batches are never augmented.
+    augment = None
+    
+    if USE_AUGMENTATION:
+        # The RMS gain is applied to the unnormalized RMS, which needs the normalization stats of the splitter.
+        with open(NORM_STATS_PATH, "r") as f:
+            norm_stats = json.load(f)
+        
+        augment = get_augmentation_fn(
+            rms_mean=norm_stats["means"][num_features - 1],
+            rms_std=norm_stats["stds"][num_features - 1],
+            lane_mirror_prob=args.lane_mirror_prob,
+            lane_permute_prob=args.lane_permute_prob,
+            feature_noise_std=args.feature_noise_std,
+            rms_gain_db=args.rms_gain_db,
+            num_features=num_features,
+            seed=seed
+        )
+        print(f"Augmentation: lane mirror p={args.lane_mirror_prob:g}, lane permute p={args.lane_permute_prob:g}, feature noise std={args.feature_noise_std:g}, RMS gain ±{args.rms_gain_db:g} dB.")
+    
+    # Create datasets.
+    if USE_DISTILLATION:
+        soft_targets_root = cache_teacher_predictions(
+            teacher_model_path=args.teacher_model_path,
+            sequences_root=SEQUENCES_ROOT,
+            difficulty=MODEL_TARGET_DIFFICULTY
+        )
+        
+        train_ds = get_distillation_dataset(
+            sequences_root=SEQUENCES_ROOT,
+            soft_targets_root=soft_targets_root,
+            difficulty=MODEL_TARGET_DIFFICULTY,
+            split="train",
+            batch_size=batch_size,
+            start_offset=start_offset,
+            seed=seed,
+            pipeline_probe=step_profiler,
+            augment=augment
+        )
+        
+        test_ds = get_distillation_dataset(
+            sequences_root=SEQUENCES_ROOT,
+            soft_targets_root=soft_targets_root,
+            difficulty=MODEL_TARGET_DIFFICULTY,
+            split="test",
+            batch_size=batch_size
+        )
+        
+        # Map to (X, soft y) pairs.
+        train_ds = train_ds.map(split_X_soft_y)
+        test_ds = test_ds.map(split_X_soft_y)
+    elif USE_NOTE_SAMPLING:
+        # The sampler draws randomly instead of reading the shards in order, the loader cursor is the number of draws.
+        # Workers of a distributed run draw from their own shard of the sequences with different seeds.
+        # The dataset is batched with the global batch size, but every worker only trains on batch_size sequences per step.
+        train_ds, note_sampler = get_note_weighted_dataset(
+            sequences_root=SEQUENCES_ROOT,
+            difficulty=MODEL_TARGET_DIFFICULTY,
+            split="train",
+            batch_size=batch_size * NUM_WORKERS,
+            alpha=args.note_sampling_alpha,
+            seed=seed + WORKER_INDEX,
+            anneal_epochs=args.sampling_anneal_epochs,
+            sequences_per_epoch=steps_per_epoch * batch_size,
+            num_shards=NUM_WORKERS,
+            shard_index=WORKER_INDEX,
+            start_offset=start_offset,
+            pipeline_probe=step_profiler,
+            augment=augment
+        )
+    else:
+        # Every worker reads its own shard of the sequences. The batch size is the global
+        # batch size across all workers, so that every worker still trains on 64 sequences per step.
+        train_ds = get_difficulty_dataset(
+            sequences_root=SEQUENCES_ROOT,
+            difficulty=MODEL_TARGET_DIFFICULTY,
+            split="train",
+            batch_size=batch_size * NUM_WORKERS,
+            num_shards=NUM_WORKERS,
+            shard_index=WORKER_INDEX,
+            start_offset=start_offset,
+            seed=seed,
+            pipeline_probe=step_profiler,
+            augment=augment
+        )
+    
+    if not USE_DISTILLATION:
+        # Validation always uses the uniform test sequences, so runs with and without note sampling are comparable.
+        test_ds = get_difficulty_dataset(
+            sequences_root=SEQUENCES_ROOT,
+            difficulty=MODEL_TARGET_DIFFICULTY,
+            split="test",
+            batch_size=batch_size * NUM_WORKERS,
+            num_shards=NUM_WORKERS,
+            shard_index=WORKER_INDEX
+        )
+        
+        # Map to (X, y) pairs.
+        train_ds = train_ds.map(split_X_y)
+        test_ds = test_ds.map(split_X_y)
+    
+    # Build the model.
+    output_dim = 4
+    
+    model = None
+    # Checkpoint file of older versions, only used if there is no resumable checkpoint.
+    checkpoint_path = "checkpoint_student_model.keras" if USE_DISTILLATION else "checkpoint_model.keras"
+    
+    # The checkpoint manager has to come after the early stopping callback to restore its state.
+    callbacks = [early_stop, StepRateLogger()]
+    
+    if checkpoint_manager is not None:
+        callbacks.append(checkpoint_manager)
+    
+    if step_profiler is not None:
+        callbacks.append(step_profiler)
+    
+    if USE_NOTE_SAMPLING:
+        callbacks.append(SamplingScheduleCallback(note_sampler))
+    
+    if args.target_val_loss > 0 and IS_CHIEF:
+        sampling = f"alpha{args.note_sampling_alpha:g}-anneal{args.sampling_anneal_epochs}" if USE_NOTE_SAMPLING else "uniform"
+        callbacks.append(TimeToTargetCallback(
+            target_val_loss=args.target_val_loss,
+            report_path=args.ab_report_path,
+            run_info={
+                "run": f"{model_code}_{sampling}_{time.strftime('%Y%m%d-%H%M%S')}",
+                "sampling": sampling,
+                "note_sampling_alpha": args.note_sampling_alpha,
+                "sampling_anneal_epochs": args.sampling_anneal_epochs,
+                "seed": seed
+            }
+        ))
+    
+    # Models and optimizers must be created within the scope of the distribution strategy.
+    with strategy.scope():
+        if USE_DISTRIBUTED_TRAINING:
+            # Restarted workers continue from the last epoch of the backup instead of the checkpoint file.
+            print("Creating new model (restoring from backup if available).")
+            model = build_lstm_model(
+                input_shape=(MODEL_SEQUENCE_LENGTH, num_features),
+                output_dim=output_dim,
+                bidirectional=MODEL_BIDIRECTIONAL,
+                jit_compile=USE_FAST_TRAINING
+            )
+            callbacks.insert(0, get_backup_and_restore_callback(args.backup_dir))
+            callbacks.insert(1, BackupEpochMarker(backup_marker_path))
+        elif checkpoint_state is None and os.path.exists(checkpoint_path):
+            print(f"Continuing last mode from {checkpoint_path} file.")
+            model = tf.keras.models.load_model(checkpoint_path)
+            
+            if USE_FAST_TRAINING:
+                # Recompile with XLA, keeping the loss and the optimizer state of the checkpoint.
+                model.compile(optimizer=model.optimizer, loss=model.loss, metrics=[] if USE_DISTILLATION else [Precision(), Recall()], jit_compile=True)
+        elif USE_DISTILLATION:
+            print(f"Creating new student model (LSTM units: {STUDENT_LSTM_UNITS}, Dense units: {STUDENT_DENSE_UNITS}).")
+            
+            # Plain binary crossentropy is minimal when the student matches the (soft) teacher outputs.
+            # Precision and recall would count every non-zero soft target as a note, so the student has no metrics.
+            model = build_lstm_model(
+                input_shape=(MODEL_SEQUENCE_LENGTH, num_features),
+                output_dim=output_dim,
+                lstm_units=STUDENT_LSTM_UNITS,
+                dense_units=STUDENT_DENSE_UNITS,
+                loss=BinaryCrossentropy(),
+                bidirectional=MODEL_BIDIRECTIONAL,
+                jit_compile=USE_FAST_TRAINING,
+                metrics=[]
+            )
+        else:
+            print("Creating new model.")
+            model = build_lstm_model(
+                input_shape=(MODEL_SEQUENCE_LENGTH, num_features),
+                output_dim=output_dim,
+                bidirectional=MODEL_BIDIRECTIONAL,
+                jit_compile=USE_FAST_TRAINING
+            )
+    
+    if checkpoint_state is not None:
+        checkpoint_manager.restore(model)
+        
+        if initial_epoch >= args.epochs:
+            print(f"The checkpoint already reached epoch {initial_epoch} of {args.epochs}, increase --epochs to continue training.")
     
     # Train the model using the test set for validation.
     model.fit(
         train_ds,
         validation_data = test_ds,
+        initial_epoch=initial_epoch,
         epochs=args.epochs,
-        steps_per_epoch=500,
-        validation_steps=100,
-        callbacks=[checkpoint_callback, early_stop]
+        steps_per_epoch=steps_per_epoch,
+        validation_steps=args.validation_steps,
+        callbacks=callbacks
     )
     
-    model_code = f"{MODEL_TARGET_DIFFICULTY}-P{DATA_NOTE_PRECISION}-S{MODEL_SEQUENCE_LENGTH}"
     2
-    model.save(os.path.join(args.output_dir, f"model-{model_code}.keras"), overwrite=False)
-
-    
-    # -------- Display feature importance --------
-    X_val, y_val = next(iter(test_ds))
-    X_val = X_val.numpy()
-    y_val = y_val.numpy()
-    
-    baseline = tf.keras.losses.binary_crossentropy(y_val, model.predict(X_val)).numpy().mean()
+    model.save(get_worker_path(os.path.join(args.output_dir, f"model-{model_code}.keras")), overwrite=not IS_CHIEF)
     
-    importances = []
+    # Prediction would also run distributed, so the feature importance is skipped for multi-worker runs.
+    if USE_DISTRIBUTED_TRAINING:
+        return
     
-    feature_names = ["mfcc0", "mfcc1", "mfcc2", "mfcc3", "mfcc4", "onset", "rms"]
-    
-    for i in range(X_val.shape[-1]):
-        X_permuted = copy.deepcopy(X_val)
-        flat = X_permuted[..., i].flatten()
-        
-        np.random.shuffle(flat)
-        X_permuted[..., i] = flat.reshape(X_permuted[..., i].shape)
-        score = tf.keras.losses.binary_crossentropy(y_val, model.predict(X_permuted)).numpy().mean()
-        
-        importances.append(score - baseline)
-    
-    print("Permutation feature importances:")
+    # -------- Display feature importance --------
+    X_val, y_val = load_test_sequences(
+        get_sequence_file_pattern(SEQUENCES_ROOT, MODEL_TARGET_DIFFICULTY, "test"),
+        num_sequences=1024,
+        seed=seed
+    )
     
-    for name, imp in zip(feature_names, importances):
-        print(f"{name}: {imp:.5f}")
+    print_importances(compute_permutation_importance(model, X_val, y_val, num_repeats=3, seed=seed))
     # --------------------------------------------
 
 
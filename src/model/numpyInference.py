@@ -0,0 +1,426 @@
+import argparse
+import h5py
+import io
+import json
+import numpy as np
+import os
+import re
+import zipfile
+
+
+def sigmoid(x : np.ndarray) -> np.ndarray:
+    # Numerically stable formulation of 1 / (1 + exp(-x)).
+    return 0.5 * (1.0 + np.tanh(0.5 * x))
+
+
+def hard_sigmoid(x : np.ndarray) -> np.ndarray:
+    return np.clip(0.2 * x + 0.5, 0.0, 1.0)
+
+
+ACTIVATIONS = {
+    "linear": lambda x: x,
+    "relu": lambda x: np.maximum(x, 0.0),
+    "sigmoid": sigmoid,
+    "hard_sigmoid": hard_sigmoid,
+    "tanh": np.tanh
+}
+
+# Layers that only have an effect during training.
+NO_OP_LAYERS = [ "InputLayer", "Dropout", "SpatialDropout1D", "GaussianNoise", "GaussianDropout" ]
+
+
+def get_activation(name : str):
+    if name not in ACTIVATIONS:
+        raise ValueError(f"Unsupported activation '{name}'. Supported activations: {list(ACTIVATIONS.keys())}")
+    
+    return ACTIVATIONS[name]
+
+
+def run_lstm(x : np.ndarray, weights : list, config : dict, initial_state : tuple = None) -> tuple:
+    """
+    Run a Keras LSTM layer over a batch of sequences.
+
+    Args:
+        x (np.ndarray): _Input with the shape (batch_size, timesteps, features)._
+        weights (list): _Kernel, recurrent kernel and (optionally) bias of the layer._
+        config (dict): _The Keras layer config._
+        initial_state (tuple, optional): _Initial (h, c) state per sequence._ Defaults to zeros.
+
+    Returns:
+        tuple: _The layer output and the final (h, c) state._
+    """
+    kernel, recurrent_kernel = weights[0], weights[1]
+    bias = weights[2] if len(weights) > 2 else np.zeros(kernel.shape[1], dtype=kernel.dtype)
+    units = recurrent_kernel.shape[0]
+    
+    activation = get_activation(config.get("activation", "tanh"))
+    recurrent_activation = get_activation(config.get("recurrent_activation", "sigmoid"))
+    
+    if config.get("go_backwards", False):
+        x = x[:, ::-1]
+    
+    # The input projection does not depend on the state, so it is computed for all timesteps at once.
+    z_x = x @ kernel + bias
+    
+    batch_size, timesteps = x.shape[0], x.shape[1]
+    
+    if initial_state is None:
+        h = np.zeros((batch_size, units), dtype=z_x.dtype)
+        c = np.zeros((batch_size, units), dtype=z_x.dtype)
+    else:
+        h, c = initial_state
+    
+    outputs = np.empty((batch_size, timesteps, units), dtype=z_x.dtype)
+    
+    # Gate order in Keras: input, forget, cell, output.
+    for t in range(timesteps):
+        z = z_x[:, t] + h @ recurrent_kernel
+        
+        i = recurrent_activation(z[:, :units])
+        f = recurrent_activation(z[:, units:2 * units])
+        c = f * c + i * activation(z[:, 2 * units:3 * units])
+        o = recurrent_activation(z[:, 3 * units:])
+        h = o * activation(c)
+        
+        outputs[:, t] = h
+    
+    if not config.get("return_sequences", False):
+        return h, (h, c)
+    
+    return outputs, (h, c)
+
+
+def read_keras_file(model_path : str) -> tuple:
+    """
+    Read the model config and all layer weights from a .keras-file.
+    Both the legacy HDF5 format (TensorFlow < 2.12) and the zipped
+    Keras v3 format are supported.
+
+    Args:
+        model_path (str): _The path to the .keras-file._
+
+    Returns:
+        tuple: _The model config (dict) and a dict mapping layer names to their weights._
+    """
+    if zipfile.is_zipfile(model_path):
+        with zipfile.ZipFile(model_path, "r") as archive:
+            config = json.loads(archive.read("config.json"))
+            weights_file = io.BytesIO(archive.read("model.weights.h5"))
+        
+        with h5py.File(weights_file, "r") as f:
+            root = f["layers"] if "layers" in f else f
+            weights = {
+                layer["config"]["name"]: collect_v3_weights(root[storage_key])
+                for layer, storage_key in zip(config["config"]["layers"], get_v3_storage_keys(config["config"]["layers"]))
+                if storage_key is not None and storage_key in root
+            }
+        
+        return config, weights
+    
+    with h5py.File(model_path, "r") as f:
+        model_config = f.attrs["model_config"]
+        config = json.loads(model_config.decode("utf-8") if isinstance(model_config, bytes) else model_config)
+        weights_root = f["model_weights"]
+        weights = {}
+        
+        for layer_name in weights_root.attrs["layer_names"]:
+            layer_name = layer_name.decode("utf-8") if isinstance(layer_name, bytes) else layer_name
+            group = weights_root[layer_name]
+            weight_names = [ n.decode("utf-8") if isinstance(n, bytes) else n for n in group.attrs["weight_names"] ]
+            weights[layer_name] = [ np.asarray(group[n]) for n in weight_names ]
+    
+    return config, weights
+
+
+def get_v3_storage_keys(layer_configs : list) -> list:
+    """
+    Get the keys under which the Keras v3 format stores the weights of the layers of a model.
+    The weights are not stored by layer name but by the snake_case class name plus a counter
+    per class in layer order (lstm, lstm_1, dense, ...), like keras saving_lib._save_container_state.
+
+    Args:
+        layer_configs (list): _The layer configs of the model config, in layer order._
+
+    Returns:
+        list: _The storage key of every layer (None for the input layer, which is not stored)._
+    """
+    used_names = {}
+    storage_keys = []
+    
+    for layer in layer_configs:
+        # The input layer is not part of model.layers, so it does not take a key.
+        if layer["class_name"] == "InputLayer":
+            storage_keys.append(None)
+            continue
+        
+        intermediate = re.sub("(.)([A-Z][a-z0-9]+)", r"\1_\2", layer["class_name"])
+        name = re.sub("([a-z])([A-Z])", r"\1_\2", intermediate).lower()
+        
+        if name in used_names:
+            used_names[name] += 1
+            name = f"{name}_{used_names[name]}"
+        else:
+            used_names[name] = 0
+        
+        storage_keys.append(name)
+    
+    return storage_keys
+
+
+def collect_v3_weights(group) -> list:
+    """
+    Collect the variables of a layer stored in the Keras v3 weights format
+    in the same order as layer.weights (forward before backward layer).
+
+    Args:
+        group (h5py.Group): _The weights group of a layer._
+
+    Returns:
+        list: _The layer weights._
+    """
+    weights = []
+    
+    if "vars" in group:
+        weights += [ np.asarray(group["vars"][key]) for key in sorted(group["vars"].keys(), key=int) ]
+    
+    children = [ key for key in group.keys() if key != "vars" and isinstance(group[key], h5py.Group) ]
+    children.sort(key=lambda key: (not key.startswith("forward"), key))
+    
+    for key in children:
+        weights += collect_v3_weights(group[key])
+    
+    return weights
+
+
+class NumpyModel:
+    """
+    NumPy-only forward pass of a sequential model created by build_lstm_model()
+    (Bidirectional / unidirectional LSTM, Dropout, (TimeDistributed) Dense).
+    Provides a predict() method compatible with keras.Model.predict().
+    """
+    def __init__(self, model_path : str):
+        config, weights = read_keras_file(model_path)
+        
+        if config["class_name"] != "Sequential":
+            raise ValueError(f"Only sequential models are supported, got '{config['class_name']}'.")
+        
+        self.layers = []
+        self.input_shape = None
+        
+        for layer in config["config"]["layers"]:
+            class_name = layer["class_name"]
+            layer_config = layer["config"]
+            layer_weights = [ w.astype(np.float32) for w in weights.get(layer_config["name"], []) ]
+            
+            if class_name == "InputLayer":
+                self.input_shape = tuple(layer_config.get("batch_input_shape", layer_config.get("batch_shape")))
+            
+            if class_name in NO_OP_LAYERS:
+                continue
+            
+            if class_name not in [ "Bidirectional", "LSTM", "TimeDistributed", "Dense" ]:
+                raise ValueError(f"Unsupported layer '{class_name}' in {model_path}.")
+            
+            self.layers.append((class_name, layer_config, layer_weights))
+
+
+    def is_streamable(self) -> bool:
+        """
+        Check whether the model only processes its inputs forwards in time,
+        i.e. whether it can be run chunk by chunk with carried hidden states.
+
+        Returns:
+            bool: _True if the model contains no Bidirectional or backwards LSTM layers._
+        """
+        return all(
+            class_name != "Bidirectional" and not config.get("go_backwards", False)
+            for class_name, config, _ in self.layers
+        )
+
+
+    def forward(self, x : np.ndarray, states : list = None) -> tuple:
+        """
+        Run the forward pass of the model.
+
+        Args:
+            x (np.ndarray): _Input with the shape (batch_size, timesteps, features)._
+            states (list, optional): _Initial (h, c) states of every unidirectional LSTM layer._ Defaults to zeros.
+
+        Returns:
+            tuple: _The model output and the final (h, c) states of every unidirectional LSTM layer._
+        """
+        final_states = []
+        lstm_idx = 0
+        
+        for class_name, config, weights in self.layers:
+            if class_name == "Bidirectional":
+                if config.get("merge_mode", "concat") != "concat":
+                    raise ValueError("Only the 'concat' merge mode is supported for Bidirectional layers.")
+                
+                inner_config = config["layer"]["config"]
+                num_forward_weights = len(weights) // 2
+                
+                forward, _ = run_lstm(x, weights[:num_forward_weights], dict(inner_config, go_backwards=False))
+                backward, _ = run_lstm(x, weights[num_forward_weights:], dict(inner_config, go_backwards=True))
+                
+                # The backward outputs are reversed again, so that both directions align in time.
+                if inner_config.get("return_sequences", False):
+                    backward = backward[:, ::-1]
+                
+                x = np.concatenate([ forward, backward ], axis=-1)
+            elif class_name == "LSTM":
+                initial_state = states[lstm_idx] if states is not None else None
+                x, state = run_lstm(x, weights, config, initial_state=initial_state)
+                final_states.append(state)
+                lstm_idx += 1
+            else:
+                # Dense layers are applied on the last axis, so TimeDistributed(Dense) needs no special treatment.
+                dense_config = config["layer"]["config"] if class_name == "TimeDistributed" else config
+                x = x @ weights[0]
+                
+                if len(weights) > 1:
+                    x = x + weights[1]
+                
+                x = get_activation(dense_config.get("activation", "linear"))(x)
+        
+        return x, final_states
+
+
+    def predict_stateful(self, features : np.ndarray, states : list = None) -> tuple:
+        """
+        Run a streamable model on the next chunk of a continuous sequence,
+        continuing from the hidden states of the previous chunk.
+
+        Args:
+            features (np.ndarray): _The next chunk with the shape (batch_size, chunk_length, num_features)._
+            states (list, optional): _The states returned for the previous chunk._ Defaults to None (start of the sequence).
+
+        Raises:
+            ValueError: _The model contains layers that need the whole sequence at once._
+
+        Returns:
+            tuple: _The model outputs for the chunk and the states to pass with the next chunk._
+        """
+        if not self.is_streamable():
+            raise ValueError("Stateful inference requires a unidirectional model (train it with --unidirectional).")
+        
+        return self.forward(np.asarray(features, dtype=np.float32), states=states)
+
+
+    def predict(self, features : np.ndarray, batch_size : int = 256, verbose : int = 0) -> np.ndarray:
+        """
+        Run the model on a batch of sequences.
+
+        Args:
+            features (np.ndarray): _Input sequences with the shape (num_sequences, sequence_length, num_features)._
+            batch_size (int, optional): _The amount of sequences per forward pass._ Defaults to 256.
+            verbose (int, optional): _Unused, only kept for compatibility with keras.Model.predict()._ Defaults to 0.
+
+        Returns:
+            np.ndarray: _The model outputs with the shape (num_sequences, sequence_length, num_lanes)._
+        """
+        features = np.asarray(features, dtype=np.float32)
+        outputs = [ self.forward(features[start:start + batch_size])[0] for start in range(0, len(features), batch_size) ]
+        
+        return np.concatenate(outputs, axis=0)
+
+
+def get_max_difference(model_path : str, num_sequences : int = 16) -> float:
+    """
+    Compare the NumPy forward pass of a model with TensorFlow on random input.
+
+    Args:
+        model_path (str): _The path to the .keras-file._
+        num_sequences (int, optional): _The amount of random input sequences._ Defaults to 16.
+
+    Returns:
+        float: _The maximum absolute difference of the outputs._
+    """
+    import tensorflow as tf
+    
+    numpy_model = NumpyModel(model_path)
+    tf_model = tf.keras.models.load_model(model_path, compile=False)
+    
+    rng = np.random.default_rng(0)
+    features = rng.standard_normal((num_sequences,) + tuple(tf_model.input_shape[1:])).astype(np.float32)
+    
+    return float(np.max(np.abs(numpy_model.predict(features) - tf_model.predict(features, verbose=0))))
+
+
+def run_self_test(tolerance : float) -> bool:
+    """
+    Check models whose layer names differ from the Keras defaults: models built after other models
+    in the same process (lstm_2, lstm_3, ...) and layer names that equal the storage key of another layer.
+
+    Args:
+        tolerance (float): _The maximum absolute difference to TensorFlow._
+
+    Returns:
+        bool: _True if all models match TensorFlow._
+    """
+    import tempfile
+    import tensorflow as tf
+    
+    from src.model.lstmManiaModel import build_lstm_model
+    
+    input_shape, num_lanes = (16, 7), 4
+    
+    # Building models first moves the automatic layer names of the tested models away from the defaults.
+    build_lstm_model(input_shape, num_lanes, lstm_units=(8, 8), dense_units=8, bidirectional=False)
+    build_lstm_model(input_shape, num_lanes, lstm_units=(8, 8), dense_units=8, bidirectional=True)
+    
+    models = {
+        "unidirectional": build_lstm_model(input_shape, num_lanes, lstm_units=(8, 8), dense_units=8, bidirectional=False),
+        "bidirectional": build_lstm_model(input_shape, num_lanes, lstm_units=(8, 8), dense_units=8, bidirectional=True),
+        # The first LSTM is named like the storage key of the second one and vice versa.
+        "swapped names": tf.keras.Sequential([
+            tf.keras.layers.Input(shape=input_shape),
+            tf.keras.layers.LSTM(8, return_sequences=True, name="lstm_1"),
+            tf.keras.layers.LSTM(6, return_sequences=True, name="lstm"),
+            tf.keras.layers.TimeDistributed(tf.keras.layers.Dense(num_lanes, activation="sigmoid"), name="dense")
+        ])
+    }
+    passed = True
+    
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for name, model in models.items():
+            model_path = os.path.join(temp_dir, "model.keras")
+            model.save(model_path)
+            
+            layer_names = [ layer.name for layer in model.layers ]
+            max_diff = get_max_difference(model_path)
+            passed = passed and max_diff <= tolerance
+            
+            print(f"{name} ({', '.join(layer_names)}): max. absolute difference {max_diff:.2e}")
+    
+    return passed
+
+
+def main():
+    # Compare the NumPy forward pass with TensorFlow on random input.
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model_path", type=str, default="")
+    parser.add_argument("--num_sequences", type=int, default=16)
+    parser.add_argument("--tolerance", type=float, default=1e-4)
+    parser.add_argument("--self_test", action="store_true")
+    args = parser.parse_args()
+    
+    if args.self_test:
+        if not run_self_test(args.tolerance):
+            raise SystemExit(1)
+        
+        return
+    
+    if not args.model_path:
+        parser.error("Pass --model_path or --self_test.")
+    
+    max_diff = get_max_difference(args.model_path, args.num_sequences)
+    
+    print(f"Max. absolute difference to model.predict: {max_diff:.2e} (tolerance {args.tolerance:.0e})")
+    
+    if max_diff > args.tolerance:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
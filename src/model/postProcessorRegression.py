@@ -0,0 +1,156 @@
+import argparse
+import contextlib
+import io
+import json
+import numpy as np
+import os
+
+from src.model import predictionPostProcessor
+
+
+FIXTURE_PATH = os.path.join(os.getcwd(), "data", "fixtures", "post_processor_regression.npz")
+
+NUM_LANES = 4
+
+# Post-processing settings every input is checked with: threshold, automatic threshold, max. prediction delta,
+# prediction frequency bias and history window (negative deltas and a window of 1 are edge cases).
+SETTINGS = [
+    { "prediction_threshold": 0.45, "use_auto_threshold": False, "max_prediction_delta": 0.45 / 4, "prediction_frequency_bias": 0.002, "history_window": 8 },
+    { "prediction_threshold": 0.3, "use_auto_threshold": True, "max_prediction_delta": 0.075, "prediction_frequency_bias": 0.002, "history_window": 8 },
+    { "prediction_threshold": 0.5, "use_auto_threshold": False, "max_prediction_delta": 0.0, "prediction_frequency_bias": 0.01, "history_window": 4 },
+    { "prediction_threshold": 0.45, "use_auto_threshold": False, "max_prediction_delta": -0.01, "prediction_frequency_bias": 0.002, "history_window": 8 },
+    { "prediction_threshold": 0.2, "use_auto_threshold": False, "max_prediction_delta": 1.0, "prediction_frequency_bias": 0.05, "history_window": 16 },
+    { "prediction_threshold": 0.45, "use_auto_threshold": False, "max_prediction_delta": 0.1, "prediction_frequency_bias": 0.002, "history_window": 1 }
+]
+
+# Streaming generation post-processes a song in chunks with a carried state.
+NUM_STREAM_CHUNKS = 7
+
+
+def build_fixture_inputs() -> dict:
+    """
+    Build the raw predictions of the regression fixtures: random, skewed, tied, constant and near-threshold
+    predictions (where the lane bias reorders the lanes often), song-like predictions and float32 / float64 inputs.
+
+    Returns:
+        dict: _The raw predictions (num_subbeats, num_lanes) of every input by name._
+    """
+    rng = np.random.default_rng(0)
+    inputs = { f"random_{num_subbeats}": rng.random((num_subbeats, NUM_LANES)).astype(np.float32) for num_subbeats in [ 0, 1, 5, 300, 1000 ] }
+    
+    inputs["random_float64"] = rng.random((1000, NUM_LANES))
+    inputs["skewed"] = (rng.random((1000, NUM_LANES)) ** 3).astype(np.float32)
+    inputs["ties"] = np.round(rng.random((1000, NUM_LANES)), 2).astype(np.float32)
+    inputs["constant"] = np.full((500, NUM_LANES), 0.5, dtype=np.float32)
+    inputs["near_threshold"] = (rng.random((1000, NUM_LANES)) * 0.002 + 0.45).astype(np.float32)
+    
+    # Slowly changing lane preferences with beat accents, like the predictions of a song.
+    subbeats = np.arange(1000)[:, None]
+    song = 0.35 + 0.2 * np.sin(subbeats / 37.0 + np.arange(NUM_LANES)) + 0.15 * (subbeats % 4 == 0) + 0.05 * rng.standard_normal((1000, NUM_LANES))
+    inputs["song_like"] = np.clip(song, 0.0, 1.0).astype(np.float32)
+    
+    return inputs
+
+
+def run_case(raw_predictions : np.ndarray, settings : dict) -> dict:
+    """
+    Post-process one input with one setting, as a whole song and (without the automatic threshold) in chunks.
+
+    Returns:
+        dict: _The binary output, the printed summary, and the binary output and lane frequencies of the chunked run._
+    """
+    with contextlib.redirect_stdout(io.StringIO()) as summary:
+        binary_preds = predictionPostProcessor.post_process_predictions(raw_predictions, NUM_LANES, **settings)
+    
+    result = {
+        "output": np.asarray(binary_preds, dtype=np.uint8).reshape(-1, NUM_LANES),
+        "summary": summary.getvalue()
+    }
+    
+    # The automatic threshold needs the whole song, streaming generation does not support it.
+    if len(raw_predictions) > 10 and not settings["use_auto_threshold"]:
+        state = {}
+        chunked_preds = []
+        
+        for chunk in np.array_split(raw_predictions, NUM_STREAM_CHUNKS):
+            chunked_preds += predictionPostProcessor.post_process_predictions(chunk, NUM_LANES, state=state, **settings)
+        
+        result["chunked_output"] = np.asarray(chunked_preds, dtype=np.uint8).reshape(-1, NUM_LANES)
+        result["chunked_lane_frequencies"] = np.asarray(state["lane_frequencies"], dtype=np.int64)
+    
+    return result
+
+
+def write_fixtures(fixture_path : str):
+    # The expected outputs are taken from the current implementation.
+    arrays = {}
+    cases = []
+    
+    for input_name, raw_predictions in build_fixture_inputs().items():
+        arrays[f"input/{input_name}"] = raw_predictions
+        
+        for settings_idx, settings in enumerate(SETTINGS):
+            # The percentile of the automatic threshold is undefined for an empty song.
+            if len(raw_predictions) == 0 and settings["use_auto_threshold"]:
+                continue
+            
+            case_name = f"{input_name}/{settings_idx}"
+            cases.append({ "name": case_name, "input": input_name, "settings": settings })
+            
+            for key, value in run_case(raw_predictions, settings).items():
+                arrays[f"{key}/{case_name}"] = np.asarray(value)
+    
+    os.makedirs(os.path.dirname(fixture_path), exist_ok=True)
+    np.savez_compressed(fixture_path, cases=json.dumps(cases), **arrays)
+    
+    print(f"Saved {len(cases)} cases to {fixture_path}.")
+
+
+def check_fixtures(fixture_path : str) -> list:
+    """
+    Post-process the inputs of the regression fixtures and compare the results to the saved outputs.
+
+    Args:
+        fixture_path (str): _The .npz-file of the fixtures._
+
+    Returns:
+        list: _The names of the cases whose results differ._
+    """
+    failed = []
+    
+    with np.load(fixture_path) as fixtures:
+        cases = json.loads(str(fixtures["cases"]))
+        
+        for case in cases:
+            result = run_case(fixtures[f"input/{case['input']}"], case["settings"])
+            expected_keys = [ key for key in [ "output", "summary", "chunked_output", "chunked_lane_frequencies" ] if f"{key}/{case['name']}" in fixtures ]
+            
+            if set(expected_keys) != set(result.keys()) or not all(np.array_equal(np.asarray(result[key]), fixtures[f"{key}/{case['name']}"]) for key in expected_keys):
+                failed.append(case["name"])
+    
+    print(f"{len(cases) - len(failed)} / {len(cases)} cases match {fixture_path}.")
+    
+    return failed
+
+
+def main():
+    # Check that post_process_predictions still gives the binary output of the fixtures.
+    parser = argparse.ArgumentParser(description="Compare the post-processing with its regression fixtures.")
+    parser.add_argument("--fixture_path", type=str, default=FIXTURE_PATH)
+    parser.add_argument("--update", action="store_true")
+    args = parser.parse_args()
+    
+    # Only update the fixtures for intended changes of the output.
+    if args.update:
+        write_fixtures(args.fixture_path)
+        return
+    
+    failed = check_fixtures(args.fixture_path)
+    
+    if failed:
+        print(f"Differing cases: {failed}")
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+import numpy as np
+
+
+def post_process_predictions(raw_predictions, num_lanes, prediction_threshold, use_auto_threshold, max_prediction_delta, prediction_frequency_bias, history_window = 8, state = None, long_weight = 0.3, short_weight = 0.7):
+    """
+    Convert raw per-subbeat lane predictions into binary note placements.
+
+    Before each subbeat, the predictions are lowered by a lane bias that combines long-term lane weights
+    (raw predictions of placed lanes minus those of empty lanes) and the lane counts of the last history_window subbeats.
+    Both are updated incrementally: the lane counts are kept in a ring buffer of the last subbeats and
+    the long-term bias is only recomputed after a subbeat with notes.
+
+    Args:
+        raw_predictions (np.ndarray): _The raw model outputs with the shape (num_subbeats, num_lanes)._
+        num_lanes (int): _The number of lanes._
+        prediction_threshold (float): _The minimum prediction value for a note to be placed._
+        use_auto_threshold (bool): _If true, the 80th percentile of all predictions is used as threshold instead._
+        max_prediction_delta (float): _The maximum difference between two consecutive
+            (sorted) lane predictions for both of them to be placed as a chord._
+        prediction_frequency_bias (float): _How strongly frequently used lanes are penalized._
+        history_window (int, optional): _The amount of previous subbeats used for the short-term lane bias._ Defaults to 8.
+        state (dict, optional): _Post-processing state of the previous chunk of the same song.
+            If given, processing continues from this state, the state is updated in place
+            and nothing is printed (used for streaming generation)._ Defaults to None.
+        long_weight (float, optional): _The weight of the long-term lane bias._ Defaults to 0.3.
+        short_weight (float, optional): _The weight of the short-term lane bias._ Defaults to 0.7.
+
+    Returns:
+        list: _Binary note placements with the shape (num_subbeats, num_lanes)._
+    """
+    raw_predictions = np.asarray(raw_predictions).reshape(-1, num_lanes)
+    
+    if state is None:
+        state = {}
+        print_summary = True
+    else:
+        print_summary = False
+    
+    lane_weights = state.setdefault("lane_weights", [ 0.0 ] * num_lanes)
+    lane_frequencies = state.setdefault("lane_frequencies", [ 0 ] * num_lanes)
+    # Ring buffer of the last history_window subbeats and their summed lane counts.
+    recent_lanes = state.setdefault("recent_lanes", [ [ 0 ] * num_lanes for _ in range(history_window) ])
+    recent_counts = state.setdefault("recent_counts", [ 0 ] * num_lanes)
+    recent_position = state.get("recent_position", 0)
+    
+    # -------- EXPERIMENTAL --------
+    threshold = np.percentile(raw_predictions, 80) if use_auto_threshold else prediction_threshold
+    # ------------------------------
+    
+    # Lane order of every subbeat by its raw predictions. The bias is small, so it rarely changes the order.
+    sorted_lane_idxs = np.argsort(raw_predictions, axis=1)[:, ::-1].tolist()
+    
+    # For a handful of lanes, Python floats (float64 like the NumPy scalars) are much faster than NumPy arrays.
+    predictions = raw_predictions.tolist()
+    binary_preds = [ [ 0 ] * num_lanes for _ in range(len(predictions)) ]
+    lane_bias = None
+    
+    for i, lane_pred in enumerate(predictions):
+        # The bias only changes after a subbeat with notes or when a note leaves the history window.
+        if lane_bias is None:
+            max_weight = max(1.0, max(abs(weight) for weight in lane_weights))
+            max_recent = max(1, max(recent_counts))
+            lane_bias = [
+                (long_weight * (weight / max_weight) + short_weight * (count / max_recent)) * prediction_frequency_bias
+                for weight, count in zip(lane_weights, recent_counts)
+            ]
+        
+        adjusted_pred = [ pred - bias for pred, bias in zip(lane_pred, lane_bias) ]
+        
+        # Store the indices of the best predictions in descending order.
+        best_preds_idxs = sorted_lane_idxs[i]
+        sorted_preds = [ adjusted_pred[idx] for idx in best_preds_idxs ]
+        
+        # Sort again only if the bias changed the order (or there are ties).
+        if not all(pred > next_pred for pred, next_pred in zip(sorted_preds, sorted_preds[1:])):
+            best_preds_idxs = np.argsort(adjusted_pred)[::-1].tolist()
+            sorted_preds = [ adjusted_pred[idx] for idx in best_preds_idxs ]
+        
+        binary_lane_preds = binary_preds[i]
+        
+        # Place notes if the highest prediction value exceeds the threshold.
+        if sorted_preds[0] >= threshold:
+            binary_lane_preds[best_preds_idxs[0]] = 1
+            num_notes = 1
+            
+            # Loop over all other predictions until the delta between two predictions exceeds a limit.
+            # The difference between the current and previous prediction
+            # MUST be lower than the maximum prediction delta to get counted
+            # as an actual note whilst still surpassing the original prediction threshold.
+            while num_notes < num_lanes:
+                previous_max_pred = sorted_preds[num_notes - 1]
+                current_pred = sorted_preds[num_notes]
+                
+                if (previous_max_pred - current_pred) <= max_prediction_delta and current_pred >= threshold:
+                    binary_lane_preds[best_preds_idxs[num_notes]] = 1
+                    num_notes += 1
+                else:
+                    break
+            
+            for lane_idx in range(num_lanes):
+                lane_weights[lane_idx] += lane_pred[lane_idx] if binary_lane_preds[lane_idx] == 1 else -lane_pred[lane_idx]
+                lane_frequencies[lane_idx] += binary_lane_preds[lane_idx]
+            
+            lane_bias = None
+        
+        # Move the ring buffer by one subbeat.
+        if history_window > 0:
+            leaving_lanes = recent_lanes[recent_position]
+            
+            if leaving_lanes != binary_lane_preds:
+                for lane_idx in range(num_lanes):
+                    recent_counts[lane_idx] += binary_lane_preds[lane_idx] - leaving_lanes[lane_idx]
+                
+                lane_bias = None
+            
+            recent_lanes[recent_position] = binary_lane_preds
+            recent_position = (recent_position + 1) % history_window
+    
+    state["recent_position"] = recent_position
+    
+    if not print_summary:
+        return binary_preds
+    
+    if use_auto_threshold:
+        print(f"Automatic threshold: {threshold}")
+    print(f"Lane frequencies after post-processing: {lane_frequencies}")
+    
+    return binary_preds
+
+
+def convert_predictions_to_gblf_format(raw_predictions, post_processed_predictions, subbeat_timings):
+    gblf_contents = ""
+    
+    for i, (raw_prediction, post_processed_prediction) in enumerate(zip(raw_predictions, post_processed_predictions)):
+        pred_line = f"{int(subbeat_timings[i])}|"
+        
+        for j in range(len(raw_prediction) - 1):
+            pred_line += f"{post_processed_prediction[j]}:{raw_prediction[j]:.3f}|"
+        
+        pred_line += f"{post_processed_prediction[-1]}:{raw_prediction[-1]:.3f}"
+        
+        gblf_contents += pred_line + "\n"
+    
+    return gblf_contents
@@ -0,0 +1,19 @@
+import os
+
+
+def get_rss_mb() -> float:
+    """
+    Retrieve the current resident set size of this process.
+
+    Returns:
+        float: _The resident set size in MB._
+    """
+    try:
+        with open("/proc/self/statm", "r") as f:
+            resident_pages = int(f.read().split()[1])
+        
+        return resident_pages * os.sysconf("SC_PAGE_SIZE") / 1024**2
+    except (OSError, ValueError, AttributeError):
+        # Fall back to the peak RSS on systems without procfs.
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
@@ -0,0 +1,171 @@
+import numpy as np
+import time
+
+from src.model.numpyInference import NumpyModel
+from src.model.predictionPostProcessor import convert_predictions_to_gblf_format, post_process_predictions
+
+
+HOP_LENGTH = 512
+FRAME_LENGTH = 2048
+TOP_DB = 80.0
+
+
+def stream_subbeat_features(audio_path : str, audio_bpm : float, audio_start_ms : float, note_precision : int, means : list, stds : list, block_frames : int = 2048):
+    """
+    Decode an audio file block by block and yield the normalized features
+    of all subbeats covered by each block. Only one block is kept in memory at a time.
+
+    The features closely follow extract_features(), but are computed without centered frames
+    and with a running (instead of global) maximum for the dB conversion, so they are not bit-identical.
+
+    Args:
+        audio_path (str): _The path to the audio file._
+        audio_bpm (float): _The BPM of the audio._
+        audio_start_ms (float): _The time in milliseconds where the first beat occurs._
+        note_precision (int): _The amount of subbeats per quarter note._
+        means (list): _The feature means used for normalization._
+        stds (list): _The feature standard deviations used for normalization._
+        block_frames (int, optional): _The amount of feature frames decoded per block._ Defaults to 2048.
+
+    Yields:
+        tuple: _The subbeat timings (ms) and normalized features of the next chunk of subbeats._
+    """
+    import librosa
+    
+    sr = librosa.get_samplerate(audio_path)
+    duration_ms = librosa.get_duration(path=audio_path) * 1000
+    
+    ms_per_subbeat = 60_000 / audio_bpm / note_precision
+    num_subbeats = int((duration_ms - audio_start_ms) // ms_per_subbeat)
+    
+    means = np.asarray(means)
+    stds = np.asarray(stds)
+    
+    # Offset between centered frames (used by extract_features) and the uncentered frames of the stream.
+    center_offset = FRAME_LENGTH // (2 * HOP_LENGTH)
+    
+    stream = librosa.stream(
+        audio_path,
+        block_length=block_frames,
+        frame_length=FRAME_LENGTH,
+        hop_length=HOP_LENGTH,
+        mono=True
+    )
+    
+    next_subbeat = 0
+    frame_offset = 0
+    max_db = -np.inf
+    previous_mel_db = None
+    # librosa delays the onset envelope of centered frames by the frame offset, which is replicated here.
+    previous_flux = np.zeros(center_offset)
+    last_frame_features = None
+    
+    for block in stream:
+        if len(block) < FRAME_LENGTH or next_subbeat >= num_subbeats:
+            continue
+        
+        mel = librosa.feature.melspectrogram(y=block, sr=sr, n_fft=FRAME_LENGTH, hop_length=HOP_LENGTH, center=False)
+        
+        # power_to_db() with the clipping range based on the loudest frame so far.
+        mel_db = 10.0 * np.log10(np.maximum(mel, 1e-10))
+        max_db = max(max_db, float(mel_db.max()))
+        mel_db = np.maximum(mel_db, max_db - TOP_DB)
+        
+        mfcc = librosa.feature.mfcc(S=mel_db, n_mfcc=5).T
+        rms = librosa.feature.rms(y=block, frame_length=FRAME_LENGTH, hop_length=HOP_LENGTH, center=False)[0]
+        
+        # Onset strength: mean positive spectral flux, carried over from the last frame of the previous block.
+        reference = mel_db[:, :1] if previous_mel_db is None else previous_mel_db
+        flux = np.mean(np.maximum(np.diff(np.concatenate([ reference, mel_db ], axis=1), axis=1), 0.0), axis=0)
+        onset_env = np.concatenate([ previous_flux, flux ])[:len(flux)]
+        previous_flux = np.concatenate([ previous_flux, flux ])[len(flux):]
+        previous_mel_db = mel_db[:, -1:]
+        
+        num_frames = min(mfcc.shape[0], len(rms), len(onset_env))
+        frame_features = np.column_stack([ mfcc[:num_frames], onset_env[:num_frames], rms[:num_frames] ])
+        last_frame_features = frame_features[-1]
+        
+        # Find all remaining subbeats whose frame lies within this block.
+        subbeat_idxs = np.arange(next_subbeat, num_subbeats)
+        subbeat_times_ms = audio_start_ms + subbeat_idxs * ms_per_subbeat
+        frame_idxs = np.maximum((subbeat_times_ms / 1000 * sr / HOP_LENGTH).astype(int) - center_offset, 0)
+        in_block = frame_idxs < frame_offset + num_frames
+        
+        if np.any(in_block):
+            count = int(np.sum(in_block))
+            features = frame_features[frame_idxs[:count] - frame_offset]
+            
+            yield subbeat_times_ms[:count], (features - means) / (stds + 1e-6)
+            
+            next_subbeat += count
+        
+        frame_offset += num_frames
+    
+    # Subbeats beyond the last decoded frame reuse the last frame (like extract_features).
+    if next_subbeat < num_subbeats and last_frame_features is not None:
+        subbeat_times_ms = audio_start_ms + np.arange(next_subbeat, num_subbeats) * ms_per_subbeat
+        features = np.repeat(last_frame_features[None], len(subbeat_times_ms), axis=0)
+        
+        yield subbeat_times_ms, (features - means) / (stds + 1e-6)
+
+
+def generate_streaming(audio_path : str, model_path : str, output_path : str, audio_bpm : float, audio_start_ms : float, note_precision : int, means : list, stds : list, post_process_args : dict, block_frames : int = 2048) -> None:
+    """
+    Generate a level chunk by chunk with a unidirectional model,
+    carrying the LSTM and post-processing states between chunks
+    and appending the GBLF lines of every chunk to the output file as soon as they are ready.
+    Memory usage does not grow with the length of the audio.
+
+    Args:
+        audio_path (str): _The path to the audio file._
+        model_path (str): _The path to a unidirectional .keras model._
+        output_path (str): _The path of the .gblf-file to write._
+        audio_bpm (float): _The BPM of the audio._
+        audio_start_ms (float): _The time in milliseconds where the first beat occurs._
+        note_precision (int): _The amount of subbeats per quarter note._
+        means (list): _The feature means used for normalization._
+        stds (list): _The feature standard deviations used for normalization._
+        post_process_args (dict): _Keyword arguments for post_process_predictions()._
+        block_frames (int, optional): _The amount of feature frames decoded per block._ Defaults to 2048.
+    """
+    model = NumpyModel(model_path)
+    
+    if not model.is_streamable():
+        raise ValueError(f"Streaming generation requires a unidirectional model, but {model_path} is bidirectional.")
+    
+    if post_process_args.get("use_auto_threshold", False):
+        # The automatic threshold needs all predictions of the song, which are never in memory at once.
+        print("Automatic threshold is not available in streaming mode, using the prediction threshold instead.")
+        post_process_args = dict(post_process_args, use_auto_threshold=False)
+    
+    model_states = None
+    post_process_state = {}
+    num_subbeats = 0
+    start = time.perf_counter()
+    
+    with open(output_path, "w", encoding="utf-8") as f:
+        for subbeat_times_ms, features in stream_subbeat_features(
+            audio_path=audio_path,
+            audio_bpm=audio_bpm,
+            audio_start_ms=audio_start_ms,
+            note_precision=note_precision,
+            means=means,
+            stds=stds,
+            block_frames=block_frames
+        ):
+            preds, model_states = model.predict_stateful(features[None], states=model_states)
+            preds = preds[0]
+            
+            preds_bin = post_process_predictions(preds, state=post_process_state, **post_process_args)
+            
+            f.write(convert_predictions_to_gblf_format(
+                raw_predictions=preds,
+                post_processed_predictions=preds_bin,
+                subbeat_timings=subbeat_times_ms
+            ))
+            f.flush()
+            
+            num_subbeats += len(subbeat_times_ms)
+    
+    print(f"Streamed {num_subbeats} subbeats in {time.perf_counter() - start:.2f} s.")
+    print(f"Lane frequencies after post-processing: {post_process_state.get('lane_frequencies')}")
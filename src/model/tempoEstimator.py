@@ -0,0 +1,311 @@
+import argparse
+import json
+import numpy as np
+import os
+import time
+
+from glob import glob
+
+
+# Range of the estimated BPM. Tempos outside of it are folded into it by octaves.
+BPM_RANGE = (60.0, 240.0)
+
+# Log-normal prior over the tempo that decides between tempo octaves (e.g. 87 vs. 174 BPM).
+BPM_PRIOR_CENTER = 150.0
+BPM_PRIOR_OCTAVES = 1.0
+
+# Harmonics (multiples of the beat frequency) whose spectral energy counts towards a tempo: beats, eighths and sixteenths.
+TEMPO_HARMONICS = [ 1, 2, 4 ]
+
+# The onset strength of a frame is the increase over the previous frame, so onsets peak one frame late.
+ONSET_LAG_FRAMES = 1
+
+# Step of the BPM refinement around the best spectrum bin and of the offset search.
+BPM_REFINE_STEP = 0.001
+OFFSET_STEP_MS = 1.0
+
+# Subbeats per beat of the grid used by the benchmark. A first beat on an offbeat gives the same subbeat grid for even precisions.
+BENCHMARK_NOTE_PRECISION = 2
+
+
+def parse_tempo_value(value) -> float:
+    """
+    Parse a BPM or offset that can be "auto".
+
+    Args:
+        value (_type_): _A number, a numeric string or "auto"._
+
+    Returns:
+        float: _The value, or None if it should be estimated._
+    """
+    if value is None or (isinstance(value, str) and value.strip().lower() == "auto"):
+        return None
+    
+    return float(value)
+
+
+def get_onset_spectrum(onset_env : np.ndarray, frame_rate : float) -> tuple:
+    """
+    Compute the magnitude spectrum of the whole onset envelope. The envelope is zero-padded,
+    so the spectrum has a resolution of a few thousandths of a BPM.
+
+    Args:
+        onset_env (np.ndarray): _The onset strength of every frame._
+        frame_rate (float): _The number of frames per second._
+
+    Returns:
+        tuple: _The magnitudes and the tempo (BPM) of every bin._
+    """
+    onset_env = onset_env - np.mean(onset_env)
+    num_bins = max(1 << 20, 1 << int(np.ceil(np.log2(4 * len(onset_env)))))
+    
+    magnitudes = np.abs(np.fft.rfft(onset_env, n=num_bins))
+    bin_bpms = np.fft.rfftfreq(num_bins, d=1.0 / frame_rate) * 60
+    
+    return magnitudes, bin_bpms
+
+
+def get_tempo_salience(magnitudes : np.ndarray, bin_bpms : np.ndarray, bpms : np.ndarray) -> np.ndarray:
+    # Sum the spectral energy at the harmonics of every tempo, then weigh the tempos by the prior.
+    salience = sum(
+        np.interp(bpms * harmonic, bin_bpms, magnitudes, right=0.0) / harmonic
+        for harmonic in TEMPO_HARMONICS
+    )
+    prior = np.exp(-0.5 * (np.log2(bpms / BPM_PRIOR_CENTER) / BPM_PRIOR_OCTAVES) ** 2)
+    
+    return salience * prior
+
+
+def get_beat_phase_scores(onset_env : np.ndarray, frame_rate : float, bpm : float, offsets_ms : np.ndarray) -> np.ndarray:
+    """
+    Score candidate first-beat offsets by the mean onset strength on the beat grid of every offset.
+
+    Args:
+        onset_env (np.ndarray): _The onset strength of every frame._
+        frame_rate (float): _The number of frames per second._
+        bpm (float): _The tempo of the beat grid._
+        offsets_ms (np.ndarray): _The candidate offsets in milliseconds (within one beat)._
+
+    Returns:
+        np.ndarray: _The score of every offset._
+    """
+    beat_ms = 60_000 / bpm
+    duration_ms = len(onset_env) / frame_rate * 1000
+    beat_idxs = np.arange(int(duration_ms // beat_ms) + 1)
+    
+    # Frame position of every beat of every offset, between frames the envelope is interpolated.
+    beat_frames = (offsets_ms[:, None] + beat_idxs[None, :] * beat_ms) / 1000 * frame_rate + ONSET_LAG_FRAMES
+    beat_strengths = np.interp(beat_frames, np.arange(len(onset_env)), onset_env, right=np.nan)
+    
+    return np.nanmean(beat_strengths, axis=1)
+
+
+def estimate_tempo(onset_env : np.ndarray, frame_rate : float, audio_bpm : float = None, audio_start_ms : float = None) -> dict:
+    """
+    Estimate the BPM and the offset of the first beat of a song from its onset envelope.
+
+    The BPM is the tempo whose harmonics have the most energy in the spectrum of the whole envelope
+    (weighted by a prior over tempo octaves) and is refined between spectrum bins. The offset is the
+    phase of the beat grid with the strongest onsets on its beats.
+
+    Args:
+        onset_env (np.ndarray): _The onset strength of every frame (like the onset feature of compute_frame_features)._
+        frame_rate (float): _The number of frames per second (sample rate / hop length)._
+        audio_bpm (float, optional): _A known BPM, only the offset is estimated then._ Defaults to None.
+        audio_start_ms (float, optional): _A known offset, only the BPM is estimated then._ Defaults to None.
+
+    Raises:
+        ValueError: _The onset envelope is too short or has no onsets._
+
+    Returns:
+        dict: _The audio_bpm, the audio_start_ms (first beat, within the first beat period) and a confidence in [0, 1]:
+            the share of the onset energy at the beat frequency that is in phase with the estimated beat grid._
+    """
+    onset_env = np.asarray(onset_env, dtype=np.float64)
+    
+    if len(onset_env) < 2 * frame_rate or not np.any(onset_env > 0):
+        raise ValueError("Tempo estimation needs at least 2 s of audio with onsets.")
+    
+    # -------- BPM --------
+    if audio_bpm is None:
+        magnitudes, bin_bpms = get_onset_spectrum(onset_env, frame_rate)
+        
+        in_range = (bin_bpms >= BPM_RANGE[0]) & (bin_bpms <= BPM_RANGE[1])
+        candidate_bpms = bin_bpms[in_range]
+        best_bpm = candidate_bpms[np.argmax(get_tempo_salience(magnitudes, bin_bpms, candidate_bpms))]
+        
+        # Refine between the neighbouring bins with a direct evaluation of the spectrum.
+        bin_width = bin_bpms[1]
+        refine_bpms = np.arange(best_bpm - bin_width, best_bpm + bin_width, BPM_REFINE_STEP)
+        frame_times = np.arange(len(onset_env)) / frame_rate
+        centered_env = onset_env - np.mean(onset_env)
+        refine_salience = sum(
+            np.abs(np.exp(-2j * np.pi * np.outer(refine_bpms * harmonic / 60, frame_times)) @ centered_env) / harmonic
+            for harmonic in TEMPO_HARMONICS
+        )
+        audio_bpm = float(refine_bpms[np.argmax(refine_salience)])
+    # ---------------------
+    
+    beat_ms = 60_000 / audio_bpm
+    
+    # -------- Offset --------
+    if audio_start_ms is None:
+        offsets_ms = np.arange(0, beat_ms, OFFSET_STEP_MS)
+        audio_start_ms = float(offsets_ms[np.argmax(get_beat_phase_scores(onset_env, frame_rate, audio_bpm, offsets_ms))])
+    # ------------------------
+    
+    # Phase coherence of the onsets with the beat grid: 1 if all onset energy is exactly on the beats.
+    frame_phases = 2 * np.pi * ((np.arange(len(onset_env)) - ONSET_LAG_FRAMES) / frame_rate * 1000 - audio_start_ms) / beat_ms
+    coherence = np.sum(onset_env * np.cos(frame_phases)) / np.sum(onset_env)
+    
+    return {
+        "audio_bpm": audio_bpm,
+        "audio_start_ms": audio_start_ms,
+        "confidence": float(np.clip(coherence, 0.0, 1.0))
+    }
+
+
+def get_tempo_errors(estimate : dict, reference_bpm : float, reference_start_ms : float, note_precision : int = BENCHMARK_NOTE_PRECISION) -> dict:
+    """
+    Compare an estimated tempo to the timing of a beatmap.
+
+    Returns:
+        dict: _The relative BPM error, whether the BPM is correct (within 0.1 %) or off by a tempo octave,
+            the offset error in milliseconds (modulo one beat of the reference) and the grid offset error
+            (modulo one subbeat, the error of the generated subbeat timings)._
+    """
+    relative_error = estimate["audio_bpm"] / reference_bpm - 1
+    octave_ratio = estimate["audio_bpm"] / reference_bpm
+    beat_ms = 60_000 / reference_bpm
+    
+    # Any beat of the reference grid is a valid first beat.
+    offset_error_ms = (estimate["audio_start_ms"] - reference_start_ms + beat_ms / 2) % beat_ms - beat_ms / 2
+    subbeat_ms = beat_ms / note_precision
+    grid_offset_error_ms = (offset_error_ms + subbeat_ms / 2) % subbeat_ms - subbeat_ms / 2
+    
+    return {
+        "bpm_relative_error": relative_error,
+        "bpm_correct": abs(relative_error) <= 0.001,
+        "bpm_octave_error": any(abs(octave_ratio / factor - 1) <= 0.001 for factor in [ 0.5, 2.0, 1 / 3, 3.0, 2 / 3, 1.5 ]),
+        "offset_error_ms": offset_error_ms,
+        "grid_offset_error_ms": grid_offset_error_ms
+    }
+
+
+def run_benchmark(raw_dir : str, report_path : str = "", max_sets : int = 0):
+    """
+    Estimate the tempo of every downloaded beatmapset and compare it to the timing of its first beatmap.
+
+    Args:
+        raw_dir (str): _The directory of the downloaded beatmapsets (with the bm_<ID>.osz-files and the audio file)._
+        report_path (str, optional): _If set, the results are saved to this .json-file._ Defaults to "".
+        max_sets (int, optional): _The maximum number of beatmapsets (0 = all)._ Defaults to 0.
+    """
+    from src.model.audioFeatureExtractor import ONSET_FEATURE_IDX, compute_frame_features, decode_audio
+    from src.preprocessing.beatmapFeatureExtractor import get_beatmap_BPM
+    
+    hop_length = 512
+    results = []
+    beatmapset_dirs = sorted(path for path in glob(os.path.join(raw_dir, "*")) if os.path.isdir(path))
+    
+    if max_sets > 0:
+        beatmapset_dirs = beatmapset_dirs[:max_sets]
+    
+    for beatmapset_dir in beatmapset_dirs:
+        beatmap_paths = sorted(glob(os.path.join(beatmapset_dir, "bm_*.osz")))
+        audio_paths = glob(os.path.join(beatmapset_dir, "audio.*"))
+        
+        if not beatmap_paths or not audio_paths:
+            continue
+        
+        try:
+            with open(beatmap_paths[0], "r", encoding="utf-8") as f:
+                reference_bpm, reference_start_ms = get_beatmap_BPM(f.readlines())
+            
+            y, sr = decode_audio(audio_paths[0])
+            frame_features = compute_frame_features(y, sr, hop_length=hop_length)
+            
+            # Only the estimation is timed, the onset envelope is computed during generation anyway.
+            start_time = time.perf_counter()
+            estimate = estimate_tempo(frame_features[:, ONSET_FEATURE_IDX], sr / hop_length)
+            estimate_time = time.perf_counter() - start_time
+        except Exception as e:
+            print(f"{os.path.basename(beatmapset_dir)}: skipped ({type(e).__name__}: {e}).")
+            continue
+        
+        result = {
+            "beatmapset": os.path.basename(beatmapset_dir),
+            "reference_bpm": reference_bpm,
+            "reference_start_ms": reference_start_ms,
+            **estimate,
+            **get_tempo_errors(estimate, reference_bpm, reference_start_ms),
+            "time_s": estimate_time
+        }
+        results.append(result)
+        
+        print(
+            f"{result['beatmapset']}: {reference_bpm:.3f} BPM / {reference_start_ms:.0f} ms -> "
+            f"{estimate['audio_bpm']:.3f} BPM / {estimate['audio_start_ms']:.0f} ms "
+            f"(confidence {estimate['confidence']:.2f}, offset error {result['offset_error_ms']:+.1f} ms)"
+        )
+    
+    if not results:
+        raise FileNotFoundError(f"No beatmapsets with a beatmap and an audio file found in {raw_dir}.")
+    
+    correct = [ result for result in results if result["bpm_correct"] ]
+    abs_offset_errors = np.abs([ result["offset_error_ms"] for result in correct ])
+    abs_grid_offset_errors = np.abs([ result["grid_offset_error_ms"] for result in correct ])
+    
+    summary = {
+        "beatmapsets": len(results),
+        "bpm_accuracy": len(correct) / len(results),
+        "bpm_accuracy_with_octaves": sum(result["bpm_correct"] or result["bpm_octave_error"] for result in results) / len(results),
+        "median_abs_offset_error_ms": float(np.median(abs_offset_errors)) if correct else None,
+        "offset_within_10ms": float(np.mean(abs_offset_errors <= 10)) if correct else None,
+        "grid_offset_within_10ms": float(np.mean(abs_grid_offset_errors <= 10)) if correct else None,
+        "mean_confidence_correct": float(np.mean([ result["confidence"] for result in correct ])) if correct else None,
+        "mean_confidence_wrong": float(np.mean([ result["confidence"] for result in results if not result["bpm_correct"] ])) if len(correct) < len(results) else None,
+        "mean_time_s": float(np.mean([ result["time_s"] for result in results ]))
+    }
+    
+    print(f"\nBPM accuracy: {summary['bpm_accuracy']:.1%} ({summary['bpm_accuracy_with_octaves']:.1%} including tempo octaves) on {len(results)} beatmapsets.")
+    
+    if correct:
+        print(
+            f"Offset error with correct BPM: median {summary['median_abs_offset_error_ms']:.1f} ms, {summary['offset_within_10ms']:.1%} within 10 ms "
+            f"({summary['grid_offset_within_10ms']:.1%} on the subbeat grid of note precision {BENCHMARK_NOTE_PRECISION})."
+        )
+    
+    print(f"Mean estimation time: {summary['mean_time_s'] * 1000:.0f} ms per song.")
+    
+    if report_path:
+        with open(report_path, "w", encoding="utf-8") as f:
+            json.dump({ "summary": summary, "beatmapsets": results }, f, indent=4)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Estimate the BPM and offset of audio files, or benchmark the estimation on downloaded beatmapsets.")
+    parser.add_argument("--audio_file_path", type=str, default="")
+    parser.add_argument("--benchmark_dir", type=str, default="")
+    parser.add_argument("--max_sets", type=int, default=0)
+    parser.add_argument("--report_path", type=str, default="")
+    args = parser.parse_args()
+    
+    if args.benchmark_dir:
+        run_benchmark(args.benchmark_dir, args.report_path, args.max_sets)
+        return
+    
+    if not args.audio_file_path:
+        parser.error("Pass --audio_file_path or --benchmark_dir.")
+    
+    from src.model.audioFeatureExtractor import ONSET_FEATURE_IDX, compute_frame_features, decode_audio
+    
+    hop_length = 512
+    y, sr = decode_audio(args.audio_file_path)
+    estimate = estimate_tempo(compute_frame_features(y, sr, hop_length=hop_length)[:, ONSET_FEATURE_IDX], sr / hop_length)
+    
+    print(f"BPM: {estimate['audio_bpm']:.3f}, first beat at {estimate['audio_start_ms']:.0f} ms (confidence {estimate['confidence']:.2f}).")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,426 @@
+import collections
+import csv
+import json
+import numpy as np
+import os
+import threading
+import time
+import tensorflow as tf
+
+from src.model.resourceMonitor import get_rss_mb
+
+
+class StepRateLogger(tf.keras.callbacks.Callback):
+    """
+    Log the training steps per second of every epoch (without validation),
+    so that different training settings can be compared on the same shards.
+    """
+    def __init__(self):
+        super().__init__()
+        self.epoch_start = None
+        self.last_batch_end = None
+        self.steps = 0
+        self.step_rates = []
+
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self.epoch_start = time.perf_counter()
+        self.last_batch_end = self.epoch_start
+        self.steps = 0
+
+
+    def on_train_batch_end(self, batch, logs=None):
+        self.last_batch_end = time.perf_counter()
+        self.steps += 1
+
+
+    def on_epoch_end(self, epoch, logs=None):
+        train_time = self.last_batch_end - self.epoch_start
+        steps_per_second = self.steps / train_time if train_time > 0 else 0.0
+        self.step_rates.append(steps_per_second)
+        
+        if logs is not None:
+            logs["steps_per_second"] = steps_per_second
+        
+        print(f"Epoch {epoch + 1}: {steps_per_second:.2f} steps/s ({self.steps} steps in {train_time:.1f} s)")
+
+
+    def on_train_end(self, logs=None):
+        if not self.step_rates:
+            return
+        
+        # The first epoch includes tracing / XLA compilation and is only used if there is no other epoch.
+        steady_rates = self.step_rates[1:] or self.step_rates
+        print(f"Mean training speed: {np.mean(steady_rates):.2f} steps/s (excluding the first epoch)")
+
+
+
+class StepTimeProfiler(tf.keras.callbacks.Callback):
+    """
+    Record for every training step how long it waited for its batch and how long it computed,
+    together with the throughput, the host RSS and the fill level of the prefetch buffer.
+    The timeline of a run is written to a .json- and a .csv-file when training ends.
+
+    The training dataset has to be instrumented with probe_produced (before prefetching) and
+    probe_consumed (after prefetching), see get_tf_dataset. A batch counts as produced when it
+    enters the prefetch buffer and as delivered when the training step takes it out of the buffer:
+    - data wait: from the start of the step until its batch was delivered.
+    - compute: from the delivery of the batch until the end of the step.
+    """
+    def __init__(self, log_dir : str, run_name : str, trace_steps : tuple = None):
+        """
+        Args:
+            log_dir (str): _The directory the timeline files (and the trace) are written to._
+            run_name (str): _The name of the run (file name of the timeline files)._
+            trace_steps (tuple, optional): _First and last training step (inclusive, counted from 1) of a
+                tf.profiler trace window._ Defaults to None (no trace).
+        """
+        super().__init__()
+        self.log_dir = log_dir
+        self.run_name = run_name
+        self.trace_steps = trace_steps
+        self.tracing = False
+        
+        # Updated from the tf.data threads.
+        self.lock = threading.Lock()
+        self.produced_count = 0
+        self.consumed_count = 0
+        self.deliveries = collections.deque()
+        
+        self.epoch = 0
+        self.global_step = 0
+        self.step_begin = None
+        self.timeline = []
+        
+        os.makedirs(log_dir, exist_ok=True)
+
+
+    def on_produced(self, batch_size):
+        with self.lock:
+            self.produced_count += 1
+        
+        return np.int64(batch_size)
+
+
+    def on_consumed(self, batch_size):
+        with self.lock:
+            # Fill level of the prefetch buffer when the training step took its batch.
+            prefetch_level = self.produced_count - self.consumed_count
+            self.consumed_count += 1
+            self.deliveries.append((time.perf_counter(), int(batch_size), prefetch_level))
+        
+        return np.int64(batch_size)
+
+
+    def probe(self, ds : tf.data.Dataset, callback) -> tf.data.Dataset:
+        def stamp(*element):
+            first_tensor = tf.nest.flatten(element)[0]
+            token = tf.py_function(callback, [tf.shape(first_tensor)[0]], tf.int64)
+            
+            with tf.control_dependencies([token]):
+                element = tf.nest.map_structure(tf.identity, element)
+            
+            return element[0] if len(element) == 1 else element
+        
+        return ds.map(stamp)
+
+
+    def probe_produced(self, ds : tf.data.Dataset) -> tf.data.Dataset:
+        return self.probe(ds, self.on_produced)
+
+
+    def probe_consumed(self, ds : tf.data.Dataset) -> tf.data.Dataset:
+        ds = self.probe(ds, self.on_consumed)
+        
+        # An injected prefetch or a parallelized map after the probe would take the batches out of the
+        # buffer one step ahead of training. Only the prefetch buffer of the loader must remain.
+        options = tf.data.Options()
+        options.experimental_optimization.map_parallelization = False
+        
+        if hasattr(options.experimental_optimization, "inject_prefetch"):
+            options.experimental_optimization.inject_prefetch = False
+        
+        return ds.with_options(options)
+
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self.epoch = epoch
+
+
+    def on_train_batch_begin(self, batch, logs=None):
+        self.global_step += 1
+        
+        if self.trace_steps is not None and self.global_step == self.trace_steps[0]:
+            print(f"Starting profiler trace at step {self.global_step}.")
+            tf.profiler.experimental.start(os.path.join(self.log_dir, f"{self.run_name}_trace"))
+            self.tracing = True
+        
+        self.step_begin = time.perf_counter()
+
+
+    def on_train_batch_end(self, batch, logs=None):
+        step_end = time.perf_counter()
+        step_time = step_end - self.step_begin
+        
+        with self.lock:
+            delivery = self.deliveries.popleft() if self.deliveries else None
+        
+        if delivery is not None:
+            delivered, batch_size, prefetch_level = delivery
+            data_wait = min(max(delivered - self.step_begin, 0.0), step_time)
+        else:
+            # The dataset is not instrumented, the whole step is counted as compute time.
+            batch_size, prefetch_level, data_wait = 0, -1, 0.0
+        
+        self.timeline.append({
+            "step": self.global_step,
+            "epoch": self.epoch + 1,
+            "time_s": step_end,
+            "step_ms": step_time * 1000,
+            "data_wait_ms": data_wait * 1000,
+            "compute_ms": (step_time - data_wait) * 1000,
+            "batch_size": batch_size,
+            "sequences_per_second": batch_size / step_time if step_time > 0 else 0.0,
+            "prefetch_level": prefetch_level,
+            "rss_mb": get_rss_mb()
+        })
+        
+        if self.tracing and self.global_step >= self.trace_steps[1]:
+            tf.profiler.experimental.stop()
+            self.tracing = False
+            print(f"Stopped profiler trace at step {self.global_step}.")
+
+
+    def on_epoch_end(self, epoch, logs=None):
+        epoch_steps = [step for step in self.timeline if step["epoch"] == epoch + 1]
+        
+        if not epoch_steps:
+            return
+        
+        data_wait = sum(step["data_wait_ms"] for step in epoch_steps)
+        total = sum(step["step_ms"] for step in epoch_steps)
+        
+        print(f"Epoch {epoch + 1}: {100 * data_wait / total:.1f} % of the step time waiting for data, "
+              f"{np.mean([step['sequences_per_second'] for step in epoch_steps]):.1f} sequences/s, "
+              f"mean prefetch level {np.mean([step['prefetch_level'] for step in epoch_steps]):.1f}")
+
+
+    def on_train_end(self, logs=None):
+        if self.tracing:
+            tf.profiler.experimental.stop()
+            self.tracing = False
+        
+        if not self.timeline:
+            return
+        
+        # The first steps include tracing / compilation and are excluded from the summary.
+        steady_steps = self.timeline[10:] or self.timeline
+        summary = {
+            "steps": len(self.timeline),
+            "mean_step_ms": float(np.mean([step["step_ms"] for step in steady_steps])),
+            "mean_data_wait_ms": float(np.mean([step["data_wait_ms"] for step in steady_steps])),
+            "mean_compute_ms": float(np.mean([step["compute_ms"] for step in steady_steps])),
+            "mean_sequences_per_second": float(np.mean([step["sequences_per_second"] for step in steady_steps])),
+            "mean_prefetch_level": float(np.mean([step["prefetch_level"] for step in steady_steps])),
+            "peak_rss_mb": float(max(step["rss_mb"] for step in self.timeline))
+        }
+        
+        json_path = os.path.join(self.log_dir, f"{self.run_name}.json")
+        csv_path = os.path.join(self.log_dir, f"{self.run_name}.csv")
+        
+        with open(json_path, "w") as f:
+            json.dump({ "summary": summary, "timeline": self.timeline }, f, indent=4)
+        
+        with open(csv_path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(self.timeline[0].keys()))
+            writer.writeheader()
+            writer.writerows(self.timeline)
+        
+        bottleneck = "input pipeline" if summary["mean_data_wait_ms"] > summary["mean_compute_ms"] else "model"
+        print(f"Step time: {summary['mean_step_ms']:.1f} ms ({summary['mean_data_wait_ms']:.1f} ms data wait, "
+              f"{summary['mean_compute_ms']:.1f} ms compute) -> bottleneck: {bottleneck}")
+        print(f"Step timeline saved to {json_path} and {csv_path}")
+
+
+class AshaPruningCallback(tf.keras.callbacks.Callback):
+    """
+    Stop weak trials of a hyperparameter sweep early (asynchronous successive halving, ASHA).
+
+    Every rung is an epoch count (min_epochs * reduction_factor^k). When a trial reaches a rung,
+    its val_loss is compared with the val_losses of all trials that reached this rung before. The trial
+    only continues if it is among the best 1 / reduction_factor of them. The rung results are shared
+    between the worker processes of the sweep (e.g. a multiprocessing.Manager dict).
+    """
+    def __init__(self, trial_id : int, rung_epochs : list, rung_results, lock, reduction_factor : int = 3, monitor : str = "val_loss"):
+        """
+        Args:
+            trial_id (int): _The id of the trial._
+            rung_epochs (list): _The epoch counts at which trials are compared._
+            rung_results (_type_): _Shared dict (rung epoch -> list of (trial id, metric))._
+            lock (_type_): _Shared lock for the rung results._
+            reduction_factor (int, optional): _Only the best 1 / reduction_factor of the trials continue at every rung._ Defaults to 3.
+            monitor (str, optional): _The metric to compare (lower is better)._ Defaults to "val_loss".
+        """
+        super().__init__()
+        self.trial_id = trial_id
+        self.rung_epochs = set(rung_epochs)
+        self.rung_results = rung_results
+        self.lock = lock
+        self.reduction_factor = reduction_factor
+        self.monitor = monitor
+        self.pruned_at_epoch = None
+
+
+    def on_epoch_end(self, epoch, logs=None):
+        if epoch + 1 not in self.rung_epochs or logs is None or self.monitor not in logs:
+            return
+        
+        value = float(logs[self.monitor])
+        
+        with self.lock:
+            previous_results = self.rung_results.get(epoch + 1, [])
+            # Reassign the list, so the change reaches the other processes.
+            self.rung_results[epoch + 1] = previous_results + [(self.trial_id, value)]
+        
+        # The first trial at a rung has nothing to compare with.
+        if not previous_results:
+            return
+        
+        values = [result for _, result in previous_results] + [value]
+        cutoff = np.quantile(values, 1.0 / self.reduction_factor)
+        
+        if value > cutoff:
+            print(f"Trial {self.trial_id}: {self.monitor} {value:.5f} at epoch {epoch + 1} is worse than the rung cutoff {cutoff:.5f}, pruning.")
+            self.pruned_at_epoch = epoch + 1
+            self.model.stop_training = True
+
+
+class SamplingScheduleCallback(tf.keras.callbacks.Callback):
+    """
+    Report the exponent of a NoteWeightedSampler, which is annealed linearly from its initial alpha to 0 (uniform sampling)
+    over its anneal epochs, so training starts on note-rich sequences and ends on the real distribution.
+    The sampler switches alpha by itself at the first sequence of every epoch.
+    """
+    def __init__(self, sampler):
+        super().__init__()
+        self.sampler = sampler
+
+
+    def on_epoch_begin(self, epoch, logs=None):
+        print(f"Epoch {epoch + 1}: sampling alpha {self.sampler.get_alpha(epoch):.3f} ({self.sampler.expected_notes_per_sequence(epoch):.1f} notes per sequence expected)")
+
+
+class BackupEpochMarker(tf.keras.callbacks.Callback):
+    """
+    Record the number of finished epochs of a worker next to the BackupAndRestore backup, so a restarted worker
+    knows the epoch it resumes from before the datasets are built. Has to come after the BackupAndRestore callback,
+    so the marker never runs ahead of the backup. The marker is deleted when training finishes, like the backup.
+    """
+    def __init__(self, marker_path : str):
+        super().__init__()
+        self.marker_path = marker_path
+
+
+    @staticmethod
+    def read_epoch(marker_path : str) -> int:
+        # 0 if there is no backup to resume from.
+        if not os.path.exists(marker_path):
+            return 0
+        
+        with open(marker_path, "r") as f:
+            return int(json.load(f)["epoch"])
+
+
+    def on_epoch_end(self, epoch, logs=None):
+        os.makedirs(os.path.dirname(self.marker_path), exist_ok=True)
+        
+        with open(self.marker_path + ".tmp", "w") as f:
+            json.dump({ "epoch": epoch + 1 }, f)
+        
+        os.replace(self.marker_path + ".tmp", self.marker_path)
+
+
+    def on_train_end(self, logs=None):
+        if os.path.exists(self.marker_path):
+            os.remove(self.marker_path)
+
+
+class TimeToTargetCallback(tf.keras.callbacks.Callback):
+    """
+    Measure the wall-clock time and the epochs until val_loss first reaches a target value,
+    and append the result of the run as JSON line to an A/B report file when training ends.
+    """
+    def __init__(self, target_val_loss : float, report_path : str, run_info : dict):
+        """
+        Args:
+            target_val_loss (float): _The validation loss to reach._
+            report_path (str): _The .jsonl-file the results of all runs are appended to._
+            run_info (dict): _Settings of the run to compare runs by (e.g. the sampler settings)._
+        """
+        super().__init__()
+        self.target_val_loss = target_val_loss
+        self.report_path = report_path
+        self.run_info = run_info
+        self.start_time = None
+        self.time_to_target = None
+        self.epochs_to_target = None
+        self.best_val_loss = float("inf")
+        self.epochs = 0
+
+
+    def on_train_begin(self, logs=None):
+        self.start_time = time.perf_counter()
+
+
+    def on_epoch_end(self, epoch, logs=None):
+        self.epochs += 1
+        val_loss = (logs or {}).get("val_loss")
+        
+        if val_loss is None:
+            return
+        
+        self.best_val_loss = min(self.best_val_loss, float(val_loss))
+        
+        if self.time_to_target is None and val_loss <= self.target_val_loss:
+            self.time_to_target = time.perf_counter() - self.start_time
+            self.epochs_to_target = epoch + 1
+            print(f"Reached val_loss {val_loss:.5f} <= {self.target_val_loss} after {self.epochs_to_target} epochs ({self.time_to_target:.0f} s).")
+
+
+    def on_train_end(self, logs=None):
+        result = {
+            **self.run_info,
+            "target_val_loss": self.target_val_loss,
+            "time_to_target_s": self.time_to_target,
+            "epochs_to_target": self.epochs_to_target,
+            "best_val_loss": self.best_val_loss,
+            "epochs": self.epochs,
+            "total_time_s": time.perf_counter() - self.start_time
+        }
+        
+        os.makedirs(os.path.dirname(os.path.abspath(self.report_path)), exist_ok=True)
+        
+        with open(self.report_path, "a") as f:
+            f.write(json.dumps(result) + "\n")
+        
+        print_time_to_target_report(self.report_path, self.target_val_loss)
+
+
+def print_time_to_target_report(report_path : str, target_val_loss : float):
+    """
+    Print all runs of an A/B report file with the same target validation loss.
+
+    Args:
+        report_path (str): _The .jsonl-file with one result per run._
+        target_val_loss (float): _Only runs with this target are compared._
+    """
+    with open(report_path, "r") as f:
+        runs = [ json.loads(line) for line in f if line.strip() ]
+    
+    runs = [ run for run in runs if run["target_val_loss"] == target_val_loss ]
+    
+    print(f"Time to val_loss <= {target_val_loss} ({report_path}):")
+    
+    for run in runs:
+        reached = f"{run['time_to_target_s']:8.0f} s / {run['epochs_to_target']:3d} epochs" if run["time_to_target_s"] is not None else "     not reached     "
+        print(f"  {run.get('run', '?'):<40} {reached}  (best val_loss {run['best_val_loss']:.5f})")
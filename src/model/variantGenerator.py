@@ -0,0 +1,191 @@
+import concurrent.futures
+import multiprocessing
+import numpy as np
+import time
+
+from src.model.predictionPostProcessor import convert_predictions_to_gblf_format, post_process_predictions
+from src.model.viterbiDecoder import decode_lane_states
+
+
+# Settings of a post-processing profile that are not given by the profile itself.
+DEFAULT_PROFILE = {
+    "post_processor": "greedy",
+    "prediction_threshold": 0.45,
+    "use_auto_threshold": False,
+    "max_prediction_delta": None, # None = prediction_threshold / num_lanes
+    "prediction_frequency_bias": 0.002,
+    "jack_penalty": 1.0,
+    "chord_penalty": 0.5,
+    "max_chord_size": 2,
+    "target_density": 0.0
+}
+
+# Bisection steps of the threshold search of greedy profiles with a density target.
+DENSITY_SEARCH_STEPS = 12
+
+
+def resolve_profiles(profiles : list, defaults : dict = None) -> list:
+    """
+    Complete the post-processing profiles of a multi-variant generation.
+
+    Args:
+        profiles (list): _Dicts with a "name" and any settings of DEFAULT_PROFILE._
+        defaults (dict, optional): _Settings used for keys that a profile does not set (e.g. from the command line)._ Defaults to None.
+
+    Raises:
+        ValueError: _A profile has no name, a duplicate name or an unknown setting._
+
+    Returns:
+        list: _The complete profiles._
+    """
+    resolved = []
+    names = set()
+    
+    for profile in profiles:
+        name = str(profile.get("name", "")).strip()
+        
+        if not name or name in names:
+            raise ValueError(f"Every variant profile needs a unique name, got {profile}.")
+        
+        unknown_keys = set(profile) - set(DEFAULT_PROFILE) - { "name" }
+        
+        if unknown_keys:
+            raise ValueError(f"Unknown settings in variant profile {name}: {sorted(unknown_keys)}.")
+        
+        if profile.get("post_processor", "greedy") not in [ "greedy", "viterbi" ]:
+            raise ValueError(f"Unknown post processor {profile['post_processor']} in variant profile {name}.")
+        
+        names.add(name)
+        resolved.append({ **DEFAULT_PROFILE, **(defaults or {}), **profile, "name": name })
+    
+    return resolved
+
+
+def count_notes_per_subbeat(binary_preds : list) -> float:
+    return float(np.sum(binary_preds) / max(len(binary_preds), 1))
+
+
+def apply_profile(raw_predictions : np.ndarray, profile : dict, num_lanes : int) -> list:
+    """
+    Post-process the raw predictions of a song with one profile.
+
+    Greedy profiles with a target density search the prediction threshold that gives the target
+    number of notes per subbeat; Viterbi profiles search a cost per note instead (see decode_lane_states).
+
+    Args:
+        raw_predictions (np.ndarray): _The raw model outputs with the shape (num_subbeats, num_lanes)._
+        profile (dict): _A complete profile (see resolve_profiles)._
+        num_lanes (int): _The number of lanes._
+
+    Returns:
+        list: _Binary note placements with the shape (num_subbeats, num_lanes)._
+    """
+    if profile["post_processor"] == "viterbi":
+        return decode_lane_states(
+            raw_predictions,
+            num_lanes=num_lanes,
+            prediction_threshold=profile["prediction_threshold"],
+            use_auto_threshold=profile["use_auto_threshold"],
+            jack_penalty=profile["jack_penalty"],
+            chord_penalty=profile["chord_penalty"],
+            max_chord_size=profile["max_chord_size"],
+            target_density=profile["target_density"]
+        )
+    
+    def run_greedy(threshold, use_auto_threshold):
+        max_prediction_delta = profile["max_prediction_delta"]
+        
+        # The state suppresses the summary print of every run.
+        return post_process_predictions(
+            raw_predictions,
+            num_lanes=num_lanes,
+            prediction_threshold=threshold,
+            use_auto_threshold=use_auto_threshold,
+            max_prediction_delta=max_prediction_delta if max_prediction_delta is not None else threshold / num_lanes,
+            prediction_frequency_bias=profile["prediction_frequency_bias"],
+            state={}
+        )
+    
+    if profile["target_density"] <= 0:
+        return run_greedy(profile["prediction_threshold"], profile["use_auto_threshold"])
+    
+    # -------- Density target --------
+    # Fewer notes are placed with a higher threshold.
+    low, high = 0.0, 1.0
+    best_preds, best_error = None, np.inf
+    
+    for _ in range(DENSITY_SEARCH_STEPS):
+        threshold = (low + high) / 2
+        binary_preds = run_greedy(threshold, False)
+        density = count_notes_per_subbeat(binary_preds)
+        
+        if abs(density - profile["target_density"]) < best_error:
+            best_preds, best_error = binary_preds, abs(density - profile["target_density"])
+        
+        if density > profile["target_density"]:
+            low = threshold
+        else:
+            high = threshold
+    # --------------------------------
+    
+    return best_preds
+
+
+def generate_variant(raw_predictions : np.ndarray, subbeat_timings : list, profile : dict, level_path : str, num_lanes : int) -> dict:
+    """
+    Post-process the raw predictions with one profile and write the level to level_path (.gblf).
+
+    Returns:
+        dict: _The name, path, notes per subbeat, lane frequencies and post-processing time of the level._
+    """
+    start_time = time.perf_counter()
+    
+    binary_preds = apply_profile(raw_predictions, profile, num_lanes)
+    
+    gblf_contents = convert_predictions_to_gblf_format(
+        raw_predictions=raw_predictions,
+        post_processed_predictions=binary_preds,
+        subbeat_timings=subbeat_timings
+    )
+    
+    with open(level_path, "w", encoding="utf-8") as f:
+        f.write(gblf_contents)
+    
+    return {
+        "name": profile["name"],
+        "path": level_path,
+        "notes_per_subbeat": count_notes_per_subbeat(binary_preds),
+        "lane_frequencies": np.sum(binary_preds, axis=0).tolist() if binary_preds else [ 0 ] * num_lanes,
+        "time_s": time.perf_counter() - start_time
+    }
+
+
+def generate_variants(raw_predictions : np.ndarray, subbeat_timings : list, profiles : list, output_path : str, num_lanes : int = 4, num_workers : int = 0) -> list:
+    """
+    Generate one level per post-processing profile from the raw predictions of a single inference pass.
+
+    Args:
+        raw_predictions (np.ndarray): _The raw model outputs with the shape (num_subbeats, num_lanes)._
+        subbeat_timings (list): _The subbeat timings in milliseconds._
+        profiles (list): _The complete profiles (see resolve_profiles)._
+        output_path (str): _The path of the levels without the "_<name>.gblf" suffix._
+        num_lanes (int, optional): _The number of lanes._ Defaults to 4.
+        num_workers (int, optional): _The number of processes the profiles are post-processed in.
+            0 uses one process per profile (at most the number of CPUs), 1 post-processes in this process._ Defaults to 0.
+
+    Returns:
+        list: _The result of every variant (see generate_variant), in the order of the profiles._
+    """
+    raw_predictions = np.asarray(raw_predictions)
+    num_workers = num_workers if num_workers > 0 else min(len(profiles), multiprocessing.cpu_count())
+    
+    if num_workers <= 1 or len(profiles) <= 1:
+        return [ generate_variant(raw_predictions, subbeat_timings, profile, f"{output_path}_{profile['name']}.gblf", num_lanes) for profile in profiles ]
+    
+    # Spawned workers do not inherit the TensorFlow runtime of the generator.
+    mp_context = multiprocessing.get_context("spawn")
+    
+    with concurrent.futures.ProcessPoolExecutor(max_workers=num_workers, mp_context=mp_context) as executor:
+        futures = [ executor.submit(generate_variant, raw_predictions, subbeat_timings, profile, f"{output_path}_{profile['name']}.gblf", num_lanes) for profile in profiles ]
+        
+        return [ future.result() for future in futures ]
@@ -0,0 +1,152 @@
+import numpy as np
+
+
+# Range of the per-note cost (in log-odds) that is searched to reach a target note density.
+NOTE_COST_RANGE = (-15.0, 15.0)
+NOTE_COST_CANDIDATES = 16
+NOTE_COST_SEARCH_PASSES = 3
+
+
+def get_lane_states(num_lanes : int) -> np.ndarray:
+    """
+    Enumerate all combinations of pressed lanes of one subbeat.
+
+    Args:
+        num_lanes (int): _The number of lanes._
+
+    Returns:
+        np.ndarray: _Binary lane states with the shape (2^num_lanes, num_lanes), state i has the lanes of the bits of i._
+    """
+    return ((np.arange(2 ** num_lanes)[:, np.newaxis] >> np.arange(num_lanes)) & 1).astype(np.int64)
+
+
+def get_emission_scores(raw_predictions : np.ndarray, states : np.ndarray, threshold : float, chord_penalty : float, max_chord_size : int) -> np.ndarray:
+    """
+    Score every lane state of every subbeat by the raw sigmoid outputs.
+
+    The score of a state is the sum of the log-odds of its pressed lanes relative to the threshold,
+    so without transition costs every lane is pressed exactly if its prediction exceeds the threshold.
+
+    Args:
+        raw_predictions (np.ndarray): _The raw model outputs with the shape (num_subbeats, num_lanes)._
+        states (np.ndarray): _The lane states (see get_lane_states)._
+        threshold (float): _The prediction value at which pressing a lane is neutral._
+        chord_penalty (float): _The cost of every note of a chord after the first one._
+        max_chord_size (int): _States with more notes are never used._
+
+    Returns:
+        np.ndarray: _The scores with the shape (num_subbeats, num_states)._
+    """
+    epsilon = 1e-6
+    predictions = np.clip(raw_predictions.astype(np.float64), epsilon, 1.0 - epsilon)
+    threshold = min(max(float(threshold), epsilon), 1.0 - epsilon)
+    
+    log_odds = np.log(predictions) - np.log1p(-predictions) - (np.log(threshold) - np.log1p(-threshold))
+    
+    notes_per_state = states.sum(axis=1)
+    scores = log_odds @ states.T - chord_penalty * np.maximum(notes_per_state - 1, 0)
+    scores[:, notes_per_state > max_chord_size] = -np.inf
+    
+    return scores
+
+
+def get_transition_scores(states : np.ndarray, jack_penalty : float) -> np.ndarray:
+    """
+    Score every transition between the lane states of two consecutive subbeats.
+
+    Args:
+        states (np.ndarray): _The lane states (see get_lane_states)._
+        jack_penalty (float): _The cost of every lane that is pressed in both subbeats (jack)._
+
+    Returns:
+        np.ndarray: _The scores with the shape (num_states, num_states), from state (rows) to state (columns)._
+    """
+    return -jack_penalty * (states @ states.T).astype(np.float64)
+
+
+def run_viterbi(emission_scores : np.ndarray, transition_scores : np.ndarray) -> np.ndarray:
+    """
+    Find the highest scoring sequence of states for several sets of emission scores at once.
+
+    Args:
+        emission_scores (np.ndarray): _Scores with the shape (num_candidates, num_subbeats, num_states)._
+        transition_scores (np.ndarray): _Scores with the shape (num_states, num_states)._
+
+    Returns:
+        np.ndarray: _The best state of every subbeat with the shape (num_candidates, num_subbeats)._
+    """
+    num_candidates, num_subbeats, num_states = emission_scores.shape
+    
+    backpointers = np.zeros((num_subbeats, num_candidates, num_states), dtype=np.uint8 if num_states <= 256 else np.int64)
+    # Time-major, so the scores of one subbeat are contiguous.
+    emission_scores = np.ascontiguousarray(emission_scores.transpose(1, 0, 2))
+    scores = emission_scores[0]
+    candidate_scores = np.empty((num_candidates, num_states, num_states))
+    
+    # Only the loop over time is sequential, all candidates and states are updated together.
+    for t in range(1, num_subbeats):
+        np.add(scores[:, :, np.newaxis], transition_scores, out=candidate_scores)
+        backpointers[t] = candidate_scores.argmax(axis=1)
+        scores = candidate_scores.max(axis=1) + emission_scores[t]
+    
+    path = np.zeros((num_candidates, num_subbeats), dtype=np.int64)
+    path[:, -1] = scores.argmax(axis=1)
+    candidate_idxs = np.arange(num_candidates)
+    
+    for t in range(num_subbeats - 1, 0, -1):
+        path[:, t - 1] = backpointers[t, candidate_idxs, path[:, t]]
+    
+    return path
+
+
+def decode_lane_states(raw_predictions, num_lanes : int, prediction_threshold : float, use_auto_threshold : bool = False, jack_penalty : float = 1.0, chord_penalty : float = 0.5, max_chord_size : int = 2, target_density : float = 0.0) -> list:
+    """
+    Convert raw per-subbeat lane predictions into binary note placements with a Viterbi decoder
+    over all lane states, which can enforce playability constraints across subbeats.
+
+    Args:
+        raw_predictions (np.ndarray): _The raw model outputs with the shape (num_subbeats, num_lanes)._
+        num_lanes (int): _The number of lanes._
+        prediction_threshold (float): _The prediction value at which placing a note is neutral._
+        use_auto_threshold (bool, optional): _If true, the 80th percentile of all predictions is used as threshold instead._ Defaults to False.
+        jack_penalty (float, optional): _The cost (in log-odds) of a note in the same lane as in the previous subbeat._ Defaults to 1.0.
+        chord_penalty (float, optional): _The cost (in log-odds) of every note of a chord after the first one._ Defaults to 0.5.
+        max_chord_size (int, optional): _The maximum number of notes per subbeat._ Defaults to 2.
+        target_density (float, optional): _If greater than 0, a cost per note is searched so that the decoded
+            level has about this many notes per subbeat._ Defaults to 0.0.
+
+    Returns:
+        list: _Binary note placements with the shape (num_subbeats, num_lanes)._
+    """
+    raw_predictions = np.asarray(raw_predictions).reshape(-1, num_lanes)
+    
+    if len(raw_predictions) == 0:
+        return []
+    
+    states = get_lane_states(num_lanes)
+    notes_per_state = states.sum(axis=1)
+    
+    threshold = np.percentile(raw_predictions, 80) if use_auto_threshold else prediction_threshold
+    emission_scores = get_emission_scores(raw_predictions, states, threshold, chord_penalty, max_chord_size)
+    transition_scores = get_transition_scores(states, jack_penalty)
+    
+    if target_density <= 0:
+        path = run_viterbi(emission_scores[np.newaxis], transition_scores)[0]
+        return states[path].tolist()
+    
+    # -------- Density target --------
+    # The number of notes decreases with the cost per note. All candidate costs are decoded together,
+    # then the search is repeated between the two candidates around the best one.
+    low, high = NOTE_COST_RANGE
+    
+    for _ in range(NOTE_COST_SEARCH_PASSES):
+        note_costs = np.linspace(low, high, NOTE_COST_CANDIDATES)
+        paths = run_viterbi(emission_scores[np.newaxis] - note_costs[:, np.newaxis, np.newaxis] * notes_per_state, transition_scores)
+        densities = notes_per_state[paths].mean(axis=1)
+        
+        best = int(np.argmin(np.abs(densities - target_density)))
+        low = note_costs[max(best - 1, 0)]
+        high = note_costs[min(best + 1, NOTE_COST_CANDIDATES - 1)]
+    # --------------------------------
+    
+    return states[paths[best]].tolist()
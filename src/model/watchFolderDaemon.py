@@ -0,0 +1,456 @@
+import argparse
+import collections
+import concurrent.futures
+import ctypes
+import ctypes.util
+import datetime
+import json
+import os
+import queue
+import select
+import shutil
+import sys
+import time
+
+from src.export.beatmapExporter import export_to_osz, export_to_qua
+from src.model.generationCache import FEATURE_CACHE_DIR
+from src.model.generationServer import GenerationService, get_export_metadata
+from src.model.inferenceBackend import MODEL_FORMATS
+
+
+# The exporters only accept lowercase extensions, so files like "Song.MP3" are not generated.
+AUDIO_EXTENSIONS = [ ".mp3", ".wav", ".ogg" ]
+
+EXPORT_FORMATS = [ "osz", "qua" ]
+
+# inotify event masks (see <sys/inotify.h>).
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_NONBLOCK = 0x00000800
+IN_CLOEXEC = 0x00080000
+
+
+class InotifyWatcher:
+    """
+    Wake up when files in a directory are written or moved into it, using inotify through ctypes (Linux only).
+    The events are only used as a wake-up signal, the directory is scanned afterwards.
+    """
+    def __init__(self, watch_dir : str):
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        
+        if not hasattr(libc, "inotify_init1"):
+            raise OSError("inotify is not available.")
+        
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed.")
+        
+        if libc.inotify_add_watch(self.fd, os.fsencode(watch_dir), IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, f"inotify_add_watch failed for {watch_dir}.")
+
+
+    def wait(self, timeout : float) -> bool:
+        # Returns true if anything changed in the directory within the timeout.
+        readable, _, _ = select.select([ self.fd ], [], [], timeout)
+        
+        if not readable:
+            return False
+        
+        try:
+            while os.read(self.fd, 65536):
+                pass
+        except BlockingIOError:
+            pass
+        
+        return True
+
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingWatcher:
+    """
+    Fallback for systems without inotify: the directory is scanned every poll_interval seconds.
+    """
+    def __init__(self, poll_interval : float):
+        self.poll_interval = poll_interval
+        self.next_poll = 0.0
+
+
+    def wait(self, timeout : float) -> bool:
+        remaining = self.next_poll - time.monotonic()
+        
+        if remaining > timeout:
+            time.sleep(timeout)
+            return False
+        
+        time.sleep(max(remaining, 0))
+        self.next_poll = time.monotonic() + self.poll_interval
+        
+        return True
+
+
+    def close(self):
+        pass
+
+
+def get_timestamp() -> str:
+    return datetime.datetime.now().isoformat(timespec="seconds")
+
+
+def get_fingerprint(audio_path : str, sidecar_path : str) -> list:
+    # A file is generated again if the audio or its sidecar changes.
+    audio_stat = os.stat(audio_path)
+    sidecar_stat = os.stat(sidecar_path)
+    
+    return [ audio_stat.st_size, audio_stat.st_mtime_ns, sidecar_stat.st_size, sidecar_stat.st_mtime_ns ]
+
+
+def load_status(status_path : str) -> dict:
+    """
+    Load the file records of a previous run. Files that were queued or processing when the daemon
+    stopped are forgotten, so they are queued again; finished and failed files are kept.
+
+    Args:
+        status_path (str): _The path of the status file._
+
+    Returns:
+        dict: _The record of every file by file name._
+    """
+    if not os.path.exists(status_path):
+        return {}
+    
+    with open(status_path, "r", encoding="utf-8") as f:
+        files = json.load(f).get("files", {})
+    
+    return { name: record for name, record in files.items() if record.get("status") in [ "done", "failed" ] }
+
+
+def write_status(status_path : str, status : dict):
+    # Write to a temporary file first, so readers never see a half-written status.
+    with open(status_path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(status, f, indent=4)
+    
+    os.replace(status_path + ".tmp", status_path)
+
+
+def process_file(service : GenerationService, audio_path : str, sidecar_path : str, args) -> dict:
+    """
+    Generate the level of a dropped audio file and export it.
+
+    The sidecar (.json-file with the same name as the audio file) needs the audio_bpm (a number or "auto") and can set the
+    audio_start_ms (a number or "auto"), note_precision, post_processing, exports (list of "osz" / "qua") and the export
+    metadata (title, artist, difficulty_name, audio_time_signature).
+
+    Raises:
+        ValueError: _The sidecar is invalid._
+
+    Returns:
+        dict: _The paths of the level and the exports and the time of every generation stage._
+    """
+    with open(sidecar_path, "r", encoding="utf-8") as f:
+        sidecar = json.load(f)
+    
+    if not isinstance(sidecar, dict):
+        raise ValueError(f"{sidecar_path} has to contain a JSON object.")
+    
+    name = os.path.splitext(os.path.basename(audio_path))[0]
+    exports = sidecar.get("exports", args.export_formats)
+    unknown_exports = set(exports) - set(EXPORT_FORMATS)
+    
+    if unknown_exports:
+        raise ValueError(f"Unknown exports {sorted(unknown_exports)} in {sidecar_path}. Supported exports: {EXPORT_FORMATS}")
+    
+    request = {
+        "audio_path": audio_path,
+        "audio_bpm": sidecar.get("audio_bpm"),
+        "audio_start_ms": sidecar.get("audio_start_ms", 0),
+        "note_precision": sidecar.get("note_precision", args.note_precision),
+        "name": name,
+        "post_processing": sidecar.get("post_processing"),
+        "output": "gblf"
+    }
+    
+    body, _, _, stage_times, tempo = service.generate(request)
+    
+    level_path = os.path.join(args.output_dir, "levels", f"{name}.gblf")
+    
+    with open(level_path, "wb") as f:
+        f.write(body)
+    
+    song = { "name": name, "audio_bpm": tempo["audio_bpm"], "audio_start_ms": tempo["audio_start_ms"] }
+    metadata = get_export_metadata(song, { key: sidecar[key] for key in [ "title", "artist", "difficulty_name", "audio_time_signature" ] if key in sidecar })
+    export_dir = os.path.join(args.output_dir, "exports")
+    export_paths = []
+    
+    # A changed audio or sidecar is generated again, the exporters do not overwrite the files of the previous export.
+    if "osz" in exports:
+        osz_path = os.path.join(export_dir, f"{name}.osz")
+        
+        if os.path.exists(osz_path):
+            os.remove(osz_path)
+        
+        export_to_osz(audio_path, level_path, export_dir, metadata)
+        export_paths.append(osz_path)
+    
+    if "qua" in exports:
+        qua_dir = os.path.join(export_dir, f"{metadata['artist']} - {metadata['title']} (Quaver-map-gen-AI) [{metadata['difficulty_name']}]")
+        
+        if os.path.isdir(qua_dir):
+            shutil.rmtree(qua_dir)
+        
+        export_to_qua(audio_path, level_path, export_dir, metadata)
+        export_paths.append(qua_dir)
+    
+    return {
+        "level_path": level_path,
+        "exports": export_paths,
+        "tempo": tempo,
+        "stage_times_s": stage_times
+    }
+
+
+class WatchFolderDaemon:
+    """
+    Watch a directory for audio files with a sidecar and generate them on a bounded worker pool.
+
+    Every file goes through the states queued -> processing -> done / failed. At most max_queue files
+    are queued; further files are deferred (left in the directory) until the queue has room again.
+    All records, the queue and the generation metrics are written to the status file after every change.
+    """
+    def __init__(self, args, service : GenerationService, watcher):
+        self.args = args
+        self.service = service
+        self.watcher = watcher
+        self.files = load_status(args.status_path)
+        self.pending = collections.deque()
+        self.deferred = set()
+        self.unsettled = 0
+        self.ignored = set()
+        self.in_flight = {}
+        self.completions = queue.Queue()
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=args.max_workers)
+        self.next_scan = 0.0
+
+
+    def scan(self) -> bool:
+        # Files are only queued once they have not been written for settle_seconds (copies may still be in progress).
+        # Returns true if a file was queued or the deferred files or the number of settling files changed.
+        now = time.time()
+        previous_deferred = self.deferred
+        num_unsettled = self.unsettled
+        num_pending = len(self.pending)
+        self.deferred = set()
+        self.unsettled = 0
+        
+        for file_name in sorted(os.listdir(self.args.watch_dir)):
+            stem, extension = os.path.splitext(file_name)
+            audio_path = os.path.join(self.args.watch_dir, file_name)
+            sidecar_path = os.path.join(self.args.watch_dir, f"{stem}.json")
+            
+            if extension not in AUDIO_EXTENSIONS or not os.path.isfile(sidecar_path):
+                if extension != extension.lower() and extension.lower() in AUDIO_EXTENSIONS and file_name not in self.ignored:
+                    print(f"Ignoring {file_name}: audio extensions must be lowercase ({', '.join(AUDIO_EXTENSIONS)}).")
+                    self.ignored.add(file_name)
+                
+                continue
+            
+            try:
+                fingerprint = get_fingerprint(audio_path, sidecar_path)
+            except FileNotFoundError:
+                continue
+            
+            record = self.files.get(file_name)
+            
+            if record is not None and (record["status"] in [ "queued", "processing" ] or record["fingerprint"] == fingerprint):
+                continue
+            
+            if now - max(os.path.getmtime(audio_path), os.path.getmtime(sidecar_path)) < self.args.settle_seconds:
+                self.next_scan = min(self.next_scan, time.monotonic() + self.args.settle_seconds)
+                self.unsettled += 1
+                continue
+            
+            if len(self.pending) >= self.args.max_queue:
+                self.deferred.add(file_name)
+                continue
+            
+            self.files[file_name] = { "status": "queued", "fingerprint": fingerprint, "queued_at": get_timestamp() }
+            self.pending.append(file_name)
+        
+        if self.deferred and len(self.deferred) != len(previous_deferred):
+            print(f"Queue is full ({self.args.max_queue} files), {len(self.deferred)} files are deferred.")
+        
+        return len(self.pending) != num_pending or self.deferred != previous_deferred or self.unsettled != num_unsettled
+
+
+    def dispatch(self) -> bool:
+        # Returns true if a file was started.
+        dispatched = False
+        
+        while self.pending and len(self.in_flight) < self.args.max_workers:
+            file_name = self.pending.popleft()
+            stem = os.path.splitext(file_name)[0]
+            audio_path = os.path.join(self.args.watch_dir, file_name)
+            sidecar_path = os.path.join(self.args.watch_dir, f"{stem}.json")
+            
+            self.files[file_name].update(status="processing", started_at=get_timestamp())
+            print(f"Generating {file_name}.")
+            
+            future = self.executor.submit(process_file, self.service, audio_path, sidecar_path, self.args)
+            future.add_done_callback(lambda future, file_name=file_name: self.completions.put((file_name, future)))
+            self.in_flight[file_name] = future
+            dispatched = True
+        
+        return dispatched
+
+
+    def collect(self) -> bool:
+        # Handle the finished files (the records are only changed in the main thread).
+        changed = False
+        
+        while True:
+            try:
+                file_name, future = self.completions.get_nowait()
+            except queue.Empty:
+                return changed
+            
+            del self.in_flight[file_name]
+            record = self.files[file_name]
+            record["finished_at"] = get_timestamp()
+            changed = True
+            
+            try:
+                record.update(status="done", **future.result())
+                print(f"{file_name}: done in {record['stage_times_s']['total']:.2f} s -> {record['level_path']}")
+            except Exception as e:
+                record.update(status="failed", error=f"{type(e).__name__}: {e}")
+                print(f"{file_name}: failed ({record['error']}).")
+            
+            # Files that were deferred get their chance as soon as the queue has room again.
+            if self.deferred:
+                self.next_scan = 0.0
+
+
+    def write_status(self):
+        counts = collections.Counter(record["status"] for record in self.files.values())
+        
+        write_status(self.args.status_path, {
+            "updated_at": get_timestamp(),
+            "watch_dir": os.path.abspath(self.args.watch_dir),
+            "watcher": type(self.watcher).__name__,
+            "queue": {
+                "queued": len(self.pending),
+                "processing": len(self.in_flight),
+                "deferred": len(self.deferred),
+                "settling": self.unsettled,
+                "max_queue": self.args.max_queue,
+                "max_workers": self.args.max_workers,
+                "done": counts["done"],
+                "failed": counts["failed"]
+            },
+            "generation": self.service.get_metrics(),
+            "files": self.files
+        })
+
+
+    def run(self):
+        self.write_status()
+        
+        while True:
+            scanned = False
+            
+            if self.watcher.wait(0.5) or time.monotonic() >= self.next_scan:
+                self.next_scan = time.monotonic() + self.args.rescan_seconds
+                scanned = self.scan()
+            
+            completed = self.collect()
+            dispatched = self.dispatch()
+            
+            # The status file is rewritten after every scan, completion or dispatch that changed the queue or a record.
+            if scanned or completed or dispatched:
+                self.write_status()
+            
+            if self.args.exit_when_idle and not (self.pending or self.in_flight or self.deferred or self.unsettled):
+                return
+
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        self.collect()
+        self.write_status()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate and export the levels of all audio files dropped into a directory.")
+    parser.add_argument("--watch_dir", type=str, required=True)
+    parser.add_argument("--output_dir", type=str, default=os.path.join(os.getcwd(), "generation"))
+    parser.add_argument("--status_path", type=str, default="")
+    parser.add_argument("--model_path", type=str, default=os.path.join(os.getcwd(), "models", "model-3-4_stars-P4-S128-V3.keras"))
+    parser.add_argument("--model_format", type=str, default="keras", choices=MODEL_FORMATS)
+    parser.add_argument("--note_precision", type=int, default=2)
+    parser.add_argument("--export_formats", type=str, default="osz")
+    parser.add_argument("--max_workers", type=int, default=2)
+    parser.add_argument("--max_queue", type=int, default=64)
+    parser.add_argument("--feature_workers", type=int, default=os.cpu_count())
+    parser.add_argument("--max_wait_ms", type=float, default=20)
+    parser.add_argument("--inference_batch_size", type=int, default=256)
+    parser.add_argument("--feature_cache_dir", type=str, default=FEATURE_CACHE_DIR)
+    parser.add_argument("--feature_cache_size_mb", type=float, default=1024)
+    parser.add_argument("--settle_seconds", type=float, default=2.0)
+    parser.add_argument("--rescan_seconds", type=float, default=60.0)
+    parser.add_argument("--poll", action="store_true")
+    parser.add_argument("--poll_interval", type=float, default=5.0)
+    parser.add_argument("--exit_when_idle", action="store_true")
+    args = parser.parse_args()
+    
+    args.export_formats = [ export_format.strip() for export_format in args.export_formats.split(",") if export_format.strip() ]
+    
+    if set(args.export_formats) - set(EXPORT_FORMATS):
+        parser.error(f"--export_formats supports {EXPORT_FORMATS}.")
+    
+    args.status_path = args.status_path or os.path.join(args.output_dir, "watch_status.json")
+    
+    # Settings of the generation service (see generationServer).
+    args.max_models = 1
+    args.max_batch_songs = args.max_workers
+    
+    os.makedirs(os.path.join(args.output_dir, "levels"), exist_ok=True)
+    os.makedirs(os.path.join(args.output_dir, "exports"), exist_ok=True)
+    
+    watcher = None
+    
+    if not args.poll and sys.platform.startswith("linux"):
+        try:
+            watcher = InotifyWatcher(args.watch_dir)
+        except OSError as e:
+            print(f"inotify is not available ({e}), polling every {args.poll_interval} s instead.")
+    
+    if watcher is None:
+        watcher = PollingWatcher(args.poll_interval)
+    
+    service = GenerationService(args)
+    
+    # The model is loaded before the first file arrives.
+    service.model_cache.get(args.model_path, args.model_format)
+    
+    daemon = WatchFolderDaemon(args, service, watcher)
+    print(f"Watching {args.watch_dir} ({type(watcher).__name__}), status in {args.status_path}.")
+    
+    try:
+        daemon.run()
+    except KeyboardInterrupt:
+        print("Stopping, waiting for the files in progress.")
+    finally:
+        daemon.close()
+        service.close()
+        watcher.close()
+
+
+if __name__ == "__main__":
+    main()